@@ -1,9 +1,35 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS, cross_origin  # Add cross_origin import
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import wraps
+import io
 import json
-import sqlite3
-import re
+import os
+import time
+
+from admission import AdmissionController, parse_limit, parse_route_limits, queue_wait_seconds
+from analytics import (merge_population, population, rebuild_user, record_symptoms,
+                       user_report)
+from bulk import FORMATS, RecordError, detect_format, import_records, iter_export, read_records
+from dates import from_day, from_stamp, to_day, to_stamp
+from encoding import chat_body, compress, compressible, dumps, json_response, negotiate
+from entities import DEFAULT_SEVERITY, SymptomExtractor
+from history_writer import HistoryWriter, INSERT_SQL as HISTORY_INSERT_SQL
+from idempotency import IdempotencyConflict, IdempotencyStore, fingerprint, key_hash
+from intents import INTENT_PATTERNS, IntentClassifier
+from metrics import metrics
+from migrations import latest_version, migrate
+from pagination import (HISTORY_COLUMNS, SYMPTOM_COLUMNS, PageError, fetch_page, iter_rows,
+                        ndjson_response, parse_page_args, wants_stream)
+from predictions import user_estimate
+from reminders import (REMINDER_KINDS, ReminderScheduler, add_reminder,
+                       list_reminders, refresh_schedule)
+from responses import LATEST, render, reply
+from sessions import SessionStore
+from startup import per_process
+from storage import db
+from user_cache import USER_SQL, UserCache
+from versions import BodyCache, bump_versions, data_version
 
 app = Flask(__name__)
 
@@ -14,6 +40,65 @@ CORS(app, resources={r"/*": {"origins": "*"}})  # Allow ALL origins
 # CORS(app, origins=["http://localhost:3000", "http://127.0.0.1:5000", 
 #                    "http://10.0.2.2:5000", "http://192.168.*.*"]) 
 
+# Admission control: per-client token buckets per route, an optional global
+# bucket, and load shedding on in-flight count or proxy queue wait
+ADMISSION_EXEMPT = {'/', '/stats', '/metrics'}
+admission = None
+if os.environ.get('ADMISSION_CONTROL', 'True').lower() == 'true':
+    admission = AdmissionController(
+        route_limits=parse_route_limits(os.environ.get(
+            'RATE_LIMITS', '/chat=5:20,/chat/batch=1:5,/import=0.2:2')),
+        default_limit=parse_limit(os.environ.get('RATE_LIMIT_DEFAULT', '20:50')),
+        global_limit=parse_limit(os.environ.get('RATE_LIMIT_GLOBAL', '0')),
+        max_in_flight=int(os.environ.get('MAX_IN_FLIGHT', 0)),
+        max_queue_wait=float(os.environ.get('MAX_QUEUE_WAIT_MS', 2000)) / 1000,
+        max_keys=int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 100000)),
+    )
+
+def client_key():
+    """Rate limit key: the user_id in the URL or JSON body, else the client address"""
+    if request.view_args and 'user_id' in request.view_args:
+        return request.view_args['user_id']
+    if request.is_json and (request.content_length or 0) <= 65536:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and data.get('user_id') is not None:
+            return str(data['user_id'])
+    forwarded = request.headers.get('X-Forwarded-For')
+    return forwarded.split(',')[0].strip() if forwarded else request.remote_addr
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.before_request
+def admit_request():
+    """Reject over-budget clients with 429 and shed load with 503, before any work"""
+    if admission is None or request.url_rule is None:
+        return None
+    route = request.url_rule.rule
+    if route in ADMISSION_EXEMPT or request.method == 'OPTIONS':
+        return None
+    rejection = admission.admit(route, client_key(),
+                                queue_wait_seconds(request.headers.get('X-Request-Start')))
+    if rejection is None:
+        g.admitted = True
+        return None
+    status, reason, retry_after = rejection
+    response = jsonify({
+        "status": "error",
+        "error": "Rate limit exceeded" if status == 429 else "Server busy, try again shortly",
+        "reason": reason,
+        "retry_after": retry_after
+    })
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.teardown_request
+def release_request(exc):
+    if g.pop('admitted', False):
+        admission.release()
+
 # Optional: Add after_request handler for extra CORS headers
 @app.after_request
 def after_request(response):
@@ -21,375 +106,707 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     response.headers.add('Access-Control-Allow-Credentials', 'true')
+    if 'request_start' in g:
+        # Label by route template, not path, to keep the series count bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('http_request_duration_seconds',
+                        (request.method, route, str(response.status_code)),
+                        time.perf_counter() - g.request_start)
+    return response
+
+# gzip/deflate for bodies of at least COMPRESS_MIN_SIZE bytes, if the client accepts it
+COMPRESSION = os.environ.get('COMPRESSION', 'True').lower() == 'true'
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+
+# Registered after after_request so it runs first and is included in the latency
+@app.after_request
+def compress_response(response):
+    """Compress large JSON/text bodies per Accept-Encoding (not streamed responses)"""
+    if (not COMPRESSION or response.is_streamed or response.direct_passthrough
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or not compressible(response.mimetype)):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = negotiate(request.accept_encodings)
+    if coding:
+        compressed = compress(body, coding, COMPRESS_LEVEL)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = coding
+        metrics.inc('compressed_responses_total', (coding,))
+        metrics.inc('compression_saved_bytes_total', amount=len(body) - len(compressed))
     return response
 
 # Initialize database
 def init_db():
-    conn = sqlite3.connect('period_tracker.db')
-    c = conn.cursor()
-    
-    # Create users table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            last_period_date TEXT,
-            cycle_length INTEGER DEFAULT 28,
-            period_duration INTEGER DEFAULT 5,
-            created_at TEXT
-        )
-    ''')
-    
-    # Create chat history table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            user_message TEXT,
-            bot_response TEXT,
-            timestamp TEXT
-        )
-    ''')
-    
-    # Create symptoms log table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS symptoms (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            symptom TEXT,
-            severity TEXT,
-            date TEXT,
-            notes TEXT
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Bring the schema up to date (see migrations.py); only a version read if it is"""
+    migrate(db)
 
 init_db()
 
+# User profile cache; set USER_CACHE_SIZE=0 when running several worker processes
+user_cache = UserCache(
+    max_size=int(os.environ.get('USER_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('USER_CACHE_TTL', 300)),
+)
+
+# Last turn per user for follow-up replies (per process, see sessions.py)
+sessions = SessionStore(
+    max_size=int(os.environ.get('SESSION_STORE_SIZE', 100000)),
+    ttl=float(os.environ.get('SESSION_TTL', 600)),
+)
+
+def load_user(conn, user_id, fresh=False):
+    """Fetch a users row, served from the profile cache when possible
+    
+    fresh reads from conn's snapshot instead, for bodies cached under a data version.
+    That snapshot may predate a write already in the cache, so it doesn't fill it.
+    """
+    if fresh:
+        return conn.execute(USER_SQL, (user_id,)).fetchone()
+    hit, row = user_cache.get(user_id)
+    if hit:
+        return row
+    token = user_cache.fill_token()
+    row = conn.execute(USER_SQL, (user_id,)).fetchone()
+    user_cache.fill(user_id, row, token)
+    return row
+
+def store_user(user_id, row):
+    """Write a users row through to the profile cache once the transaction commits"""
+    db.for_user(user_id).after_commit(lambda: user_cache.set(user_id, row))
+
+# Offered actions, as shared tuples so stored sessions don't copy them
+PERIOD_ACTIONS = ("Log symptoms", "Set reminder", "Calculate ovulation")
+SYMPTOM_ACTIONS = ("Cramps", "Headache", "Bloating", "Mood swings", "Fatigue")
+REMINDER_ACTIONS = ("Period start", "Ovulation", "Medication", "Symptoms")
+
+# What an offered action means when sent back: (intent, reminder kind)
+ACTION_INTENTS = {
+    'log symptoms': ('symptoms', None),
+    'set reminder': ('set_reminder', None),
+    'calculate ovulation': ('ovulation', None),
+    **{action.lower(): ('symptoms', None) for action in SYMPTOM_ACTIONS},
+    'period start': ('add_reminder', 'period_start'),
+    'ovulation': ('add_reminder', 'ovulation'),
+    'medication': ('add_reminder', 'medication'),
+    'symptoms': ('add_reminder', 'symptoms'),
+}
+
+# What "yes" means for each pending question
+YES_ANSWERS = {
+    'log_symptoms': ('symptoms', None),
+    'medication_reminder': ('add_reminder', 'medication'),
+}
+YES = {'yes', 'y', 'yeah', 'yep', 'sure', 'ok', 'okay', 'please', 'yes please'}
+NO = {'no', 'n', 'nope', 'nah', 'no thanks', 'not now'}
+
+# Longer messages are always classified on their own
+FOLLOW_UP_MAX_LENGTH = 40
+
+# Intents that write rows besides chat history (symptoms only when some are detected).
+# With write-behind history every other turn runs in a read snapshot, which is
+# rolled back, so a new writing branch must be listed here.
+WRITE_INTENTS = frozenset(('period_start', 'add_reminder'))
+
 class PeriodTrackerChatbot:
-    def __init__(self):
-        self.intent_patterns = {
-            'greeting': [
-                r'hello', r'hi', r'hey', r'good morning', r'good afternoon'
-            ],
-            'period_start': [
-                r'period (started|began)', r'start(ed|ing) (my )?period',
-                r'got my period', r'my period (started|began)',
-                r'menstruation (started|began)', r'period date today',
-                r'log period (today|now)'
-            ],
-            'period_end': [
-                r'period (ended|finished|stopped)', r'end(ed|ing) (my )?period'
-            ],
-            'next_period': [
-                r'when (is|will be) my next period', r'next period date',
-                r'predict my period', r'when (should|will) i get my period',
-                r'period prediction'
-            ],
-            'symptoms': [
-                r'(cramps|headache|bloating|pain|tired|fatigue|nausea)',
-                r'i have (.*) pain', r'feeling (.*)',
-                r'symptom(s)?', r'i feel (.*)',
-                r'logging symptoms', r'log symptom'
-            ],
-            'cycle_info': [
-                r'my cycle length', r'average cycle', r'cycle days',
-                r'how long is my cycle'
-            ],
-            'pms': [
-                r'what is pms', r'premenstrual syndrome',
-                r'pms symptoms', r'before period symptoms'
-            ],
-            'pain_relief': [
-                r'how to (relieve|reduce|stop) (pain|cramps)',
-                r'pain relief', r'cramp relief',
-                r'what helps with (cramps|pain)'
-            ],
-            'ovulation': [
-                r'when do i ovulate', r'ovulation (date|time)',
-                r'fertile window', r'ovulation calculator'
-            ],
-            'set_reminder': [
-                r'set reminder', r'remind me', r'notification',
-                r'alert me before period'
-            ]
-        }
+    def __init__(self, history_writer=None, sessions=None):
+        self.history_writer = history_writer
+        self.sessions = sessions
+        self.intent_patterns = INTENT_PATTERNS
+        # Compiled once at startup; use register_intent to add intents
+        self.classifier = IntentClassifier(self.intent_patterns)
+        # Reply template of each intent added with register_intent
+        self.intent_templates = {}
+        # Symptom/severity/date vocabulary, also compiled once
+        self.extractor = SymptomExtractor()
+    
+    def register_intent(self, intent, patterns, template=None):
+        """Register a new intent (lowest priority) or extend an existing one
+        
+        template names the reply (see responses.register_template) for an intent
+        process_message has no branch for; without one it gets the unknown reply.
+        """
+        if template is not None and template not in LATEST:
+            raise ValueError(f"Unknown template '{template}'")
+        self.classifier.register(intent, patterns)
+        if template is not None:
+            self.intent_templates[intent] = template
     
     def detect_intent(self, message):
         """Detect user intent from message"""
-        message_lower = message.lower()
-        
-        for intent, patterns in self.intent_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, message_lower):
-                    return intent
-        
-        return 'unknown'
+        return self.classifier.classify(message)
+    
+    def resolve_follow_up(self, message, intent, session):
+        """Read a short reply in the context of the last turn; returns (intent, reminder kind)"""
+        text = ' '.join(message.lower().split()).strip('.!? ')
+        if len(text) > FOLLOW_UP_MAX_LENGTH:
+            return intent, None
+        if text in ACTION_INTENTS and any(a.lower() == text for a in session.actions):
+            return ACTION_INTENTS[text]
+        if session.pending:
+            if text in NO:
+                return 'declined', None
+            if text in YES and session.pending in YES_ANSWERS:
+                return YES_ANSWERS[session.pending]
+            if session.pending == 'which_symptoms' and intent == 'unknown':
+                # e.g. "feeling moody": let the extractor find the symptom
+                return 'symptoms', None
+        return intent, None
     
-    def calculate_next_period(self, last_period_date, cycle_length=28):
-        """Calculate next period date"""
+    def calculate_next_period(self, last_period_day, cycle_length=28):
+        """Calculate next period date (as a day ordinal, see dates.py)"""
         try:
-            last_date = datetime.strptime(last_period_date, '%Y-%m-%d')
-            next_date = last_date + timedelta(days=cycle_length)
-            return next_date.strftime('%Y-%m-%d')
-        except:
+            return last_period_day + cycle_length
+        except TypeError:
             return None
     
-    def calculate_ovulation(self, last_period_date, cycle_length=28):
-        """Calculate ovulation date (typically 14 days before next period)"""
+    def calculate_ovulation(self, last_period_day, cycle_length=28):
+        """Calculate ovulation day ordinal (typically 14 days before next period)"""
         try:
-            last_date = datetime.strptime(last_period_date, '%Y-%m-%d')
-            ovulation_date = last_date + timedelta(days=cycle_length - 14)
-            return ovulation_date.strftime('%Y-%m-%d')
-        except:
+            return last_period_day + cycle_length - 14
+        except TypeError:
             return None
     
-    def process_message(self, message, user_id):
-        """Process user message and generate response"""
-        intent = self.detect_intent(message)
-        today = datetime.now().strftime('%Y-%m-%d')
+    def process_message(self, message, user_id, now=None, users=None):
+        """Process user message and generate response
         
-        # Connect to database
-        conn = sqlite3.connect('period_tracker.db')
-        c = conn.cursor()
+        now overrides the message time (e.g. the client timestamp of a message
+        queued offline) and users is a user_id -> row cache shared by a batch.
+        """
+        start = time.perf_counter()
+        intent = self.detect_intent(message)
+        reminder_kind = None
+        session = self.sessions.get(user_id) if self.sessions else None
+        if session is not None:
+            intent, reminder_kind = self.resolve_follow_up(message, intent, session)
+        now = now or datetime.now()
+        today = now.strftime('%Y-%m-%d')
+        day = now.toordinal()
+        # Extract symptoms with their severity and date in one pass
+        detected = self.extractor.extract(message, now.date()) if intent == 'symptoms' else ()
         
-        # Get user data
-        c.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        user_data = c.fetchone()
+        # Turns that write nothing don't need the shard's write lock
+        database = db.for_user(user_id)
+        if self.history_writer is None or intent in WRITE_INTENTS or detected:
+            scope = database.transaction()
+        else:
+            scope = database.read()
+        with scope as conn:
+            c = conn.cursor()
         
-        response = ""
-        actions = []
+            # Get user data
+            if users is not None and user_id in users:
+                user_data = users[user_id]
+            else:
+                user_data = load_user(conn, user_id)
+                if users is not None:
+                    users[user_id] = user_data
+
+            response = ""
+            actions = ()
+            # The question the reply ends with, for resolve_follow_up
+            pending = None
+            # Canned replies are stored as a template id plus parameters
+            template = params = None
+            # Whether anything besides chat history was written
+            changed = False
         
-        if intent == 'greeting':
-            response = "👋 Hello! I'm your Period Tracking Assistant. I can help you:\n• Log period start/end dates\n• Predict your next period\n• Track symptoms\n• Calculate ovulation\n• Answer questions about menstrual health\n\nHow can I help you today?"
+            if intent == 'greeting':
+                response, template, params = reply('greeting')
         
-        elif intent == 'period_start':
-            # Update last period date in database
-            c.execute('''
-                INSERT OR REPLACE INTO users 
-                (user_id, last_period_date, created_at) 
-                VALUES (?, ?, ?)
-            ''', (user_id, today, today))
-            
-            conn.commit()
-            
-            # Calculate next period
-            c.execute("SELECT cycle_length FROM users WHERE user_id = ?", (user_id,))
-            cycle_data = c.fetchone()
-            cycle_length = cycle_data[0] if cycle_data and cycle_data[0] else 28
+            elif intent == 'period_start':
+                # Update last period date in database
+                c.execute('''
+                    INSERT OR REPLACE INTO users 
+                    (user_id, last_period_date, created_at) 
+                    VALUES (?, ?, ?)
+                ''', (user_id, day, day))
+                changed = True
+                
+                # Keep the full start history for cycle estimation
+                c.execute('''
+                    INSERT OR IGNORE INTO period_events (user_id, start_date, created_at)
+                    VALUES (?, ?, ?)
+                ''', (user_id, day, to_stamp(now)))
+                if c.rowcount:
+                    # A new cycle start can move logged symptoms to other cycle days
+                    rebuild_user(conn, user_id)
+                refresh_schedule(conn, user_id)
+                
+                # Calculate next period
+                c.execute(USER_SQL, (user_id,))
+                user_data = c.fetchone()
+                store_user(user_id, user_data)
+                if users is not None:
+                    users[user_id] = user_data
+                cycle_length = user_estimate(conn, user_id, user_data[2]).cycle_length
             
-            next_period = self.calculate_next_period(today, cycle_length)
+                next_period = self.calculate_next_period(day, cycle_length)
             
-            response = f"✅ I've logged that your period started today ({today}).\n\n"
-            if next_period:
-                response += f"📅 Your next period is predicted to start around **{next_period}**.\n"
-                ovulation_date = self.calculate_ovulation(today, cycle_length)
-                if ovulation_date:
-                    response += f"🥚 Your estimated ovulation date is around **{ovulation_date}**.\n\n"
-            response += "Would you like to log any symptoms?"
+                response = f"✅ I've logged that your period started today ({today}).\n\n"
+                if next_period:
+                    response += f"📅 Your next period is predicted to start around **{from_day(next_period)}**.\n"
+                    ovulation_date = self.calculate_ovulation(day, cycle_length)
+                    if ovulation_date:
+                        response += f"🥚 Your estimated ovulation date is around **{from_day(ovulation_date)}**.\n\n"
+                response += "Would you like to log any symptoms?"
+                pending = 'log_symptoms'
             
-            actions = ["Log symptoms", "Set reminder", "Calculate ovulation"]
+                actions = PERIOD_ACTIONS
         
-        elif intent == 'next_period':
-            if user_data and user_data[1]:  # if last_period_date exists
-                last_period = user_data[1]
-                cycle_length = user_data[2] if user_data[2] else 28
+            elif intent == 'next_period':
+                if user_data and user_data[1]:  # if last_period_date exists
+                    last_period = user_data[1]
+                    estimate = user_estimate(conn, user_id, user_data[2])
+                    cycle_length = estimate.cycle_length
                 
-                next_period = self.calculate_next_period(last_period, cycle_length)
+                    next_period = self.calculate_next_period(last_period, cycle_length)
                 
-                if next_period:
-                    days_until = (datetime.strptime(next_period, '%Y-%m-%d') - datetime.now()).days
-                    response = f"Based on your last period on **{last_period}**:\n\n"
-                    response += f"📅 **Next period:** {next_period}\n"
-                    response += f"⏳ **Days until:** {days_until} days\n\n"
+                    if next_period:
+                        days_until = (datetime.fromordinal(next_period) - now).days
+                        response = f"Based on your last period on **{from_day(last_period)}**:\n\n"
+                        response += f"📅 **Next period:** {from_day(next_period)}\n"
+                        if estimate.cycles:
+                            earliest = from_day(self.calculate_next_period(last_period, estimate.low))
+                            latest = from_day(self.calculate_next_period(last_period, estimate.high))
+                            response += f"📊 **Likely between:** {earliest} and {latest} (from your last {estimate.cycles} cycles)\n"
+                        response += f"⏳ **Days until:** {days_until} days\n\n"
                     
-                    # Calculate fertile window
-                    ovulation_date = self.calculate_ovulation(last_period, cycle_length)
-                    if ovulation_date:
-                        ovulation_date_obj = datetime.strptime(ovulation_date, '%Y-%m-%d')
-                        fertile_start = (ovulation_date_obj - timedelta(days=3)).strftime('%Y-%m-%d')
-                        fertile_end = (ovulation_date_obj + timedelta(days=1)).strftime('%Y-%m-%d')
+                        # Calculate fertile window
+                        ovulation_date = self.calculate_ovulation(last_period, cycle_length)
+                        if ovulation_date:
+                            fertile_start = from_day(ovulation_date - 3)
+                            fertile_end = from_day(ovulation_date + 1)
                         
-                        response += f"🥚 **Estimated ovulation:** {ovulation_date}\n"
-                        response += f"🌡️ **Fertile window:** {fertile_start} to {fertile_end}"
+                            response += f"🥚 **Estimated ovulation:** {from_day(ovulation_date)}\n"
+                            response += f"🌡️ **Fertile window:** {fertile_start} to {fertile_end}"
+                    else:
+                        response, template, params = reply('next_period_unknown')
                 else:
-                    response = "I couldn't calculate your next period. Please log your period start date first."
-            else:
-                response = "I don't have your period history yet. Please tell me when your period started (e.g., 'My period started today')."
+                    response, template, params = reply('no_period_history')
         
-        elif intent == 'symptoms':
-            # Extract symptoms from message
-            symptoms_keywords = ['cramps', 'headache', 'bloating', 'back pain', 'breast tenderness', 
-                                'mood swings', 'fatigue', 'nausea', 'acne', 'food cravings']
-            
-            detected_symptoms = []
-            for symptom in symptoms_keywords:
-                if symptom in message.lower():
-                    detected_symptoms.append(symptom)
+            elif intent == 'symptoms':
+                detected_symptoms = [s.symptom for s in detected]
             
-            if detected_symptoms:
-                # Log symptoms to database
-                for symptom in detected_symptoms:
-                    c.execute('''
+                if detected_symptoms:
+                    # Log symptoms to database
+                    rows = [(user_id, s.symptom, to_day(s.date), s.severity) for s in detected]
+                    c.executemany('''
                         INSERT INTO symptoms (user_id, symptom, date, severity)
                         VALUES (?, ?, ?, ?)
-                    ''', (user_id, symptom, today, 'moderate'))
+                    ''', rows)
+                    record_symptoms(conn, rows)
+                    changed = True
                 
-                conn.commit()
+                    logged = []
+                    for s in detected:
+                        details = [s.severity] if s.severity != DEFAULT_SEVERITY else []
+                        if s.date != today:
+                            details.append(f"since {s.date}")
+                        logged.append(f"{s.symptom} ({', '.join(details)})" if details else s.symptom)
+                    response = f"✅ I've logged your symptoms: {', '.join(logged)}\n\n"
+                    response += "💡 **Tips for relief:**\n"
                 
-                response = f"✅ I've logged your symptoms: {', '.join(detected_symptoms)}\n\n"
-                response += "💡 **Tips for relief:**\n"
+                    if 'cramps' in detected_symptoms:
+                        response += "• Apply heat pad to lower abdomen\n• Gentle exercise or walking\n• Over-the-counter pain relievers\n• Drink warm herbal tea\n"
+                    if 'headache' in detected_symptoms:
+                        response += "• Stay hydrated\n• Rest in a dark room\n• Cold compress on forehead\n• Avoid caffeine\n"
+                    if 'bloating' in detected_symptoms:
+                        response += "• Reduce salt intake\n• Drink plenty of water\n• Eat smaller, frequent meals\n• Avoid carbonated drinks\n"
                 
-                if 'cramps' in detected_symptoms:
-                    response += "• Apply heat pad to lower abdomen\n• Gentle exercise or walking\n• Over-the-counter pain relievers\n• Drink warm herbal tea\n"
-                if 'headache' in detected_symptoms:
-                    response += "• Stay hydrated\n• Rest in a dark room\n• Cold compress on forehead\n• Avoid caffeine\n"
-                if 'bloating' in detected_symptoms:
-                    response += "• Reduce salt intake\n• Drink plenty of water\n• Eat smaller, frequent meals\n• Avoid carbonated drinks\n"
-                
-                response += "\nWould you like to set a reminder for pain medication?"
-            else:
-                response = "I can help you log symptoms like cramps, headache, bloating, mood swings, etc. What symptoms are you experiencing?"
-                actions = ["Cramps", "Headache", "Bloating", "Mood swings", "Fatigue"]
-        
-        elif intent == 'pms':
-            response = """**Premenstrual Syndrome (PMS)** refers to physical and emotional symptoms that occur 1-2 weeks before your period.
-
-**Common symptoms include:**
-• Mood swings, irritability, or depression
-• Bloating and weight gain
-• Breast tenderness
-• Fatigue
-• Food cravings
-• Headaches
-• Acne
-
-**Management tips:**
-1. **Exercise regularly** - even light activity helps
-2. **Balanced diet** - reduce salt, sugar, and caffeine
-3. **Stress management** - yoga, meditation, deep breathing
-4. **Adequate sleep** - 7-9 hours per night
-5. **Over-the-counter** pain relievers if needed
-
-Symptoms usually improve within a few days of starting your period."""
-        
-        elif intent == 'pain_relief':
-            response = """**Period Pain Relief Methods:**
-
-**Immediate Relief:**
-1. **Heat therapy** - Hot water bottle or heating pad on abdomen
-2. **OTC medication** - Ibuprofen, Naproxen (take at first sign)
-3. **Gentle massage** - Circular motions on lower abdomen
-
-**Lifestyle Changes:**
-• **Regular exercise** - Increases endorphins
-• **Warm baths** - Relaxes muscles
-• **Dietary changes**:
-  - Omega-3 fatty acids (fish, flaxseed)
-  - Reduce caffeine and alcohol
-  - Magnesium-rich foods (nuts, leafy greens)
-• **Hydration** - Drink plenty of water
-
-**Alternative Therapies:**
-• Acupuncture/acupressure
-• Herbal teas (ginger, chamomile)
-• Yoga stretches (child's pose, cat-cow)
-
-**When to see a doctor:**
-• Pain prevents normal activities
-• Symptoms worsen over time
-• Heavy bleeding with clots
-• Pain with fever"""
-
-        elif intent == 'ovulation':
-            if user_data and user_data[1]:
-                last_period = user_data[1]
-                cycle_length = user_data[2] if user_data[2] else 28
+                    response += "\nWould you like to set a reminder for pain medication?"
+                    pending = 'medication_reminder'
+                else:
+                    response, template, params = reply('symptoms_prompt')
+                    pending = 'which_symptoms'
+                    actions = SYMPTOM_ACTIONS
+        
+            elif intent == 'pms':
+                response, template, params = reply('pms')
+        
+            elif intent == 'pain_relief':
+                response, template, params = reply('pain_relief')
+
+            elif intent == 'ovulation':
+                if user_data and user_data[1]:
+                    last_period = user_data[1]
+                    cycle_length = user_estimate(conn, user_id, user_data[2]).cycle_length
                 
-                ovulation_date = self.calculate_ovulation(last_period, cycle_length)
+                    ovulation_date = self.calculate_ovulation(last_period, cycle_length)
                 
-                if ovulation_date:
-                    ovulation_date_obj = datetime.strptime(ovulation_date, '%Y-%m-%d')
-                    fertile_start = (ovulation_date_obj - timedelta(days=3)).strftime('%Y-%m-%d')
-                    fertile_end = (ovulation_date_obj + timedelta(days=1)).strftime('%Y-%m-%d')
+                    if ovulation_date:
+                        fertile_start = from_day(ovulation_date - 3)
+                        fertile_end = from_day(ovulation_date + 1)
                     
-                    response = f"**Ovulation Calculation:**\n\n"
-                    response += f"📅 Last period: {last_period}\n"
-                    response += f"🔄 Cycle length: {cycle_length} days\n"
-                    response += f"🥚 **Estimated ovulation:** {ovulation_date}\n"
-                    response += f"🌡️ **Fertile window:** {fertile_start} to {fertile_end}\n\n"
-                    response += "**Ovulation signs to watch for:**\n"
-                    response += "• Egg-white cervical mucus\n• Mild pelvic pain (mittelschmerz)\n• Slight rise in basal body temperature\n• Increased libido\n• Breast tenderness"
+                        response = f"**Ovulation Calculation:**\n\n"
+                        response += f"📅 Last period: {from_day(last_period)}\n"
+                        response += f"🔄 Cycle length: {cycle_length} days\n"
+                        response += f"🥚 **Estimated ovulation:** {from_day(ovulation_date)}\n"
+                        response += f"🌡️ **Fertile window:** {fertile_start} to {fertile_end}\n\n"
+                        response += "**Ovulation signs to watch for:**\n"
+                        response += "• Egg-white cervical mucus\n• Mild pelvic pain (mittelschmerz)\n• Slight rise in basal body temperature\n• Increased libido\n• Breast tenderness"
+                    else:
+                        response, template, params = reply('ovulation_no_date')
                 else:
-                    response = "I need your last period date to calculate ovulation. Say 'My period started [date]'."
-            else:
-                response = "I need your period history to calculate ovulation. Please log your last period first."
-        
-        elif intent == 'cycle_info':
-            if user_data and user_data[2]:
-                cycle_length = user_data[2]
-                response = f"Your current cycle length is set to **{cycle_length} days**.\n\n"
-                response += "**Normal cycle ranges:** 21-35 days\n"
-                response += "**Average cycle:** 28 days\n\n"
-                response += "To update your cycle length, say: 'My cycle is X days'"
+                    response, template, params = reply('ovulation_no_history')
+        
+            elif intent == 'cycle_info':
+                if user_data and user_data[2]:
+                    cycle_length = user_data[2]
+                    response, template, params = reply('cycle_info', cycle_length=cycle_length)
+                else:
+                    response, template, params = reply('cycle_info_default')
+        
+            elif intent == 'set_reminder':
+                response, template, params = reply('set_reminder')
+                reminders = list_reminders(conn, user_id)
+                if reminders:
+                    template = params = None
+                    response += "\n\n**Your reminders:**\n"
+                    for reminder in reminders:
+                        response += f"• {reminder['kind'].replace('_', ' ').capitalize()} - next on {reminder['due_date'] or 'your next logged period'}\n"
+                pending = 'reminder_kind'
+                actions = REMINDER_ACTIONS
+        
+            elif intent == 'add_reminder':
+                # A kind picked from the set_reminder actions, or "yes" to a medication reminder
+                due_date = add_reminder(conn, user_id, reminder_kind,
+                                        2 if reminder_kind == 'period_start' else 0, today=day)
+                response, template, params = reply(
+                    'reminder_added', reminder=reminder_kind.replace('_', ' '),
+                    due_date=due_date or 'your next logged period')
+        
+            elif intent == 'declined':
+                response, template, params = reply('follow_up_declined')
+        
+            elif intent in self.intent_templates:
+                response, template, params = reply(self.intent_templates[intent])
+        
             else:
-                response = "I don't have your cycle information yet. The default is 28 days.\n\n"
-                response += "You can update it by saying: 'My cycle is 30 days' or similar."
-        
-        elif intent == 'set_reminder':
-            response = "I can remind you about:\n\n"
-            response += "1. **Period start** - 2 days before expected date\n"
-            response += "2. **Ovulation** - When you're most fertile\n"
-            response += "3. **Pill/Medication** - Daily reminders\n"
-            response += "4. **Symptom check-ins** - How you're feeling\n\n"
-            response += "What would you like me to remind you about?"
-            actions = ["Period start", "Ovulation", "Medication", "Symptoms"]
+                # Default/unknown intent
+                response, template, params = reply('unknown')
         
-        else:
-            # Default/unknown intent
-            response = "I'm here to help with period tracking and menstrual health! I can:\n\n"
-            response += "• Log your period start/end dates\n"
-            response += "• Predict your next period\n"
-            response += "• Track symptoms and suggest relief\n"
-            response += "• Calculate ovulation dates\n"
-            response += "• Answer questions about PMS, pain relief, etc.\n\n"
-            response += "Try saying:\n'My period started today'\n'When is my next period?'\n'I have cramps'\n'What helps with period pain?'"
-        
-        # Save chat history
-        c.execute('''
-            INSERT INTO chat_history (user_id, user_message, bot_response, timestamp)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, message, response, datetime.now().isoformat()))
-        
-        conn.commit()
-        conn.close()
+            # Save chat history
+            history_row = (user_id, message, None if template else response,
+                           to_stamp(now), template, params)
+            if self.history_writer is None:
+                c.execute(HISTORY_INSERT_SQL, history_row)
+            if changed or self.history_writer is None:
+                # The write-behind flush bumps again once the history row lands
+                bump_versions(conn, [user_id])
+        
+        if self.history_writer is not None:
+            # Written behind, off the request path
+            self.history_writer.submit(history_row)
+        if self.sessions:
+            self.sessions.set(user_id, intent, pending, actions)
         
+        metrics.observe('chat_intent_duration_seconds', (intent,), time.perf_counter() - start)
         return {
             "response": response,
             "intent": intent,
-            "actions": actions,
+            "actions": list(actions),
             "timestamp": datetime.now().isoformat()
         }
+    
+    def preload_users(self, conn, user_ids):
+        """Load users rows for a batch, via the cache and one IN query per 500 misses"""
+        users = {}
+        missing = []
+        for user_id in user_ids:
+            hit, row = user_cache.get(user_id)
+            if hit:
+                users[user_id] = row
+            else:
+                users[user_id] = None
+                missing.append(user_id)
+        token = user_cache.fill_token()
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            rows = conn.execute(
+                f"SELECT * FROM users WHERE user_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            for row in rows:
+                users[row[0]] = row
+        for user_id in missing:
+            user_cache.fill(user_id, users[user_id], token)
+        return users
+    
+    def process_batch(self, items):
+        """Process a list of {user_id, message, client_timestamp} items, one transaction per shard
+        
+        Each item runs in its own savepoint, so a failing item is rolled back
+        and reported without affecting the others. Results keep item order.
+        """
+        results = [None] * len(items)
+        user_ids = [None] * len(items)
+        by_shard = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or 'message' not in item or 'user_id' not in item:
+                results[index] = {"status": "error", "error": "Missing message or user_id"}
+                continue
+            user_id = item['user_id']
+            if isinstance(user_id, bool) or not isinstance(user_id, (str, int)) or user_id == '':
+                results[index] = {"status": "error",
+                                  "error": "user_id must be a non-empty string or integer"}
+                continue
+            # 42 and "42" are one user, with one cache entry
+            user_ids[index] = str(user_id)
+            by_shard.setdefault(db.for_user(user_ids[index]), []).append(index)
+        
+        for shard, indexes in by_shard.items():
+            with shard.transaction() as conn:
+                # Load every distinct user's row once for the whole batch
+                users = self.preload_users(conn, {user_ids[i] for i in indexes})
+                for index in indexes:
+                    item = items[index]
+                    user_id = user_ids[index]
+                    try:
+                        now = parse_client_timestamp(item.get('client_timestamp'))
+                        with shard.savepoint('batch_item'):
+                            result = self.process_message(item['message'], user_id,
+                                                          now=now, users=users)
+                        results[index] = {"status": "success", "data": result}
+                    except Exception as e:
+                        # The item was rolled back, but earlier items' writes stand:
+                        # re-read the row in this transaction, the cache predates them
+                        users[user_id] = conn.execute(USER_SQL, (user_id,)).fetchone()
+                        results[index] = {"status": "error", "error": str(e)}
+        return results
+
+def parse_client_timestamp(value):
+    """Parse an ISO 8601 client timestamp into a naive local datetime"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+# Optional write-behind mode for chat history
+history_writer = None
+if os.environ.get('CHAT_HISTORY_WRITE_BEHIND', 'False').lower() == 'true':
+    history_writer = HistoryWriter(
+        db,
+        max_queue=int(os.environ.get('CHAT_HISTORY_QUEUE_SIZE', 10000)),
+        batch_size=int(os.environ.get('CHAT_HISTORY_BATCH_SIZE', 500)),
+        flush_interval=float(os.environ.get('CHAT_HISTORY_FLUSH_INTERVAL', 0.2)),
+    )
+
+# In-app reminder delivery; alternatively run reminders.py from cron
+reminder_scheduler = None
+if os.environ.get('REMINDER_SCHEDULER', 'False').lower() == 'true':
+    reminder_scheduler = ReminderScheduler(
+        db, interval=float(os.environ.get('REMINDER_INTERVAL', 60))
+    )
+
+@per_process
+def start_background():
+    """Threads don't survive fork: start them in each worker (see startup.py)"""
+    if history_writer:
+        history_writer.start()
+    if reminder_scheduler:
+        reminder_scheduler.start()
+
+# Page size cap for /history and /symptoms
+HISTORY_MAX_PAGE = int(os.environ.get('HISTORY_MAX_PAGE', 200))
+
+def format_history(row):
+    return {
+        "id": row[0],
+        "user_message": row[1],
+        # Templated replies are re-rendered from their id and parameters
+        "bot_response": render(row[4], row[5]) if row[4] else row[2],
+        "timestamp": from_stamp(row[3])
+    }
+
+def format_symptom(row):
+    return {
+        "id": row[0],
+        "symptom": row[2],
+        "severity": row[3],
+        "date": from_day(row[4]),
+        "notes": row[5]
+    }
+
+# Maximum number of items accepted by /chat/batch
+CHAT_BATCH_MAX_SIZE = int(os.environ.get('CHAT_BATCH_MAX_SIZE', 100))
+
+# Records per transaction for POST /import
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 5000))
 
 # Initialize chatbot
-chatbot = PeriodTrackerChatbot()
+chatbot = PeriodTrackerChatbot(history_writer=history_writer, sessions=sessions)
+
+@metrics.collector
+def subsystem_gauges():
+    """Expose the /stats counters as gauges on /metrics"""
+    gauges = [(f'user_cache_{k}', "User profile cache counter", None, v)
+              for k, v in user_cache.stats().items()]
+    if history_writer:
+        gauges += [(f'history_writer_{k}', "Chat history write-behind counter", None, v)
+                   for k, v in history_writer.stats().items()]
+    gauges += [(f'body_cache_{k}', "Versioned response body cache counter", None, v)
+               for k, v in body_cache.stats().items()]
+    gauges += [(f'session_{k}', "Conversation session store counter", None, v)
+               for k, v in sessions.stats().items()]
+    gauges += [(f'idempotency_{k}', "Idempotency-Key result store counter", None, v)
+               for k, v in idempotency.stats().items()]
+    if admission:
+        stats = admission.stats()
+        gauges += [('requests_in_flight', "Admitted requests being processed", None,
+                    stats['in_flight_now']),
+                   ('rate_limit_tracked_clients', "Clients with a live token bucket", None,
+                    stats['tracked_clients'])]
+    return gauges
+
+# Serialized GET bodies per user and URL, served while the user's data version is unchanged
+body_cache = BodyCache(max_size=int(os.environ.get('BODY_CACHE_SIZE', 10000)))
+
+# Part of every ETag, so a deploy that changes response formats invalidates them
+ETAG_SALT = os.environ.get('ETAG_SALT', f'v{latest_version()}')
+
+def conditional(view):
+    """Serve a per-user GET by data version: ETag, 304 on If-None-Match, cached body
+    
+    The version and the body are read in one snapshot, so a body is never
+    tagged with a version it doesn't reflect. ?stream=1 bypasses this.
+    """
+    @wraps(view)
+    def wrapper(user_id):
+        if wants_stream(request):
+            return view(user_id)
+        try:
+            with db.for_user(user_id).read() as conn:
+                version = data_version(conn, user_id)
+                etag = f'{version}-{ETAG_SALT}'
+                if request.if_none_match.contains_weak(etag):
+                    # Only user_versions was read
+                    response = Response(status=304)
+                else:
+                    key = (user_id, request.full_path)
+                    body = body_cache.get(key, version)
+                    if body is not None:
+                        response = Response(body, mimetype='application/json')
+                    else:
+                        response = app.make_response(view(user_id))
+                        if response.status_code != 200:
+                            return response
+                        body_cache.put(key, version, response.get_data())
+        except Exception as e:
+            return jsonify({
+                "status": "error",
+                "error": str(e)
+            }), 500
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+# Results of writes sent with an Idempotency-Key, replayed to retries (see idempotency.py)
+idempotency = IdempotencyStore(
+    max_size=int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('IDEMPOTENCY_TTL', 86400)),
+    persist=os.environ.get('IDEMPOTENCY_PERSIST', 'True').lower() == 'true',
+)
+
+def idempotent(view):
+    """Run a write at most once per Idempotency-Key and replay its response to retries
+    
+    Keys are scoped to the route and user_id (from the URL or the JSON body).
+    Requests without the header run as before.
+    """
+    @wraps(view)
+    def wrapper(**kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(**kwargs)
+        if len(key) > 255:
+            return jsonify({
+                "status": "error",
+                "error": "Idempotency-Key is too long (max 255 characters)"
+            }), 400
+        user_id = kwargs.get('user_id')
+        if user_id is None:
+            data = request.get_json(silent=True)
+            user_id = data.get('user_id') if isinstance(data, dict) else None
+            if user_id is None:
+                # Nothing to scope the key to; the view rejects the request
+                return view(**kwargs)
+        
+        def run():
+            response = app.make_response(view(**kwargs))
+            return response.status_code, response.get_data()
+        
+        try:
+            result, replayed = idempotency.execute(
+                key_hash(request.url_rule.rule, user_id, key), fingerprint(request.get_data()),
+                run, db.for_user(user_id), str(user_id))
+        except IdempotencyConflict as e:
+            return jsonify({"status": "error", "error": str(e)}), 422
+        except Exception as e:
+            return jsonify({
+                "status": "error",
+                "error": str(e)
+            }), 500
+        response = Response(result.body, status=result.status, mimetype='application/json')
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    return wrapper
+
+# Static, so encoded once
+HOME_BODY = dumps({
+    "message": "Period Tracker Chatbot API",
+    "status": "running",
+    "endpoints": {
+        "/chat": "POST - Send message to chatbot",
+        "/chat/batch": "POST - Send a batch of queued messages",
+        "/user/<user_id>": "GET - Get user data",
+        "/symptoms/<user_id>": "GET - Get user symptoms",
+        "/history/<user_id>": "GET - Get chat history",
+        "/reminders/<user_id>": "GET/POST - List or set reminders",
+        "/import": "POST - Bulk import CSV or NDJSON records",
+        "/export/<user_id>": "GET - Export user data as NDJSON",
+        "/analytics/<user_id>": "GET - Symptoms by cycle day and phase",
+        "/analytics": "GET - Population symptoms by cycle day",
+        "/stats": "GET - Internal counters",
+        "/metrics": "GET - Prometheus metrics"
+    }
+})
 
 # API Routes
 @app.route('/')
 def home():
+    return Response(HOME_BODY, mimetype='application/json')
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Internal counters for background subsystems"""
     return jsonify({
-        "message": "Period Tracker Chatbot API",
-        "status": "running",
-        "endpoints": {
-            "/chat": "POST - Send message to chatbot",
-            "/user/<user_id>": "GET - Get user data",
-            "/symptoms/<user_id>": "GET - Get user symptoms",
-            "/history/<user_id>": "GET - Get chat history"
-        }
+        "status": "success",
+        "history_writer": history_writer.stats() if history_writer else None,
+        "user_cache": user_cache.stats(),
+        "body_cache": body_cache.stats(),
+        "sessions": sessions.stats(),
+        "idempotency": idempotency.stats(),
+        "admission": admission.stats() if admission else None
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Latency histograms and counters in Prometheus text format"""
+    if not metrics.enabled:
+        return jsonify({"status": "error", "error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/chat', methods=['POST'])
+@idempotent
 def chat():
     """Main chat endpoint"""
     try:
@@ -407,9 +824,36 @@ def chat():
         # Process message
         result = chatbot.process_message(message, user_id)
         
+        return Response(chat_body(result), mimetype='application/json')
+    
+    except Exception as e:
         return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Process a batch of queued messages in a single transaction"""
+    try:
+        data = request.json
+        items = data.get('items') if isinstance(data, dict) else data
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                "error": "Expected a non-empty list of items",
+                "status": "error"
+            }), 400
+        
+        if len(items) > CHAT_BATCH_MAX_SIZE:
+            return jsonify({
+                "error": f"Batch too large (max {CHAT_BATCH_MAX_SIZE} items)",
+                "status": "error"
+            }), 413
+        
+        return json_response({
             "status": "success",
-            "data": result
+            "results": chatbot.process_batch(items)
         })
     
     except Exception as e:
@@ -419,45 +863,51 @@ def chat():
         }), 500
 
 @app.route('/user/<user_id>', methods=['GET'])
+@conditional
 def get_user_data(user_id):
     """Get user data"""
     try:
-        conn = sqlite3.connect('period_tracker.db')
-        c = conn.cursor()
-        
-        c.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        user_data = c.fetchone()
-        
-        c.execute("SELECT * FROM symptoms WHERE user_id = ? ORDER BY date DESC LIMIT 10", (user_id,))
-        symptoms = c.fetchall()
+        before, limit = parse_page_args(request.args, default_limit=10, max_limit=100,
+                                        prefix='symptoms_')
         
-        conn.close()
+        with db.for_user(user_id).read() as conn:
+            user_data = load_user(conn, user_id, fresh=True)
+            
+            symptoms, symptoms_cursor = fetch_page(
+                conn, 'symptoms', SYMPTOM_COLUMNS, 'date', user_id, before, limit
+            )
+            
+            estimate = user_estimate(conn, user_id, user_data[2] if user_data else None)
         
         if user_data:
             user_dict = {
                 "user_id": user_data[0],
-                "last_period_date": user_data[1],
+                "last_period_date": from_day(user_data[1]),
                 "cycle_length": user_data[2],
                 "period_duration": user_data[3],
-                "created_at": user_data[4]
+                "created_at": from_day(user_data[4])
             }
             
             # Calculate predictions
             if user_data[1]:
-                next_period = chatbot.calculate_next_period(user_data[1], user_data[2] or 28)
-                ovulation = chatbot.calculate_ovulation(user_data[1], user_data[2] or 28)
+                next_period = from_day(chatbot.calculate_next_period(user_data[1], estimate.cycle_length))
+                ovulation = from_day(chatbot.calculate_ovulation(user_data[1], estimate.cycle_length))
             else:
                 next_period = None
                 ovulation = None
             
-            return jsonify({
+            return json_response({
                 "status": "success",
                 "user": user_dict,
                 "predictions": {
                     "next_period": next_period,
-                    "ovulation_date": ovulation
+                    "ovulation_date": ovulation,
+                    "cycle_length": estimate.cycle_length,
+                    "cycles_observed": estimate.cycles
                 },
-                "recent_symptoms": symptoms
+                # Raw rows, with the date (column 4) back in ISO form
+                "recent_symptoms": [row[:4] + (from_day(row[4]),) + row[5:] for row in symptoms],
+                "symptoms_next_cursor": symptoms_cursor
             })
         else:
             return jsonify({
@@ -466,6 +916,41 @@ def get_user_data(user_id):
                 "message": "User not found"
             })
     
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route('/symptoms/<user_id>', methods=['GET'])
+@conditional
+def get_symptoms(user_id):
+    """List logged symptoms, newest first (paged like /history)"""
+    try:
+        if wants_stream(request):
+            before, _ = parse_page_args(request.args)
+            rows = iter_rows(db, 'symptoms', SYMPTOM_COLUMNS, 'date', user_id, before)
+            return ndjson_response(format_symptom(row) for row in rows)
+        
+        before, limit = parse_page_args(request.args, max_limit=HISTORY_MAX_PAGE)
+        
+        with db.for_user(user_id).read() as conn:
+            symptoms, next_cursor = fetch_page(
+                conn, 'symptoms', SYMPTOM_COLUMNS, 'date', user_id, before, limit
+            )
+        
+        return json_response({
+            "status": "success",
+            "symptoms": [format_symptom(row) for row in symptoms],
+            "next_cursor": next_cursor
+        })
+    
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
+    
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -473,6 +958,7 @@ def get_user_data(user_id):
         }), 500
 
 @app.route('/symptoms/<user_id>', methods=['POST'])
+@idempotent
 def log_symptom(user_id):
     """Log a symptom"""
     try:
@@ -485,16 +971,14 @@ def log_symptom(user_id):
         severity = data.get('severity', 'moderate')
         notes = data.get('notes', '')
         
-        conn = sqlite3.connect('period_tracker.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            INSERT INTO symptoms (user_id, symptom, severity, date, notes)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, symptom, severity, datetime.now().strftime('%Y-%m-%d'), notes))
-        
-        conn.commit()
-        conn.close()
+        today = to_day(datetime.now())
+        with db.for_user(user_id).transaction() as conn:
+            conn.execute('''
+                INSERT INTO symptoms (user_id, symptom, severity, date, notes)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, symptom, severity, today, notes))
+            record_symptoms(conn, [(user_id, symptom, today, severity)])
+            bump_versions(conn, [user_id])
         
         return jsonify({
             "status": "success",
@@ -508,38 +992,35 @@ def log_symptom(user_id):
         }), 500
 
 @app.route('/history/<user_id>', methods=['GET'])
+@conditional
 def get_chat_history(user_id):
-    """Get chat history for user"""
+    """Get chat history for user, newest first
+    
+    Paged with ?limit= (capped at HISTORY_MAX_PAGE) and ?before=<next_cursor>;
+    ?stream=1 streams every matching row as NDJSON instead.
+    """
     try:
-        limit = request.args.get('limit', 50)
-        
-        conn = sqlite3.connect('period_tracker.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT user_message, bot_response, timestamp 
-            FROM chat_history 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        ''', (user_id, limit))
-        
-        history = c.fetchall()
-        conn.close()
-        
-        formatted_history = []
-        for msg in history:
-            formatted_history.append({
-                "user_message": msg[0],
-                "bot_response": msg[1],
-                "timestamp": msg[2]
-            })
+        if wants_stream(request):
+            before, _ = parse_page_args(request.args)
+            rows = iter_rows(db, 'chat_history', HISTORY_COLUMNS, 'timestamp', user_id, before)
+            return ndjson_response(format_history(msg) for msg in rows)
         
-        return jsonify({
+        before, limit = parse_page_args(request.args, max_limit=HISTORY_MAX_PAGE)
+        
+        with db.for_user(user_id).read() as conn:
+            history, next_cursor = fetch_page(
+                conn, 'chat_history', HISTORY_COLUMNS, 'timestamp', user_id, before, limit
+            )
+        
+        return json_response({
             "status": "success",
-            "history": formatted_history
+            "history": [format_history(msg) for msg in history],
+            "next_cursor": next_cursor
         })
     
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
+    
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -561,27 +1042,75 @@ def update_cycle():
         if not 21 <= cycle_length <= 45:
             return jsonify({"error": "Cycle length should be between 21-45 days"}), 400
         
-        conn = sqlite3.connect('period_tracker.db')
-        c = conn.cursor()
+        with db.for_user(user_id).transaction() as conn:
+            c = conn.cursor()
+            
+            # Check if user exists
+            if load_user(conn, user_id):
+                c.execute('''
+                    UPDATE users SET cycle_length = ? WHERE user_id = ?
+                ''', (cycle_length, user_id))
+            else:
+                c.execute('''
+                    INSERT INTO users (user_id, cycle_length, created_at)
+                    VALUES (?, ?, ?)
+                ''', (user_id, cycle_length, to_day(datetime.now())))
+            refresh_schedule(conn, user_id)
+            bump_versions(conn, [user_id])
+            
+            c.execute(USER_SQL, (user_id,))
+            store_user(user_id, c.fetchone())
         
-        # Check if user exists
-        c.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        if c.fetchone():
-            c.execute('''
-                UPDATE users SET cycle_length = ? WHERE user_id = ?
-            ''', (cycle_length, user_id))
-        else:
-            c.execute('''
-                INSERT INTO users (user_id, cycle_length, created_at)
-                VALUES (?, ?, ?)
-            ''', (user_id, cycle_length, datetime.now().strftime('%Y-%m-%d')))
+        return jsonify({
+            "status": "success",
+            "message": f"Cycle length updated to {cycle_length} days"
+        })
+    
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route('/reminders/<user_id>', methods=['GET'])
+def get_reminders(user_id):
+    """List a user's reminders"""
+    try:
+        with db.for_user(user_id).read() as conn:
+            reminders = list_reminders(conn, user_id)
         
-        conn.commit()
-        conn.close()
+        return jsonify({
+            "status": "success",
+            "reminders": reminders
+        })
+    
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route('/reminders/<user_id>', methods=['POST'])
+def set_reminder(user_id):
+    """Create or replace a reminder"""
+    try:
+        data = request.json
+        
+        if not data or data.get('kind') not in REMINDER_KINDS:
+            return jsonify({"error": f"kind must be one of: {', '.join(REMINDER_KINDS)}"}), 400
+        
+        days_before = int(data.get('days_before', 2 if data['kind'] == 'period_start' else 0))
+        interval_days = int(data.get('interval_days', 1))
+        if not 0 <= days_before <= 14 or interval_days < 1:
+            return jsonify({"error": "days_before should be 0-14 and interval_days at least 1"}), 400
+        
+        with db.for_user(user_id).transaction() as conn:
+            due_date = add_reminder(conn, user_id, data['kind'], days_before, interval_days)
         
         return jsonify({
             "status": "success",
-            "message": f"Cycle length updated to {cycle_length} days"
+            "message": f"Reminder '{data['kind']}' set",
+            "due_date": due_date
         })
     
     except Exception as e:
@@ -590,8 +1119,87 @@ def update_cycle():
             "error": str(e)
         }), 500
 
+@app.route('/import', methods=['POST'])
+def bulk_import():
+    """Stream a CSV or NDJSON body of user records into the database"""
+    try:
+        fmt = request.args.get('format') or detect_format(content_type=request.content_type)
+        if fmt not in FORMATS:
+            return jsonify({
+                "status": "error",
+                "error": f"format must be one of {', '.join(FORMATS)}"
+            }), 400
+        
+        # Read the body incrementally instead of buffering it
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        summary = import_records(
+            db, read_records(stream, fmt),
+            source=request.args.get('source'),
+            chunk_size=IMPORT_CHUNK_SIZE,
+            strict=request.args.get('strict', '').lower() in ('1', 'true'),
+            on_users_changed=lambda user_ids: [user_cache.invalidate(u) for u in user_ids]
+        )
+        
+        return jsonify({"status": "success", **summary})
+    
+    except RecordError as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route('/export/<user_id>', methods=['GET'])
+def export_user(user_id):
+    """Stream all of a user's data as NDJSON import records"""
+    try:
+        return ndjson_response(iter_export(db, user_id))
+    
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route('/analytics/<user_id>', methods=['GET'])
+@conditional
+def get_user_analytics(user_id):
+    """Symptom patterns by cycle day and phase, from the rollup table"""
+    try:
+        with db.for_user(user_id).read() as conn:
+            report = user_report(conn, user_id, load_user(conn, user_id, fresh=True))
+        
+        return jsonify({"status": "success", "user_id": user_id, **report})
+    
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
+@app.route('/analytics', methods=['GET'])
+def get_population_analytics():
+    """Symptom counts by cycle day across all users"""
+    try:
+        symptom = request.args.get('symptom')
+        parts = []
+        for shard in db.shards:
+            with shard.read() as conn:
+                parts.append(population(conn, symptom))
+        
+        return jsonify({"status": "success", "symptoms": merge_population(parts)})
+    
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)
+        }), 500
+
 if __name__ == '__main__':
-    import os
     port = int(os.environ.get('PORT', 5000))  # Use PORT if set, otherwise default to 5000
     # Disable debug in production
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
@@ -0,0 +1,165 @@
+"""Admission control: per-client and global token buckets plus load shedding
+
+Every request takes a token from its client's bucket for the route (and
+from the global bucket, if one is configured). If a bucket is empty the
+request is rejected at once with 429 and a Retry-After. It never waits
+for a thread or a database lock. Independently, requests are shed with 503
+when too many are already in flight or when they queued too long before
+reaching the app, so a burst can't tie up every worker thread.
+
+Client buckets live in a bounded LRU. A bucket left idle long enough to
+refill completely is the same as a new one, so it is dropped.
+"""
+from collections import OrderedDict
+import math
+import threading
+import time
+
+from metrics import metrics
+
+
+def parse_limit(spec):
+    """'rate[:burst]' in requests per second -> (rate, burst); '0' means unlimited"""
+    rate, _, burst = str(spec).partition(':')
+    rate = float(rate)
+    return (rate, float(burst) if burst else max(rate, 1.0)) if rate > 0 else None
+
+
+def parse_route_limits(spec):
+    """'/chat=5:20,/chat/batch=1:5' -> {route: (rate, burst) or None}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        route, _, limit = item.partition('=')
+        limits[route.strip()] = parse_limit(limit)
+    return limits
+
+
+class RateLimiter:
+    """Token buckets keyed by client, in a bounded LRU that drops idle buckets"""
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # Seconds after which an idle bucket is full again
+        self.idle_expiry = burst / rate
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key, now=None):
+        """Take a token; returns 0 if admitted, else seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            self._expire(now)
+            return wait
+
+    def _expire(self, now):
+        buckets = self._buckets
+        while len(buckets) > self.max_keys:
+            buckets.popitem(last=False)
+        # Least recently used first; stop at the first bucket still refilling
+        while buckets:
+            key, (tokens, last) = next(iter(buckets.items()))
+            if now - last < self.idle_expiry:
+                break
+            del buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """Decides per request whether to admit, rate limit (429) or shed (503)"""
+
+    def __init__(self, route_limits=None, default_limit=None, global_limit=None,
+                 max_in_flight=0, max_queue_wait=0.0, max_keys=100000):
+        self.max_in_flight = max_in_flight
+        self.max_queue_wait = max_queue_wait
+        self._route_limiters = {
+            route: RateLimiter(*limit, max_keys=max_keys) if limit else None
+            for route, limit in (route_limits or {}).items()
+        }
+        self._default_limit = default_limit
+        self._max_keys = max_keys
+        self._global = RateLimiter(*global_limit, max_keys=1) if global_limit else None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {'admitted': 0, 'user_rate': 0, 'global_rate': 0,
+                       'in_flight': 0, 'queue_wait': 0}
+
+    def _limiter(self, route):
+        if route not in self._route_limiters:
+            # Routes without their own limit get a default limiter each
+            with self._lock:
+                if route not in self._route_limiters:
+                    limit = self._default_limit
+                    self._route_limiters[route] = (
+                        RateLimiter(*limit, max_keys=self._max_keys) if limit else None)
+        return self._route_limiters[route]
+
+    def admit(self, route, key, queue_wait=None):
+        """Return None if admitted (call release() when done) or (status, reason, retry_after)"""
+        if self.max_queue_wait and queue_wait is not None and queue_wait > self.max_queue_wait:
+            return self._reject(route, 503, 'queue_wait', 1)
+        limiter = self._limiter(route)
+        if limiter is not None:
+            wait = limiter.acquire(key)
+            if wait:
+                return self._reject(route, 429, 'user_rate', wait)
+        if self._global is not None:
+            wait = self._global.acquire(None)
+            if wait:
+                return self._reject(route, 429, 'global_rate', wait)
+        with self._lock:
+            if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                shed = True
+            else:
+                shed = False
+                self._in_flight += 1
+                self._stats['admitted'] += 1
+        if shed:
+            return self._reject(route, 503, 'in_flight', 1)
+        return None
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _reject(self, route, status, reason, retry_after):
+        with self._lock:
+            self._stats[reason] += 1
+        metrics.inc('admission_rejections_total', (route, reason))
+        return status, reason, max(1, math.ceil(retry_after))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight_now'] = self._in_flight
+        stats['tracked_clients'] = sum(len(limiter) for limiter in self._route_limiters.values()
+                                       if limiter is not None)
+        return stats
+
+
+def queue_wait_seconds(header, now=None):
+    """Time since a proxy's X-Request-Start stamp ('t=<seconds>' or epoch ms/us)"""
+    if not header:
+        return None
+    try:
+        stamp = float(header.strip().lstrip('t='))
+    except ValueError:
+        return None
+    while stamp > 1e11:
+        # Milliseconds or microseconds since the epoch
+        stamp /= 1000
+    return max(0.0, (time.time() if now is None else now) - stamp)
@@ -0,0 +1,196 @@
+"""Symptom-by-cycle-day rollups
+
+symptom_rollups keeps one row per (user, symptom, cycle day) with the
+number of logs and how many were severe. Cycle day 1 is the most recent
+period start on or before the symptom's date. Rows are upserted as symptoms
+are logged. A user's rollups are rebuilt from that user's own symptoms
+whenever a new period start is recorded, because that can move existing
+symptoms to other cycle days. Reports read the rollup rows and never scan
+the symptoms table. Phases are derived from the cycle day when a report is
+built.
+
+Run ``python analytics.py backfill`` to rebuild every user's rollups.
+"""
+import argparse
+
+from predictions import user_estimate
+
+# Symptoms logged later than this in a cycle are left out (stale period data)
+MAX_CYCLE_DAY = 60
+
+# Logs of a symptom needed before its peak is reported as a pattern
+MIN_INSIGHT_LOGS = 3
+
+PHASES = ('menstrual', 'follicular', 'ovulation', 'luteal')
+
+CYCLE_START_SQL = '''
+    SELECT MAX(p.start_date) FROM period_events p
+    WHERE p.user_id = {user} AND p.start_date <= {date}
+'''
+
+# Dates are day ordinals (see dates.py), so a difference is a number of days
+_CYCLE_DAY_SQL = f'''
+    {{date}} - ({CYCLE_START_SQL}) + 1
+'''
+
+RECORD_SQL = f'''
+    INSERT INTO symptom_rollups (user_id, symptom, cycle_day, count, severe)
+    SELECT user_id, symptom, cycle_day, 1, severe
+    FROM (SELECT ? AS user_id, ? AS symptom, ? AS severe,
+                 {_CYCLE_DAY_SQL.format(date='?', user='?')} AS cycle_day)
+    WHERE cycle_day BETWEEN 1 AND {MAX_CYCLE_DAY}
+    ON CONFLICT (user_id, symptom, cycle_day) DO UPDATE SET
+        count = count + 1,
+        severe = severe + excluded.severe
+'''
+
+REBUILD_SQL = f'''
+    INSERT INTO symptom_rollups (user_id, symptom, cycle_day, count, severe)
+    SELECT user_id, symptom, cycle_day, COUNT(*), SUM(severity = 'severe')
+    FROM (SELECT s.user_id, s.symptom, s.severity,
+                 {_CYCLE_DAY_SQL.format(date='s.date', user='s.user_id')} AS cycle_day
+          FROM symptoms s {{where}})
+    WHERE cycle_day BETWEEN 1 AND {MAX_CYCLE_DAY}
+    GROUP BY user_id, symptom, cycle_day
+'''
+
+
+USER_ROLLUPS_SQL = '''
+    SELECT symptom, cycle_day, count, severe FROM symptom_rollups
+    WHERE user_id = ? ORDER BY symptom, cycle_day
+'''
+
+POPULATION_SQL = '''
+    SELECT symptom, cycle_day, SUM(count), SUM(severe), COUNT(*)
+    FROM symptom_rollups {where}
+    GROUP BY symptom, cycle_day
+'''
+
+
+def record_symptoms(conn, rows):
+    """Add (user_id, symptom, day, severity) rows, as just inserted, to the rollups"""
+    conn.executemany(RECORD_SQL, [
+        (user_id, symptom, int(severity == 'severe'), day, user_id, day)
+        for user_id, symptom, day, severity in rows
+    ])
+
+
+def rebuild_user(conn, user_id):
+    """Recompute one user's rollups from their symptoms (after a new period start)"""
+    conn.execute("DELETE FROM symptom_rollups WHERE user_id = ?", (user_id,))
+    conn.execute(REBUILD_SQL.format(where="WHERE s.user_id = ?"), (user_id,))
+
+
+def backfill(conn):
+    """Recompute the rollups for every user in one pass over symptoms"""
+    conn.execute("DELETE FROM symptom_rollups")
+    conn.execute(REBUILD_SQL.format(where=''))
+    return conn.execute("SELECT COUNT(*) FROM symptom_rollups").fetchone()[0]
+
+
+def phase_of(cycle_day, cycle_length=28, period_duration=5):
+    """Cycle phase for a 1-based cycle day"""
+    if cycle_day <= period_duration:
+        return 'menstrual'
+    # Ovulation is about 14 days before the next period
+    ovulation_day = cycle_length - 13
+    if abs(cycle_day - ovulation_day) <= 1:
+        return 'ovulation'
+    return 'follicular' if cycle_day < ovulation_day else 'luteal'
+
+
+def _insight(symptom, peak_day, cycle_length, period_duration):
+    days_before = cycle_length - peak_day + 1
+    plural = symptom if symptom.endswith('s') else symptom + 's'
+    if peak_day <= period_duration:
+        return f"Your {plural} cluster on day {peak_day} of your period"
+    if 1 <= days_before <= 7:
+        return (f"Your {plural} cluster {days_before} day{'s' if days_before > 1 else ''} "
+                f"before your period")
+    phase = phase_of(peak_day, cycle_length, period_duration)
+    return f"Your {plural} cluster around day {peak_day} of your cycle ({phase} phase)"
+
+
+def user_analytics(conn, user_id, cycle_length=28, period_duration=5):
+    """Per-symptom breakdown by cycle day and phase, read from the rollups"""
+    rows = conn.execute(USER_ROLLUPS_SQL, (user_id,)).fetchall()
+    symptoms = {}
+    for symptom, cycle_day, count, severe in rows:
+        entry = symptoms.setdefault(symptom, {
+            "total": 0, "severe": 0, "by_phase": dict.fromkeys(PHASES, 0), "by_cycle_day": {}
+        })
+        entry["total"] += count
+        entry["severe"] += severe
+        entry["by_phase"][phase_of(cycle_day, cycle_length, period_duration)] += count
+        entry["by_cycle_day"][cycle_day] = count
+
+    insights = []
+    for symptom, entry in symptoms.items():
+        peak_day = max(entry["by_cycle_day"], key=entry["by_cycle_day"].get)
+        entry["peak_cycle_day"] = peak_day
+        entry["peak_phase"] = max(entry["by_phase"], key=entry["by_phase"].get)
+        if entry["total"] >= MIN_INSIGHT_LOGS:
+            insights.append(_insight(symptom, peak_day, cycle_length, period_duration))
+    return {"symptoms": symptoms, "insights": insights}
+
+
+def population(conn, symptom=None):
+    """{symptom: {cycle_day: (count, severe, users)}} across all users of a shard"""
+    if symptom:
+        rows = conn.execute(POPULATION_SQL.format(where="WHERE symptom = ?"), (symptom,))
+    else:
+        rows = conn.execute(POPULATION_SQL.format(where=''))
+    result = {}
+    for name, cycle_day, count, severe, users in rows:
+        result.setdefault(name, {})[cycle_day] = (count, severe, users)
+    return result
+
+
+def merge_population(parts):
+    """Combine population() results from several shards into a report"""
+    merged = {}
+    for part in parts:
+        for symptom, days in part.items():
+            target = merged.setdefault(symptom, {})
+            for cycle_day, values in days.items():
+                previous = target.get(cycle_day, (0, 0, 0))
+                target[cycle_day] = tuple(a + b for a, b in zip(previous, values))
+    report = {}
+    for symptom, days in merged.items():
+        by_phase = dict.fromkeys(PHASES, 0)
+        for cycle_day, (count, _, _) in days.items():
+            by_phase[phase_of(cycle_day)] += count
+        report[symptom] = {
+            "total": sum(v[0] for v in days.values()),
+            "severe": sum(v[1] for v in days.values()),
+            "by_phase": by_phase,
+            "by_cycle_day": {day: {"count": v[0], "severe": v[1], "users": v[2]}
+                             for day, v in sorted(days.items())},
+        }
+    return report
+
+
+def user_report(conn, user_id, user_row):
+    """user_analytics with the user's estimated cycle length and period duration"""
+    cycle_length = user_estimate(conn, user_id, user_row[2] if user_row else None).cycle_length
+    period_duration = (user_row[3] if user_row else None) or 5
+    report = user_analytics(conn, user_id, cycle_length, period_duration)
+    report["cycle_length"] = cycle_length
+    report["period_duration"] = period_duration
+    return report
+
+
+if __name__ == '__main__':
+    from migrations import migrate
+    from storage import db
+
+    parser = argparse.ArgumentParser(description="Symptom rollup maintenance")
+    parser.add_argument('command', choices=['backfill'])
+    parser.add_argument('--db', help="Database path (default: PERIOD_TRACKER_DB)")
+    args = parser.parse_args()
+    if args.db:
+        db.configure(args.db)
+    migrate(db)
+    for shard in db.shards:
+        with shard.transaction() as conn:
+            print(f"{shard.path}: {backfill(conn)} rollup rows")
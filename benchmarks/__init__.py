@@ -0,0 +1,4 @@
+"""Benchmarks and load tests for the period tracker API
+
+Run modules from the repository root, e.g. ``python -m benchmarks.micro``.
+"""
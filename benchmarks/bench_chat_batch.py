@@ -0,0 +1,74 @@
+"""Benchmark: N single /chat calls vs one /chat/batch call
+
+Runs against a throwaway database through the Flask test client.
+
+Usage: python benchmarks/bench_chat_batch.py [--messages N] [--users U]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MESSAGES = [
+    "hello", "I have cramps", "When is my next period?", "feeling tired",
+    "what is pms", "when do i ovulate", "headache and bloating", "set reminder",
+]
+
+
+def check_failed_item(client):
+    """A failing item must not change what later items for the same user see"""
+    replies = []
+    for user_id, middle in (("check-clean", "hello"), ("check-failed", 5)):
+        items = [{"user_id": user_id, "message": message}
+                 for message in ("My period started today", middle, "When is my next period?")]
+        results = client.post('/chat/batch', json={"items": items}).json['results']
+        replies.append(results[-1]['data']['response'])
+    assert results[1]['status'] == 'error', results
+    assert replies[0] == replies[1], replies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100)
+    parser.add_argument('--users', type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['PERIOD_TRACKER_DB'] = os.path.join(tmpdir, 'bench.db')
+    # Time the handlers, not the rate limiter
+    os.environ.setdefault('ADMISSION_CONTROL', 'false')
+    import API_Chatbot
+
+    API_Chatbot.CHAT_BATCH_MAX_SIZE = max(API_Chatbot.CHAT_BATCH_MAX_SIZE, args.messages)
+    client = API_Chatbot.app.test_client()
+    check_failed_item(client)
+    items = [
+        {"user_id": f"user{i % args.users}", "message": MESSAGES[i % len(MESSAGES)],
+         "client_timestamp": "2024-01-01T12:00:00"}
+        for i in range(args.messages)
+    ]
+
+    start = time.perf_counter()
+    for item in items:
+        response = client.post('/chat', json=item)
+        assert response.status_code == 200, response.json
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = client.post('/chat/batch', json={"items": items})
+    batch = time.perf_counter() - start
+    assert response.status_code == 200, response.json
+    results = response.json['results']
+    assert all(r['status'] == 'success' for r in results), results
+
+    print(f"{args.messages} messages for {args.users} users")
+    print(f"single calls : {single * 1000:8.1f} ms ({single / args.messages * 1e6:7.0f} us/message)")
+    print(f"one batch    : {batch * 1000:8.1f} ms ({batch / args.messages * 1e6:7.0f} us/message)")
+    print(f"speedup      : {single / batch:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark: repeat polls of /user and /history with and without conditional GETs
+
+Fills a throwaway database with chat history and symptoms for a few users,
+then polls each route three ways through the Flask test client: a full
+rebuild every time (body cache off), a cached body for the unchanged
+version, and If-None-Match with the previous ETag (304).
+
+Usage: python benchmarks/bench_conditional_get.py [--users U] [--messages N] [--polls P]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MESSAGES = ["hello", "I have cramps", "my period started", "severe headache since monday",
+            "When is my next period?", "feeling tired and bloated"]
+ROUTES = ['/user/{}', '/history/{}?limit=50', '/analytics/{}']
+
+
+def poll(client, paths, polls, headers=None):
+    """Seconds per request over polls rounds of paths"""
+    start = time.perf_counter()
+    for _ in range(polls):
+        for path in paths:
+            response = client.get(path, headers=headers(path) if headers else None)
+            assert response.status_code in (200, 304), response.status_code
+    return (time.perf_counter() - start) / (polls * len(paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=200, help="Chat messages per user")
+    parser.add_argument('--polls', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ['PERIOD_TRACKER_DB'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # Time the handlers, not the rate limiter
+    os.environ.setdefault('ADMISSION_CONTROL', 'false')
+    import API_Chatbot
+
+    API_Chatbot.CHAT_BATCH_MAX_SIZE = max(API_Chatbot.CHAT_BATCH_MAX_SIZE, args.messages)
+    client = API_Chatbot.app.test_client()
+    for u in range(args.users):
+        items = [{"user_id": f"user{u}", "message": MESSAGES[i % len(MESSAGES)]}
+                 for i in range(args.messages)]
+        response = client.post('/chat/batch', json={"items": items})
+        assert response.status_code == 200, response.json
+
+    body_cache = API_Chatbot.body_cache
+    print(f"{args.users} users x {args.messages} messages, {args.polls} polls per URL")
+    print(f"{'route':<22}{'rebuild':>12}{'cached body':>14}{'304':>12}{'speedup':>10}")
+    for route in ROUTES:
+        paths = [route.format(f"user{u}") for u in range(args.users)]
+        size = body_cache.max_size
+        body_cache.max_size = 0
+        rebuild = poll(client, paths, args.polls)
+        body_cache.max_size = size
+        poll(client, paths, 1)
+        cached = poll(client, paths, args.polls)
+        etags = {path: client.get(path).headers['ETag'] for path in paths}
+        not_modified = poll(client, paths, args.polls,
+                            headers=lambda path: {'If-None-Match': etags[path]})
+        print(f"{route.format('<id>'):<22}{rebuild * 1e6:>9.0f} us{cached * 1e6:>11.0f} us"
+              f"{not_modified * 1e6:>9.0f} us{rebuild / not_modified:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
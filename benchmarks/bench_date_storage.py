@@ -0,0 +1,174 @@
+"""Benchmark: ISO text vs integer date storage (migration 10)
+
+Generates data with datagen, then builds the same rows in the pre-migration
+layout (ISO text dates, schema version 9). It reports table and index sizes
+from dbstat and prediction throughput, runs migration 10 on that copy,
+checks the result equals the generated data, and reports again.
+
+Usage: python benchmarks/bench_date_storage.py [--users N] [--symptoms N] [--messages N]
+"""
+from datetime import datetime, timedelta
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import generate  # noqa: E402
+from dates import from_day, from_stamp  # noqa: E402
+from migrations import MIGRATIONS  # noqa: E402
+from predictions import MAX_HISTORY, estimate_cycle  # noqa: E402
+from redate import DAY_SQL, TABLES, finish  # noqa: E402
+from storage import Database  # noqa: E402
+
+USER_SQL = "SELECT user_id, last_period_date, cycle_length FROM users"
+STARTS_SQL = '''
+    SELECT start_date FROM period_events WHERE user_id = ?
+    ORDER BY start_date DESC LIMIT ?
+'''
+# The query behind predictions.predict_all, before and after
+PREDICT_SQL = '''
+    SELECT e.user_id, {day}, COALESCE(u.cycle_length, 28)
+    FROM period_events e LEFT JOIN users u ON u.user_id = e.user_id
+    ORDER BY e.user_id, e.start_date
+'''
+LEGACY_DAY = "CAST(julianday(e.start_date) - 1721424.5 AS INTEGER)"
+
+
+def legacy_next_period(last_period_date, cycle_length=28):
+    """calculate_next_period as it was for ISO text dates"""
+    try:
+        last_date = datetime.strptime(last_period_date, '%Y-%m-%d')
+        return (last_date + timedelta(days=cycle_length)).strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def legacy_ovulation(last_period_date, cycle_length=28):
+    try:
+        last_date = datetime.strptime(last_period_date, '%Y-%m-%d')
+        return (last_date + timedelta(days=cycle_length - 14)).strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def legacy_estimate(start_dates, fallback_length=None):
+    return estimate_cycle([datetime.strptime(d, '%Y-%m-%d').toordinal() for d in start_dates],
+                          fallback_length)
+
+
+def sizes(conn):
+    """{table: (table bytes, index bytes, rows, average payload bytes per row)}"""
+    pages = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    result = {}
+    for table in TABLES:
+        indexes = [row[1] for row in conn.execute(f"PRAGMA index_list({table})")]
+        rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        payload = conn.execute(
+            "SELECT SUM(payload) FROM dbstat WHERE name = ? AND pagetype = 'leaf'", (table,)
+        ).fetchone()[0] or 0
+        result[table] = (pages.get(table, 0), sum(pages.get(i, 0) for i in indexes),
+                         rows, payload / rows if rows else 0.0)
+    return result
+
+
+def per_user(conn, users, next_period, ovulation, estimate):
+    """Seconds per user for the /user prediction path: starts, estimate, next, ovulation"""
+    start = time.perf_counter()
+    for user_id, last, stored in users:
+        starts = [r[0] for r in conn.execute(STARTS_SQL, (user_id, MAX_HISTORY))]
+        cycle = estimate(starts, stored).cycle_length
+        next_period(last, cycle)
+        ovulation(last, cycle)
+    return (time.perf_counter() - start) / len(users)
+
+
+def best_of(repeat, fn, *args):
+    return min(fn(*args) for _ in range(repeat))
+
+
+def query_time(conn, sql):
+    start = time.perf_counter()
+    conn.execute(sql).fetchall()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--symptoms', type=int, default=200000)
+    parser.add_argument('--messages', type=int, default=500000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    ints = Database(os.path.join(tmpdir, 'ints.db'))
+    counts = generate(ints, args.users, args.symptoms, args.messages)
+    ints.close_all()
+
+    conn = sqlite3.connect(os.path.join(tmpdir, 'text.db'), isolation_level=None)
+    conn.create_function('iso_day', 1, from_day, deterministic=True)
+    conn.create_function('iso_stamp', 1, from_stamp, deterministic=True)
+    conn.execute("BEGIN")
+    for version, _, fn in MIGRATIONS:
+        if version < 10:
+            fn(conn)
+    conn.execute("PRAGMA user_version = 9")
+    conn.execute("ATTACH DATABASE ? AS ints", (ints.path,))
+    for table, spec in TABLES.items():
+        columns = [row[1] for row in conn.execute(f"PRAGMA ints.table_info({table})")]
+        values = [(f"iso_day({c})" if spec['convert'][c] is DAY_SQL else f"iso_stamp({c})")
+                  if c in spec['convert'] else c for c in columns]
+        conn.execute(f"INSERT INTO main.{table} ({', '.join(columns)}) "
+                     f"SELECT {', '.join(values)} FROM ints.{table}")
+    conn.execute("COMMIT")
+    conn.execute("DETACH DATABASE ints")
+    conn.execute("VACUUM")
+
+    before = sizes(conn)
+    users = conn.execute(USER_SQL).fetchall()
+    legacy_user = best_of(3, per_user, conn, users, legacy_next_period, legacy_ovulation,
+                          legacy_estimate)
+    legacy_batch = best_of(3, query_time, conn, PREDICT_SQL.format(day=LEGACY_DAY))
+
+    start = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    finish(conn)
+    conn.execute("PRAGMA user_version = 10")
+    conn.execute("COMMIT")
+    migrated = time.perf_counter() - start
+    conn.execute("VACUUM")
+
+    conn.execute("ATTACH DATABASE ? AS ints", (ints.path,))
+    for table in TABLES:
+        differing = conn.execute(f"SELECT COUNT(*) FROM (SELECT * FROM main.{table} "
+                                 f"EXCEPT SELECT * FROM ints.{table})").fetchone()[0]
+        assert differing == 0, f"{table}: {differing} rows differ after migration"
+    conn.execute("DETACH DATABASE ints")
+
+    after = sizes(conn)
+    users = conn.execute(USER_SQL).fetchall()
+    next_period = lambda last, cycle: last + cycle  # noqa: E731
+    ovulation = lambda last, cycle: last + cycle - 14  # noqa: E731
+    int_user = best_of(3, per_user, conn, users, next_period, ovulation, estimate_cycle)
+    int_batch = best_of(3, query_time, conn, PREDICT_SQL.format(day='e.start_date'))
+
+    print(f"rows: {counts}; migration 10 took {migrated:.2f}s")
+    print(f"{'table':<14}{'rows':>9}{'row bytes':>18}{'table MB':>18}{'index MB':>18}")
+    for table in TABLES:
+        (t0, i0, rows, p0), (t1, i1, _, p1) = before[table], after[table]
+        print(f"{table:<14}{rows:>9}{p0:>8.1f} -> {p1:>5.1f}{t0 / 1e6:>9.2f} -> {t1 / 1e6:>5.2f}"
+              f"{i0 / 1e6:>9.2f} -> {i1 / 1e6:>5.2f}")
+    total0 = sum(t + i for t, i, _, _ in before.values())
+    total1 = sum(t + i for t, i, _, _ in after.values())
+    print(f"{'total':<14}{'':>27}{total0 / 1e6:>9.2f} -> {total1 / 1e6:>5.2f} MB "
+          f"({(1 - total1 / total0) * 100:.1f}% smaller)")
+    print(f"per-user predictions : {1 / legacy_user:>10,.0f} -> {1 / int_user:>10,.0f} users/s "
+          f"({legacy_user / int_user:.2f}x)")
+    print(f"predict_all query    : {legacy_batch * 1000:>10.1f} -> {int_batch * 1000:>10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Report: chat_history size before and after template deduplication
+
+Builds a synthetic chat_history in the pre-template format (every reply
+stored as rendered text), measures the database, then runs the template
+migration and VACUUM and measures again.
+
+Usage: python benchmarks/bench_history_size.py [--rows N] [--users U]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import MIGRATIONS  # noqa: E402
+from responses import TEMPLATES, dedupe_responses  # noqa: E402
+
+# Rough intent mix seen on /chat; None is a free-form (non-templated) reply
+REPLY_MIX = [
+    ('greeting@1', 20), ('unknown@1', 25), ('pms@1', 10), ('pain_relief@1', 10),
+    ('set_reminder@1', 5), ('symptoms_prompt@1', 5), (None, 25),
+]
+
+
+def db_size(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=5000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'history.db')
+    conn = sqlite3.connect(path, isolation_level=None)
+    # Schema as it was before the template migration
+    conn.execute("BEGIN")
+    for version, _, fn in MIGRATIONS:
+        if version < 6:
+            fn(conn)
+    conn.execute("PRAGMA user_version = 5")
+
+    random.seed(42)
+    choices, weights = zip(*REPLY_MIX)
+    rows = []
+    for i in range(args.rows):
+        template_id = random.choices(choices, weights)[0]
+        reply = TEMPLATES[template_id] if template_id else (
+            f"✅ I've logged your symptoms: cramps\n\nNext period around 2024-{i % 12 + 1:02d}-15")
+        rows.append((f"user{random.randrange(args.users)}", "synthetic message", reply,
+                     f"2024-01-01T00:00:{i % 60:02d}.{i:06d}"))
+    conn.executemany('''
+        INSERT INTO chat_history (user_id, user_message, bot_response, timestamp)
+        VALUES (?, ?, ?, ?)
+    ''', rows)
+    conn.execute("COMMIT")
+    conn.execute("VACUUM")
+    before = db_size(conn)
+
+    start = time.perf_counter()
+    conn.execute("BEGIN")
+    for version, _, fn in MIGRATIONS:
+        if version == 6:
+            fn(conn)
+    conn.execute("COMMIT")
+    migrated = time.perf_counter() - start
+    conn.execute("VACUUM")
+    after = db_size(conn)
+
+    templated = conn.execute(
+        "SELECT COUNT(*) FROM chat_history WHERE template_id IS NOT NULL").fetchone()[0]
+    print(f"{args.rows} chat_history rows, {templated} stored as templates")
+    print(f"before : {before / 1e6:8.1f} MB")
+    print(f"after  : {after / 1e6:8.1f} MB")
+    print(f"saved  : {(1 - after / before) * 100:8.1f} %  (migration took {migrated:.2f}s)")
+
+    # The dedup pass is idempotent
+    conn.execute("BEGIN")
+    assert dedupe_responses(conn) == 0
+    conn.execute("COMMIT")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Micro-benchmark: legacy re.search loop vs the compiled intent classifier
+
+First checks that the classifier answers like re.search over every
+registered pattern, for the built-in intents plus EXTRA_INTENTS (grouped,
+repeated and lookaround patterns), and that patterns the combined
+matcher can't hold are rejected.
+
+Usage: python benchmarks/bench_intents.py [--iterations N]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intents import INTENT_PATTERNS, IntentClassifier  # noqa: E402
+
+# Messages as sent by the mobile client, plus misses that hit every pattern
+CORPUS = [
+    "hello", "Hi there!", "hey", "Good morning", "good afternoon :)",
+    "My period started today", "period began this morning", "I got my period",
+    "started my period", "starting period", "menstruation began",
+    "log period today", "log period now", "period date today",
+    "My period ended", "period finished yesterday", "ended my period",
+    "When is my next period?", "next period date", "predict my period",
+    "when will i get my period", "period prediction please",
+    "I have cramps", "headache and bloating", "I have terrible back pain",
+    "feeling tired", "I feel awful", "symptoms", "logging symptoms",
+    "log symptom", "nausea since morning", "fatigue",
+    "my cycle length", "average cycle", "how many cycle days",
+    "how long is my cycle", "What is PMS?", "premenstrual syndrome",
+    "pms symptoms", "before period symptoms", "how to relieve cramps",
+    "how to reduce pain", "pain relief", "cramp relief", "what helps with cramps",
+    "When do I ovulate?", "ovulation date", "fertile window",
+    "ovulation calculator", "set reminder", "remind me tomorrow",
+    "notification settings", "alert me before period",
+    "Cramps", "Headache", "Bloating", "Mood swings", "Fatigue",
+    "Period start", "Ovulation", "Medication", "Symptoms",
+    "yes", "no", "ok", "thanks", "what can you do",
+    "tell me something", "I'm not sure", "can you help",
+    "this is a long message that does not mention anything relevant at all "
+    "and just keeps going to make the unknown path pay for every pattern",
+]
+
+# Registered after the built-ins for the equivalence check only
+EXTRA_INTENTS = {
+    'hydration': [r'(drink|drank) (more )?water', r'\bthirst(y)?\b'],
+    'sleep': [r'(can\'t|cannot) sleep', r'(?<!good )night(s)?(?! out)'],
+    'mood': [r'(mood|moody)+', r'(?:feel|feeling) (?:sad|low)', r'[a-z]+ swings'],
+}
+EXTRA_CORPUS = [
+    "I drank water", "so thirsty", "thirst", "can't sleep", "cannot sleep at night",
+    "good night", "nights are hard", "night out", "moody", "feeling low",
+    "i feel sad", "mood swings", "temperature swings",
+]
+# Backreferences and named groups change meaning inside the combined matcher
+REJECTED = [r'(\w)\1\1', r'(?P<word>hi)', r'(a)?(?(1)b|c)']
+
+
+def legacy_detect_intent(message, intent_patterns=INTENT_PATTERNS):
+    """The original nested loop from PeriodTrackerChatbot.detect_intent"""
+    message_lower = message.lower()
+    for intent, patterns in intent_patterns.items():
+        for pattern in patterns:
+            if re.search(pattern, message_lower):
+                return intent
+    return 'unknown'
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for message in CORPUS:
+            fn(message)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    classifier = IntentClassifier(INTENT_PATTERNS)
+
+    extended = IntentClassifier(INTENT_PATTERNS)
+    for intent, patterns in EXTRA_INTENTS.items():
+        extended.register(intent, patterns)
+    all_patterns = {**INTENT_PATTERNS, **EXTRA_INTENTS}
+    mismatches = [
+        (m, legacy_detect_intent(m, all_patterns), extended.classify(m))
+        for m in CORPUS + EXTRA_CORPUS
+        if legacy_detect_intent(m, all_patterns) != extended.classify(m)
+    ]
+    for pattern in REJECTED:
+        try:
+            extended.register('rejected', pattern)
+        except ValueError:
+            continue
+        mismatches.append((pattern, 'rejected', 'registered'))
+    if mismatches:
+        for message, old, new in mismatches:
+            print(f"MISMATCH {message!r}: legacy={old} compiled={new}")
+        sys.exit(1)
+    print(f"{len(CORPUS + EXTRA_CORPUS)} messages: legacy and compiled intents identical")
+
+    total = args.iterations * len(CORPUS)
+    legacy = timed(legacy_detect_intent, args.iterations)
+    compiled = timed(classifier.classify, args.iterations)
+    print(f"legacy   : {legacy / total * 1e6:8.2f} us/message")
+    print(f"compiled : {compiled / total * 1e6:8.2f} us/message")
+    print(f"speedup  : {legacy / compiled:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
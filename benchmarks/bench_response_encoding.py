@@ -0,0 +1,102 @@
+"""Benchmark: serialization CPU and bytes on the wire for hot response bodies
+
+Builds real payloads through the Flask test client (static and dynamic
+/chat replies, /history and /user pages), then times building the
+response per body: jsonify as the routes used it, json_response, and for
+/chat the spliced chat_body. --stdlib hides orjson to time the fallback
+encoder. It also reports body sizes as jsonify wrote them (ASCII
+escapes), as dumps writes them, and gzip/deflate compressed, with the time the
+compression takes.
+
+Usage: python benchmarks/bench_response_encoding.py [--messages N] [--repeat R] [--stdlib]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MESSAGES = ["hello", "I have cramps", "my period started", "what is pms",
+            "What helps with period pain?", "severe headache since monday"]
+
+
+def per_call(repeat, fn, *args):
+    """Best-of-3 seconds per call of fn(*args)"""
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(*args)
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200, help="Chat messages in the history")
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--stdlib', action='store_true', help="Don't use orjson")
+    args = parser.parse_args()
+    if args.stdlib:
+        sys.modules['orjson'] = None
+
+    os.environ['PERIOD_TRACKER_DB'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['ADMISSION_CONTROL'] = 'false'
+    import API_Chatbot
+    import encoding
+    from encoding import chat_body, compress, dumps, json_response
+    from flask import Response, jsonify
+
+    app = API_Chatbot.app
+    chatbot = API_Chatbot.chatbot
+    client = app.test_client()
+    API_Chatbot.CHAT_BATCH_MAX_SIZE = max(API_Chatbot.CHAT_BATCH_MAX_SIZE, args.messages)
+    items = [{"user_id": "bench", "message": MESSAGES[i % len(MESSAGES)]}
+             for i in range(args.messages)]
+    assert client.post('/chat/batch', json={"items": items}).status_code == 200
+
+    chats = {f"/chat {m!r}": chatbot.process_message(m, "bench")
+             for m in ("what is pms", "hello", "I have cramps")}
+    pages = {
+        "/history limit=50": json.loads(client.get('/history/bench?limit=50').data),
+        "/history limit=200": json.loads(client.get('/history/bench?limit=200').data),
+        "/user": json.loads(client.get('/user/bench').data),
+    }
+
+    def spliced(result):
+        return Response(chat_body(result), mimetype='application/json')
+
+    print(f"encoder: {'orjson' if encoding.orjson else 'stdlib'}")
+    print(f"{'body':<26}{'jsonify':>10}{'json_resp':>11}{'spliced':>10}   (us per response)")
+    with app.app_context():
+        for name, result in chats.items():
+            envelope = {"status": "success", "data": result}
+            print(f"{name:<26}{per_call(args.repeat, jsonify, envelope) * 1e6:>10.1f}"
+                  f"{per_call(args.repeat, json_response, envelope) * 1e6:>11.1f}"
+                  f"{per_call(args.repeat, spliced, result) * 1e6:>10.1f}")
+        for name, payload in pages.items():
+            repeat = max(args.repeat // 20, 10)
+            print(f"{name:<26}{per_call(repeat, jsonify, payload) * 1e6:>10.1f}"
+                  f"{per_call(repeat, json_response, payload) * 1e6:>11.1f}{'-':>10}")
+
+        print(f"\n{'body':<26}{'jsonify':>9}{'dumps':>9}{'gzip':>9}{'deflate':>9}"
+              f"{'gzip time':>12}   (bytes)")
+        bodies = {name: ({"status": "success", "data": result}, chat_body(result))
+                  for name, result in chats.items()}
+        bodies.update({name: (payload, dumps(payload)) for name, payload in pages.items()})
+        for name, (payload, body) in bodies.items():
+            ascii_body = jsonify(payload).get_data()
+            gzipped = compress(body, 'gzip', API_Chatbot.COMPRESS_LEVEL)
+            deflated = compress(body, 'deflate', API_Chatbot.COMPRESS_LEVEL)
+            repeat = max(args.repeat // 20, 10)
+            gzip_time = per_call(repeat, compress, body, 'gzip', API_Chatbot.COMPRESS_LEVEL)
+            note = '' if len(body) >= API_Chatbot.COMPRESS_MIN_SIZE else '  (under threshold)'
+            print(f"{name:<26}{len(ascii_body):>9}{len(body):>9}{len(gzipped):>9}"
+                  f"{len(deflated):>9}{gzip_time * 1e6:>9.1f} us{note}")
+
+
+if __name__ == '__main__':
+    main()
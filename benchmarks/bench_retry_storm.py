@@ -0,0 +1,85 @@
+"""Benchmark: write amplification of retry storms with and without Idempotency-Key
+
+Sends --writes logical POST /chat messages ("I have cramps", which logs a
+symptom and a chat_history row), each one --retries times at once from a
+thread pool, as a client does when responses get lost. Rows added to
+symptoms and chat_history per logical write give the write amplification.
+
+Scenarios: no key; a key with the in-memory store only; a key with the
+SQLite table as well; and the SQLite table alone (memory store size 0),
+which is what retries landing on other worker processes see.
+
+Usage: python benchmarks/bench_retry_storm.py [--writes N] [--retries R] [--threads T]
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = [
+    # name, send a key, persist, memory store size
+    ('no key', False, False, 10000),
+    ('key, memory', True, False, 10000),
+    ('key, memory + sqlite', True, True, 10000),
+    ('key, sqlite only', True, True, 0),
+]
+
+
+def row_count(db):
+    total = 0
+    for shard in db.shards:
+        with shard.read() as conn:
+            total += conn.execute("SELECT (SELECT COUNT(*) FROM symptoms) "
+                                  "+ (SELECT COUNT(*) FROM chat_history)").fetchone()[0]
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writes', type=int, default=500)
+    parser.add_argument('--retries', type=int, default=5, help="Copies sent of each write")
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    os.environ['PERIOD_TRACKER_DB'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # Every copy must reach the handler
+    os.environ['ADMISSION_CONTROL'] = 'false'
+    import API_Chatbot
+    from storage import db
+
+    app = API_Chatbot.app
+    store = API_Chatbot.idempotency
+
+    def send(scenario, write, use_key):
+        headers = {'Idempotency-Key': f'{scenario}-{write}'} if use_key else None
+        response = app.test_client().post(
+            '/chat', json={"user_id": f"{scenario}-user{write % 50}", "message": "I have cramps"},
+            headers=headers)
+        assert response.status_code == 200, response.status_code
+
+    print(f"{args.writes} writes x {args.retries} copies, {args.threads} threads")
+    print(f"{'scenario':<24}{'rows/write':>12}{'amplification':>15}{'per request':>14}")
+    with ThreadPoolExecutor(args.threads) as pool:
+        for index, (name, use_key, persist, size) in enumerate(SCENARIOS):
+            store.persist, store.max_size = persist, size
+            store.clear()
+            before = row_count(db)
+            start = time.perf_counter()
+            futures = [pool.submit(send, index, write, use_key)
+                       for write in range(args.writes) for _ in range(args.retries)]
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - start
+            rows = (row_count(db) - before) / args.writes
+            # "I have cramps" writes one symptoms row and one chat_history row
+            print(f"{name:<24}{rows:>12.2f}{rows / 2:>14.2f}x"
+                  f"{elapsed / (args.writes * args.retries) * 1e6:>11.0f} us")
+    print(f"store: {store.stats()}")
+
+
+if __name__ == '__main__':
+    main()
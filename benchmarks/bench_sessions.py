@@ -0,0 +1,104 @@
+"""Benchmark: SessionStore memory and throughput at 100k concurrent sessions
+
+Fills a store with one session per user, cycling through the turns
+process_message records, and reports the traced memory per session, get
+and set throughput from several threads, and follow-up resolution cost.
+Then it writes twice as many users into a store capped at --sessions to
+show LRU eviction, and lets a short-TTL store expire.
+
+Usage: python benchmarks/bench_sessions.py [--sessions N] [--threads T]
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing the app migrates its database; keep that off the real one
+os.environ['PERIOD_TRACKER_DB'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from API_Chatbot import (PERIOD_ACTIONS, REMINDER_ACTIONS, SYMPTOM_ACTIONS,  # noqa: E402
+                         PeriodTrackerChatbot)
+from sessions import SessionStore  # noqa: E402
+
+# (intent, pending, actions) as process_message records them
+TURNS = [
+    ('period_start', 'log_symptoms', PERIOD_ACTIONS),
+    ('symptoms', 'which_symptoms', SYMPTOM_ACTIONS),
+    ('symptoms', 'medication_reminder', ()),
+    ('set_reminder', 'reminder_kind', REMINDER_ACTIONS),
+    ('greeting', None, ()),
+]
+REPLIES = ["yes", "Cramps", "no", "Period start", "When is my next period?"]
+
+
+def user_ids(count, prefix='user'):
+    return [f"{prefix}{i:08d}" for i in range(count)]
+
+
+def fill(store, users):
+    for i, user_id in enumerate(users):
+        store.set(user_id, *TURNS[i % len(TURNS)])
+
+
+def threaded(threads, fn, users):
+    """Run fn over users split across threads; returns operations per second"""
+    chunks = [users[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=fn, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(users) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=100000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    users = user_ids(args.sessions)
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    store = SessionStore(max_size=args.sessions, ttl=600)
+    fill(store, users)
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    set_rate = threaded(args.threads, lambda chunk: fill(store, chunk), users)
+    get_rate = threaded(args.threads, lambda chunk: [store.get(u) for u in chunk], users)
+
+    chatbot = PeriodTrackerChatbot()
+    samples = [(REPLIES[i % len(REPLIES)], store.get(u)) for i, u in enumerate(users)]
+    start = time.perf_counter()
+    for message, session in samples:
+        chatbot.resolve_follow_up(message, chatbot.detect_intent(message), session)
+    resolve = (time.perf_counter() - start) / len(samples)
+
+    capped = SessionStore(max_size=args.sessions, ttl=600)
+    fill(capped, users + user_ids(args.sessions, 'other'))
+    expiring = SessionStore(max_size=args.sessions, ttl=0.05)
+    fill(expiring, users)
+    time.sleep(0.1)
+    expired = sum(expiring.get(u) is None for u in users)
+
+    print(f"{args.sessions:,} sessions, {args.threads} threads")
+    print(f"memory              : {used / 1e6:.1f} MB ({used / args.sessions:.0f} bytes/session, "
+          f"keys excluded)")
+    print(f"set                 : {set_rate:,.0f} ops/s")
+    print(f"get                 : {get_rate:,.0f} ops/s")
+    print(f"classify + resolve  : {resolve * 1e6:.1f} us per reply")
+    stats = capped.stats()
+    print(f"2x over capacity    : size {stats['size']:,}, evictions {stats['evictions']:,}")
+    print(f"after TTL           : {expired:,} of {args.sessions:,} expired")
+
+
+if __name__ == '__main__':
+    main()
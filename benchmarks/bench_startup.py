@@ -0,0 +1,149 @@
+"""Benchmark: time from process start to first served request under gunicorn
+
+Starts gunicorn with and without preload (PRELOAD_APP), on a fresh
+database and on one already at the latest schema. It reports the median
+time from spawning the process to the first 200 from /user/<id>, which
+needs a worker and a database connection, and the summed proportional set
+size (PSS) of the master and workers once they have served a request.
+It also times migrate() on a current database against the previous
+one-transaction-per-migration check.
+
+Usage: python benchmarks/bench_startup.py [--workers W] [--runs N] [--shards S]
+"""
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import MIGRATIONS, migrate, schema_version  # noqa: E402
+from storage import ShardedDatabase  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def first_response(port, path, timeout=60.0):
+    """Poll until path answers 200; returns the monotonic time it did"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            if response.status == 200:
+                return time.monotonic()
+        except OSError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError(f"No 200 from {path} on port {port}")
+
+
+def children(pid):
+    """Worker pids of a gunicorn master (Linux /proc)"""
+    found = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        found.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return found
+
+
+def pss_mb(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                total += sum(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+        except OSError:
+            return None
+    return total / 1024
+
+
+def start_once(db_path, shards, preload, workers, port):
+    """(seconds to first served request, PSS MB of master + workers)"""
+    env = dict(os.environ, PERIOD_TRACKER_DB=db_path, PERIOD_TRACKER_SHARDS=str(shards),
+               PRELOAD_APP=str(preload), ADMISSION_CONTROL='false')
+    if workers > 1:
+        env['USER_CACHE_SIZE'] = '0'
+    start = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'API_Chatbot:app', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--threads', '4', '--log-level', 'warning'],
+        cwd=ROOT, env=env,
+    )
+    try:
+        served = first_response(port, '/user/bench-user') - start
+        # Let every worker finish booting before measuring memory
+        time.sleep(2)
+        for _ in range(workers * 4):
+            first_response(port, '/user/bench-user')
+        memory = pss_mb([process.pid] + children(process.pid))
+    finally:
+        process.terminate()
+        process.wait()
+    return served, memory
+
+
+def old_migrate_check(database):
+    """The startup check before the fast path: one write transaction per migration"""
+    for shard in database.shards:
+        for version, _, _ in MIGRATIONS:
+            with shard.transaction() as conn:
+                if schema_version(conn) >= version:
+                    continue
+
+
+def best_of(repeat, fn, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8097)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    current = os.path.join(tmpdir, 'current.db')
+    database = ShardedDatabase(current, args.shards)
+    migrate(database)
+    old = best_of(20, old_migrate_check, database)
+    new = best_of(20, migrate, database)
+    database.close_all()
+
+    print(f"{args.workers} workers, {args.shards} shard(s), median of {args.runs} runs")
+    print(f"{'preload':<9}{'database':<10}{'first request':>15}{'PSS':>12}")
+    for preload in (False, True):
+        for state in ('fresh', 'current'):
+            times, memory = [], []
+            for run in range(args.runs):
+                path = current if state == 'current' else os.path.join(
+                    tmpdir, f'fresh-{preload}-{run}.db')
+                served, pss = start_once(path, args.shards, preload, args.workers, args.port)
+                times.append(served)
+                memory.append(pss)
+            pss = f"{statistics.median(memory):>9.0f} MB" if None not in memory else f"{'-':>12}"
+            print(f"{str(preload):<9}{state:<10}{statistics.median(times) * 1000:>12.0f} ms{pss}")
+    print(f"schema check on a current database: {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Micro-benchmark: legacy keyword loop vs the single-pass symptom extractor
+
+Builds a synthetic corpus of symptom messages (synonyms, severities,
+relative dates, negations and filler), then times extraction per message
+and end-to-end logging through process_message on a scratch database.
+
+Usage: python benchmarks/bench_symptoms.py [--messages N] [--logged N]
+"""
+from datetime import date
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entities import SEVERITY_WORDS, SYMPTOM_SYNONYMS, SymptomExtractor  # noqa: E402
+
+LEGACY_KEYWORDS = ['cramps', 'headache', 'bloating', 'back pain', 'breast tenderness',
+                   'mood swings', 'fatigue', 'nausea', 'acne', 'food cravings']
+
+DATES = ['', 'today', 'yesterday', 'since monday', 'since last week', '2 days ago',
+         'for three days', 'last night', 'this morning']
+FILLER = ['I have', 'feeling', 'ugh', 'my', 'really', 'also', 'and', 'so much',
+          'since my period started', 'not sure why', 'lol']
+
+
+def legacy_extract(message):
+    """The original substring loop from the symptoms branch of process_message"""
+    return [s for s in LEGACY_KEYWORDS if s in message.lower()]
+
+
+def corpus(n, seed=3):
+    rng = random.Random(seed)
+    phrases = [p for synonyms in SYMPTOM_SYNONYMS.values() for p in synonyms]
+    severities = [w for words in SEVERITY_WORDS.values() for w in words]
+    messages = []
+    for _ in range(n):
+        parts = []
+        for _ in range(rng.randint(1, 3)):
+            if rng.random() < 0.4:
+                parts.append(rng.choice(severities))
+            if rng.random() < 0.1:
+                parts.append('no')
+            parts.append(rng.choice(phrases))
+            parts.append(rng.choice(DATES))
+            parts.append(rng.choice(FILLER) + rng.choice([',', '', ' and']))
+        messages.append(' '.join(p for p in parts if p))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--logged', type=int, default=5000,
+                        help="Messages sent through process_message")
+    args = parser.parse_args()
+
+    messages = corpus(args.messages)
+    extractor = SymptomExtractor()
+    today = date.today()
+
+    start = time.perf_counter()
+    legacy_found = sum(len(legacy_extract(m)) for m in messages)
+    legacy = time.perf_counter() - start
+    start = time.perf_counter()
+    found = sum(len(extractor.extract(m, today)) for m in messages)
+    single_pass = time.perf_counter() - start
+
+    print(f"{len(messages)} messages, {sum(map(len, messages)) / len(messages):.0f} chars avg")
+    print(f"legacy      : {legacy / len(messages) * 1e6:8.2f} us/message "
+          f"({legacy_found} symptoms, canonical names only)")
+    print(f"single pass : {single_pass / len(messages) * 1e6:8.2f} us/message "
+          f"({found} symptoms with severity and date)")
+    print(f"throughput  : {len(messages) / single_pass:,.0f} messages/s")
+
+    os.environ['PERIOD_TRACKER_DB'] = os.path.join(tempfile.mkdtemp(), 'symptoms.db')
+    import API_Chatbot
+
+    chatbot = API_Chatbot.chatbot
+    start = time.perf_counter()
+    for i, message in enumerate(messages[:args.logged]):
+        chatbot.process_message('I have ' + message, f'user{i % 100}')
+    logged = time.perf_counter() - start
+    print(f"logged      : {args.logged / logged:,.0f} messages/s through process_message")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Synthetic data generator for users, period_events, symptoms and chat_history
+
+Activity per user follows a Zipf-like distribution (--skew), so a few heavy
+users own most of the symptoms and chat history, as in production. Rows are
+streamed into SQLite in chunks, so millions of rows don't need much memory.
+
+Usage: python -m benchmarks.datagen --db bench.db --users 100000 \
+           --symptoms 1000000 --messages 5000000
+"""
+from datetime import date, datetime, timedelta
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dates import to_stamp  # noqa: E402
+from responses import LATEST  # noqa: E402
+
+SYMPTOMS = ['cramps', 'headache', 'bloating', 'back pain', 'breast tenderness',
+            'mood swings', 'fatigue', 'nausea', 'acne', 'food cravings']
+SEVERITIES = ['mild', 'moderate', 'moderate', 'severe']
+MESSAGES = [
+    ("hello", 'greeting'), ("what is pms", 'pms'), ("thanks", 'unknown'),
+    ("set reminder", 'set_reminder'), ("symptoms", 'symptoms_prompt'),
+    ("I have cramps", None), ("When is my next period?", None), ("when do i ovulate", None),
+]
+CHUNK = 50000
+
+
+def user_id(index):
+    return f"user{index:08d}"
+
+
+def skewed_users(n_users, skew, rng):
+    """Endless iterator of user indexes, Zipf-distributed with exponent skew"""
+    cum_weights = list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, n_users + 1)))
+    order = list(range(n_users))
+    rng.shuffle(order)   # heavy users are spread over the id space
+    while True:
+        for rank in rng.choices(range(n_users), cum_weights=cum_weights, k=CHUNK):
+            yield order[rank]
+
+
+def chunked(iterable, size=CHUNK):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def generate(db, users, symptoms, messages, skew=1.1, seed=1, today=None):
+    """Fill db (a storage.Database or ShardedDatabase); returns row counts"""
+    from migrations import migrate
+
+    rng = random.Random(seed)
+    today = today or date.today()
+    migrate(db)
+
+    def user_rows():
+        for i in range(users):
+            cycle = rng.randint(24, 35)
+            last = today - timedelta(days=rng.randint(0, cycle))
+            day = last.toordinal()
+            yield (user_id(i), day, cycle, 5, day - 400, day + cycle, day + cycle - 14)
+
+    def event_rows():
+        for i in range(users):
+            cycle = rng.randint(24, 35)
+            start = today - timedelta(days=cycle * 12)
+            for _ in range(rng.randint(1, 12)):
+                start += timedelta(days=cycle + rng.randint(-3, 3))
+                if start > today:
+                    break
+                yield (user_id(i), start.toordinal(),
+                       to_stamp(datetime.combine(start, datetime.min.time())))
+
+    picks = skewed_users(users, skew, rng)
+    midnight = datetime.combine(today, datetime.min.time())
+
+    def symptom_rows():
+        for _ in range(symptoms):
+            day = today - timedelta(days=rng.randint(0, 730))
+            yield (user_id(next(picks)), rng.choice(SYMPTOMS), rng.choice(SEVERITIES),
+                   day.toordinal(), '')
+
+    def history_rows():
+        for i in range(messages):
+            message, template = rng.choice(MESSAGES)
+            stamp = midnight - timedelta(days=rng.randint(0, 730), seconds=rng.randint(0, 86399))
+            reply = None if template else f"Generated reply {i}"
+            yield (user_id(next(picks)), message, reply, to_stamp(stamp),
+                   LATEST[template] if template else None, None)
+
+    statements = [
+        ('users', '''INSERT OR REPLACE INTO users (user_id, last_period_date, cycle_length,
+                     period_duration, created_at, next_period_date, ovulation_date)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''', user_rows()),
+        ('period_events', '''INSERT OR IGNORE INTO period_events (user_id, start_date, created_at)
+                             VALUES (?, ?, ?)''', event_rows()),
+        ('symptoms', '''INSERT INTO symptoms (user_id, symptom, severity, date, notes)
+                        VALUES (?, ?, ?, ?, ?)''', symptom_rows()),
+        ('chat_history', '''INSERT INTO chat_history (user_id, user_message, bot_response,
+                            timestamp, template_id, template_params)
+                            VALUES (?, ?, ?, ?, ?, ?)''', history_rows()),
+    ]
+    counts = {}
+    for table, sql, rows in statements:
+        counts[table] = 0
+        for chunk in chunked(rows):
+            by_shard = {}
+            for row in chunk:
+                by_shard.setdefault(db.for_user(row[0]), []).append(row)
+            for shard, shard_rows in by_shard.items():
+                with shard.transaction() as conn:
+                    conn.executemany(sql, shard_rows)
+            counts[table] += len(chunk)
+    return counts
+
+
+def main():
+    from storage import db
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help="Database file to fill")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--symptoms', type=int, default=100000)
+    parser.add_argument('--messages', type=int, default=500000)
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent for activity")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    db.configure(args.db)
+    start = time.perf_counter()
+    counts = generate(db, args.users, args.symptoms, args.messages, args.skew, args.seed)
+    elapsed = time.perf_counter() - start
+    total = sum(counts.values())
+    print(f"{args.db}: {counts} in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
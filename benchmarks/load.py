@@ -0,0 +1,162 @@
+"""Concurrent load driver for a local gunicorn instance
+
+Starts ``gunicorn API_Chatbot:app`` on a synthetic database (or targets a
+running server with --url), drives a weighted mix of requests from many
+keep-alive client threads, and reports p50/p95/p99 latency and throughput
+per endpoint and per /chat intent as JSON.
+
+Usage: python -m benchmarks.load --duration 30 --concurrency 16 \
+           --workers 1 --threads 8 --shards 1 --output load.json
+"""
+from urllib.parse import urlsplit
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import generate, user_id  # noqa: E402
+from benchmarks.micro import INTENT_MESSAGES  # noqa: E402
+from benchmarks.results import summarize, write_results  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (weight, endpoint name, method, path template, body factory)
+SCENARIOS = [
+    (50, 'POST /chat', 'POST', '/chat',
+     lambda u, rng: {'user_id': u, 'message': rng.choice(list(INTENT_MESSAGES.values()))}),
+    (15, 'GET /user/<id>', 'GET', '/user/{u}', None),
+    (15, 'GET /history/<id>', 'GET', '/history/{u}', None),
+    (10, 'POST /symptoms/<id>', 'POST', '/symptoms/{u}',
+     lambda u, rng: {'symptom': 'cramps', 'severity': 'mild'}),
+    (5, 'GET /symptoms/<id>', 'GET', '/symptoms/{u}', None),
+    (5, 'POST /update_cycle', 'POST', '/update_cycle',
+     lambda u, rng: {'user_id': u, 'cycle_length': rng.randint(24, 35)}),
+]
+
+
+def wait_for_server(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on {host}:{port} did not come up")
+
+
+def start_gunicorn(db_path, port, workers, threads, shards=1):
+    # Worker processes don't share the user cache, so it is off with several
+    env = dict(os.environ, PERIOD_TRACKER_DB=db_path, PERIOD_TRACKER_SHARDS=str(shards))
+    if workers > 1:
+        env['USER_CACHE_SIZE'] = '0'
+    # Skewed clients would trip per-user rate limits; set ADMISSION_CONTROL=true to include them
+    env.setdefault('ADMISSION_CONTROL', 'false')
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'API_Chatbot:app', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--threads', str(threads), '--log-level', 'warning'],
+        cwd=ROOT, env=env,
+    )
+
+
+def client_loop(host, port, deadline, n_users, seed, samples):
+    rng = random.Random(seed)
+    weights = [s[0] for s in SCENARIOS]
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    while time.monotonic() < deadline:
+        _, name, method, path, body_factory = rng.choices(SCENARIOS, weights)[0]
+        user = user_id(rng.randrange(n_users))
+        body = json.dumps(body_factory(user, rng)) if body_factory else None
+        headers = {'Content-Type': 'application/json'} if body else {}
+        start = time.perf_counter()
+        try:
+            conn.request(method, path.format(u=user), body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            payload, status = b'', 0
+        latency = time.perf_counter() - start
+        intent = None
+        if name == 'POST /chat' and status == 200:
+            intent = json.loads(payload)['data']['intent']
+        samples.append((name, intent, status, latency))
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help="Target a running server instead of starting gunicorn")
+    parser.add_argument('--db', help="Database for the started server (default: generated)")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--symptoms', type=int, default=100000)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--shards', type=int, default=1, help="PERIOD_TRACKER_SHARDS for the server")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--output', help="Write JSON results here (default: stdout)")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        host, port = '127.0.0.1', args.port
+        db_path = args.db or os.path.join(tempfile.mkdtemp(), 'load.db')
+        if not args.db:
+            from storage import ShardedDatabase
+            generate(ShardedDatabase(db_path, args.shards), args.users, args.symptoms,
+                     args.messages)
+        server = start_gunicorn(db_path, port, args.workers, args.threads, args.shards)
+    try:
+        wait_for_server(host, port)
+        samples = []
+        deadline = time.monotonic() + args.duration
+        started = time.monotonic()
+        clients = [
+            threading.Thread(target=client_loop,
+                             args=(host, port, deadline, args.users, seed, samples))
+            for seed in range(args.concurrency)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.monotonic() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results = {}
+    groups = {}
+    for name, intent, status, latency in samples:
+        groups.setdefault(f'endpoint:{name}', []).append((status, latency))
+        if intent:
+            groups.setdefault(f'intent:{intent}', []).append((status, latency))
+        groups.setdefault('total', []).append((status, latency))
+    for key, values in sorted(groups.items()):
+        summary = summarize([latency for _, latency in values], elapsed)
+        summary['errors'] = sum(1 for status, _ in values if status != 200)
+        results[key] = summary
+    write_results('load', results, vars(args), args.output)
+
+
+if __name__ == '__main__':
+    main()
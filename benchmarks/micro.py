@@ -0,0 +1,101 @@
+"""Micro-benchmarks for detect_intent, process_message and every route
+
+Routes are driven in-process through the Flask test client against a
+synthetic database (see benchmarks.datagen). Results are JSON, so runs
+can be diffed against a baseline with benchmarks.results.
+
+Usage: python -m benchmarks.micro [--iterations N] [--output micro.json]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import generate, user_id  # noqa: E402
+from benchmarks.results import summarize, write_results  # noqa: E402
+
+INTENT_MESSAGES = {
+    'greeting': "hello",
+    'period_start': "my period started today",
+    'next_period': "when is my next period",
+    'symptoms': "I have cramps and a headache",
+    'cycle_info': "how long is my cycle",
+    'pms': "what is pms",
+    'ovulation': "when do i ovulate",
+    'set_reminder': "set reminder",
+    'unknown': "thanks, that's all",
+}
+
+
+def timed(fn, iterations):
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, sum(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--symptoms', type=int, default=20000)
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--db', help="Existing database to use instead of generating one")
+    parser.add_argument('--output', help="Write JSON results here (default: stdout)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'micro.db')
+    os.environ['PERIOD_TRACKER_DB'] = path
+    # Time the handlers, not the rate limiter
+    os.environ.setdefault('ADMISSION_CONTROL', 'false')
+    import API_Chatbot
+    from storage import db
+
+    if not args.db:
+        generate(db, args.users, args.symptoms, args.messages)
+    n_users = sum(shard.connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+                  for shard in db.shards) or 1
+    rng = random.Random(7)
+    users = [user_id(rng.randrange(n_users)) for _ in range(args.iterations)]
+    chatbot = API_Chatbot.chatbot
+    client = API_Chatbot.app.test_client()
+    messages = list(INTENT_MESSAGES.values())
+    n = args.iterations
+
+    results = {
+        'detect_intent': timed(lambda i: chatbot.detect_intent(messages[i % len(messages)]), n * 10),
+    }
+    for intent, message in INTENT_MESSAGES.items():
+        results[f'process_message:{intent}'] = timed(
+            lambda i: chatbot.process_message(message, users[i]), n)
+
+    routes = {
+        'GET /': lambda i: client.get('/'),
+        'POST /chat': lambda i: client.post(
+            '/chat', json={'user_id': users[i], 'message': messages[i % len(messages)]}),
+        'POST /chat/batch (10)': lambda i: client.post('/chat/batch', json=[
+            {'user_id': users[(i + k) % n], 'message': messages[k % len(messages)]}
+            for k in range(10)]),
+        'GET /user/<id>': lambda i: client.get(f'/user/{users[i]}'),
+        'GET /history/<id>': lambda i: client.get(f'/history/{users[i]}'),
+        'GET /symptoms/<id>': lambda i: client.get(f'/symptoms/{users[i]}'),
+        'POST /symptoms/<id>': lambda i: client.post(
+            f'/symptoms/{users[i]}', json={'symptom': 'cramps', 'severity': 'mild'}),
+        'POST /update_cycle': lambda i: client.post(
+            '/update_cycle', json={'user_id': users[i], 'cycle_length': 28 + i % 5}),
+        'GET /reminders/<id>': lambda i: client.get(f'/reminders/{users[i]}'),
+    }
+    for name, call in routes.items():
+        results[f'route:{name}'] = timed(call, n)
+
+    write_results('micro', results, vars(args), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Latency summaries and JSON result files that can be diffed against a baseline
+
+Usage: python -m benchmarks.results CURRENT.json BASELINE.json [--threshold 0.1]
+"""
+from datetime import datetime
+import argparse
+import json
+import platform
+import subprocess
+import sys
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed=None):
+    """Summary statistics (milliseconds) for a list of latencies in seconds"""
+    values = sorted(latencies)
+    count = len(values)
+    summary = {
+        'count': count,
+        'mean_ms': sum(values) / count * 1000 if count else 0.0,
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p95_ms': percentile(values, 0.95) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'max_ms': values[-1] * 1000 if count else 0.0,
+    }
+    if elapsed:
+        summary['throughput_rps'] = count / elapsed
+    return summary
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(kind, results, params, output=None):
+    """Write {meta, results} as JSON to output (or stdout)"""
+    document = {
+        'meta': {
+            'kind': kind,
+            'created_at': datetime.now().isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': params,
+        },
+        'results': results,
+    }
+    text = json.dumps(document, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return document
+
+
+def compare(current, baseline, metric='p95_ms'):
+    """Return [(name, baseline, current, change)] for results present in both runs"""
+    rows = []
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if not base or metric not in result or not base.get(metric):
+            continue
+        change = result[metric] / base[metric] - 1
+        rows.append((name, base[metric], result[metric], change))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff a benchmark run against a baseline")
+    parser.add_argument('current')
+    parser.add_argument('baseline')
+    parser.add_argument('--metric', default='p95_ms')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Relative slowdown that counts as a regression")
+    args = parser.parse_args()
+    with open(args.current) as f:
+        current = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = 0
+    print(f"{'name':40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, base, value, change in compare(current, baseline, args.metric):
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{name:40} {base:10.3f} {value:10.3f} {change * 100:+7.1f}%{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
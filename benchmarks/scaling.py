@@ -0,0 +1,62 @@
+"""Throughput scaling with gunicorn worker count on a sharded database
+
+Runs benchmarks.load once per worker count, each time with as many shards
+as workers, and reports total throughput and the speed-up over the first
+run. Near-linear scaling needs at least as many free cores as workers.
+
+Usage: python -m benchmarks.scaling --workers 1 2 4 --duration 20 \
+           --output scaling.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.results import write_results  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--concurrency-per-worker', type=int, default=8)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--symptoms', type=int, default=50000)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--output', help="Write JSON results here (default: stdout)")
+    args = parser.parse_args()
+
+    results = {}
+    baseline = None
+    for workers in args.workers:
+        out = os.path.join(tempfile.mkdtemp(), 'load.json')
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.load', '--workers', str(workers),
+             '--shards', str(workers), '--threads', str(args.threads),
+             '--concurrency', str(workers * args.concurrency_per_worker),
+             '--users', str(args.users), '--symptoms', str(args.symptoms),
+             '--messages', str(args.messages), '--duration', str(args.duration),
+             '--output', out],
+            cwd=ROOT, check=True,
+        )
+        with open(out) as f:
+            total = json.load(f)['results']['total']
+        baseline = baseline or total['throughput_rps']
+        total['speedup'] = total['throughput_rps'] / baseline
+        total['efficiency'] = total['speedup'] / (workers / args.workers[0])
+        results[f'workers:{workers}'] = total
+        print(f"{workers} workers / {workers} shards: {total['throughput_rps']:.0f} rps "
+              f"(x{total['speedup']:.2f}, p95 {total['p95_ms']:.1f} ms)", file=sys.stderr)
+    params = dict(vars(args), cpu_count=os.cpu_count())
+    write_results('scaling', results, params, args.output)
+
+
+if __name__ == '__main__':
+    main()
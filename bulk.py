@@ -0,0 +1,360 @@
+"""Streaming bulk import and export of user data
+
+Import reads CSV or NDJSON records one at a time and writes them in chunks
+with executemany, one transaction per chunk, so memory use is bounded by
+the chunk size rather than the input. Every record has a ``type`` (user,
+period, symptom or chat) plus that type's fields; iter_export produces the
+same shape, so an export can be replayed into another database.
+
+With a ``source`` name, the number of records consumed is saved in
+import_checkpoints in the same transaction as each chunk. Re-running an
+import of the same source skips everything already committed. On a
+sharded database every shard keeps its own checkpoint, so a chunk that
+committed on some shards but not others is resumed exactly per shard.
+
+    python bulk.py import legacy.ndjson --source legacy-2019
+    python bulk.py export USER_ID > user.ndjson
+"""
+from datetime import date, datetime
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+
+from analytics import rebuild_user, record_symptoms
+from dates import from_day, from_stamp, to_day, to_stamp
+from history_writer import INSERT_SQL as HISTORY_INSERT_SQL
+from reminders import refresh_schedule
+from responses import render
+from versions import bump_versions
+
+RECORD_TYPES = ('user', 'period', 'symptom', 'chat')
+FORMATS = ('ndjson', 'csv')
+
+# Rejected records listed in the import summary (the rest are only counted)
+MAX_REPORTED_ERRORS = 100
+
+UPSERT_USER_SQL = '''
+    INSERT INTO users (user_id, last_period_date, cycle_length, period_duration, created_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        cycle_length = excluded.cycle_length,
+        period_duration = excluded.period_duration
+'''
+ENSURE_USER_SQL = '''
+    INSERT OR IGNORE INTO users (user_id, cycle_length, period_duration, created_at)
+    VALUES (?, 28, 5, ?)
+'''
+INSERT_PERIOD_SQL = '''
+    INSERT OR IGNORE INTO period_events (user_id, start_date, created_at)
+    VALUES (?, ?, ?)
+'''
+INSERT_SYMPTOM_SQL = '''
+    INSERT INTO symptoms (user_id, symptom, severity, date, notes)
+    VALUES (?, ?, ?, ?, ?)
+'''
+LAST_PERIOD_SQL = '''
+    UPDATE users SET last_period_date = (
+        SELECT MAX(start_date) FROM period_events WHERE period_events.user_id = users.user_id
+    )
+    WHERE user_id = ?
+'''
+
+
+class RecordError(ValueError):
+    """A record that failed validation"""
+
+
+def _text(record, field, required=True, max_length=10000):
+    value = record.get(field)
+    if value is None or value == '':
+        if required:
+            raise RecordError(f"missing {field}")
+        return None
+    value = str(value)
+    if len(value) > max_length:
+        raise RecordError(f"{field} longer than {max_length} characters")
+    return value
+
+
+def _day(record, field, required=True):
+    value = _text(record, field, required)
+    if value is None:
+        return None
+    # Parsed as dates.to_day stores it; anything it would keep as text is rejected
+    day = to_day(value)
+    if not isinstance(day, int):
+        raise RecordError(f"{field} must be a YYYY-MM-DD date")
+    return day
+
+
+def _timestamp(record, field):
+    value = _text(record, field)
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise RecordError(f"{field} must be an ISO 8601 timestamp")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return to_stamp(parsed)
+
+
+def _int(record, field, default, low, high):
+    value = record.get(field)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RecordError(f"{field} must be an integer")
+    if not low <= value <= high:
+        raise RecordError(f"{field} must be between {low} and {high}")
+    return value
+
+
+def validate(record, today, created=None):
+    """Return (type, row) for a raw record or raise RecordError
+
+    today (a day ordinal) is the default users.created_at and created (a
+    timestamp) the period_events.created_at of new rows.
+    """
+    if not isinstance(record, dict):
+        raise RecordError("record must be an object")
+    kind = record.get('type')
+    if kind not in RECORD_TYPES:
+        raise RecordError(f"type must be one of {', '.join(RECORD_TYPES)}")
+    user_id = _text(record, 'user_id', max_length=200)
+    if kind == 'user':
+        return kind, (user_id, _day(record, 'last_period_date', required=False),
+                      _int(record, 'cycle_length', 28, 15, 60),
+                      _int(record, 'period_duration', 5, 1, 14),
+                      _day(record, 'created_at', required=False) or today)
+    if kind == 'period':
+        return kind, (user_id, _day(record, 'date'), created)
+    if kind == 'symptom':
+        return kind, (user_id, _text(record, 'symptom', max_length=200),
+                      _text(record, 'severity', required=False, max_length=50) or 'moderate',
+                      _day(record, 'date'), _text(record, 'notes', required=False) or '')
+    return kind, (user_id, _text(record, 'user_message'), _text(record, 'bot_response'),
+                  _timestamp(record, 'timestamp'), None, None)
+
+
+def read_records(stream, fmt='ndjson'):
+    """Yield (line_number, record) from a text stream without reading it all"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+def detect_format(name=None, content_type=None):
+    """Guess the input format from a file name or Content-Type"""
+    if (name and name.lower().endswith('.csv')) or (content_type and 'csv' in content_type):
+        return 'csv'
+    return 'ndjson'
+
+
+def get_checkpoint(conn, source):
+    row = conn.execute(
+        "SELECT position FROM import_checkpoints WHERE source = ?", (source,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def _write_chunk(conn, rows, today, created):
+    if rows['user']:
+        conn.executemany(UPSERT_USER_SQL, rows['user'])
+        # A user's last_period_date is also a period start
+        conn.executemany(INSERT_PERIOD_SQL, [(r[0], r[1], created) for r in rows['user'] if r[1]])
+    if rows['period']:
+        conn.executemany(ENSURE_USER_SQL, [(r[0], today) for r in rows['period']])
+        conn.executemany(INSERT_PERIOD_SQL, rows['period'])
+    if rows['symptom']:
+        conn.executemany(INSERT_SYMPTOM_SQL, rows['symptom'])
+        record_symptoms(conn, [(r[0], r[1], r[3], r[2]) for r in rows['symptom']])
+    if rows['chat']:
+        conn.executemany(HISTORY_INSERT_SQL, rows['chat'])
+    # Keep last_period_date and the materialized schedule in step with the history
+    affected = {r[0] for r in rows['user']} | {r[0] for r in rows['period']}
+    if affected:
+        conn.executemany(LAST_PERIOD_SQL, [(user_id,) for user_id in affected])
+        for user_id in affected:
+            refresh_schedule(conn, user_id)
+            # New period starts can move already imported symptoms to other cycle days
+            rebuild_user(conn, user_id)
+    bump_versions(conn, {r[0] for kind_rows in rows.values() for r in kind_rows})
+    return affected
+
+
+def import_records(db, records, source=None, chunk_size=5000, strict=False,
+                   on_users_changed=None):
+    """Import (line_number, record) pairs; returns a summary dict
+
+    Invalid records are skipped and reported unless strict is set, in which
+    case the first one raises RecordError (chunks before it stay committed).
+    on_users_changed(user_ids) runs after each chunk that touched users rows.
+    Records are routed to the shard of their user_id.
+    """
+    today = to_day(date.today())
+    created = to_stamp(datetime.now())
+    start = time.perf_counter()
+    summary = {
+        'source': source,
+        'read': 0,
+        'skipped': 0,
+        'imported': dict.fromkeys(RECORD_TYPES, 0),
+        'rejected': 0,
+        'errors': [],
+        'chunks': 0,
+    }
+    checkpoints = dict.fromkeys(db.shards, 0)
+    if source:
+        for shard in db.shards:
+            with shard.read() as conn:
+                checkpoints[shard] = get_checkpoint(conn, source)
+    resume_from = min(checkpoints.values())
+
+    position = 0
+    rows = {shard: {kind: [] for kind in RECORD_TYPES} for shard in db.shards}
+    pending = 0
+
+    def flush():
+        nonlocal pending
+        for shard, shard_rows in rows.items():
+            if not source and not any(shard_rows.values()):
+                continue
+            with shard.transaction() as conn:
+                affected = _write_chunk(conn, shard_rows, today, created)
+                if source:
+                    conn.execute('''
+                        INSERT INTO import_checkpoints (source, position, updated_at)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT (source) DO UPDATE SET
+                            position = excluded.position, updated_at = excluded.updated_at
+                    ''', (source, position, datetime.now().isoformat()))
+                if affected and on_users_changed:
+                    shard.after_commit(lambda: on_users_changed(affected))
+            for kind in RECORD_TYPES:
+                summary['imported'][kind] += len(shard_rows[kind])
+                shard_rows[kind].clear()
+        summary['chunks'] += 1
+        pending = 0
+
+    for line_number, record in records:
+        position += 1
+        if position <= resume_from:
+            summary['skipped'] += 1
+            continue
+        try:
+            if record is None:
+                raise RecordError("invalid JSON")
+            kind, row = validate(record, today, created)
+        except RecordError as e:
+            summary['read'] += 1
+            if strict:
+                raise RecordError(f"line {line_number}: {e}")
+            summary['rejected'] += 1
+            if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                summary['errors'].append({'line': line_number, 'error': str(e)})
+            continue
+        shard = db.for_user(row[0])
+        if position <= checkpoints[shard]:
+            # Already committed on this shard before an interrupted chunk
+            summary['skipped'] += 1
+            continue
+        summary['read'] += 1
+        rows[shard][kind].append(row)
+        pending += 1
+        if pending >= chunk_size:
+            flush()
+    if pending or (source and position > resume_from):
+        # Also records a checkpoint for a trailing run of rejected records
+        flush()
+
+    elapsed = time.perf_counter() - start
+    summary['elapsed_seconds'] = round(elapsed, 3)
+    summary['records_per_second'] = round(summary['read'] / elapsed) if elapsed else 0
+    return summary
+
+
+def iter_export(db, user_id):
+    """Yield a user's profile, period starts, symptoms and chat history as import records"""
+    with db.for_user(user_id).read() as conn:
+        user = conn.execute('''
+            SELECT last_period_date, cycle_length, period_duration, created_at
+            FROM users WHERE user_id = ?
+        ''', (user_id,)).fetchone()
+        if user:
+            yield {"type": "user", "user_id": user_id, "last_period_date": from_day(user[0]),
+                   "cycle_length": user[1], "period_duration": user[2],
+                   "created_at": from_day(user[3])}
+        for (start_date,) in conn.execute(
+                "SELECT start_date FROM period_events WHERE user_id = ? ORDER BY start_date",
+                (user_id,)):
+            yield {"type": "period", "user_id": user_id, "date": from_day(start_date)}
+        for symptom, severity, day, notes in conn.execute('''
+                SELECT symptom, severity, date, notes FROM symptoms
+                WHERE user_id = ? ORDER BY date, id
+                ''', (user_id,)):
+            yield {"type": "symptom", "user_id": user_id, "symptom": symptom,
+                   "severity": severity, "date": from_day(day), "notes": notes}
+        for message, response, timestamp, template_id, params in conn.execute('''
+                SELECT user_message, bot_response, timestamp, template_id, template_params
+                FROM chat_history WHERE user_id = ? ORDER BY timestamp, id
+                ''', (user_id,)):
+            yield {"type": "chat", "user_id": user_id, "user_message": message,
+                   "bot_response": render(template_id, params) if template_id else response,
+                   "timestamp": from_stamp(timestamp)}
+
+
+if __name__ == '__main__':
+    from migrations import migrate
+    from storage import db
+
+    parser = argparse.ArgumentParser(description="Bulk import or export user data")
+    parser.add_argument('--db', help="Database path (default: PERIOD_TRACKER_DB)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help="Import a CSV or NDJSON file ('-' for stdin)")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=FORMATS)
+    import_parser.add_argument('--source', help="Checkpoint name (default: the file path)")
+    import_parser.add_argument('--chunk-size', type=int, default=20000)
+    import_parser.add_argument('--strict', action='store_true',
+                               help="Stop at the first invalid record")
+    export_parser = commands.add_parser('export', help="Write a user's data as NDJSON to stdout")
+    export_parser.add_argument('user_id')
+    args = parser.parse_args()
+    if args.db:
+        db.configure(args.db)
+    migrate(db)
+
+    if args.command == 'export':
+        for record in iter_export(db, args.user_id):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+        sys.exit(0)
+
+    fmt = args.format or detect_format(args.path)
+    if args.path == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        source = args.source
+    else:
+        stream = open(args.path, encoding='utf-8', newline='')
+        source = args.source or args.path
+    with stream:
+        try:
+            summary = import_records(db, read_records(stream, fmt), source=source,
+                                     chunk_size=args.chunk_size, strict=args.strict)
+        except RecordError as e:
+            sys.exit(f"Import stopped: {e}")
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary['rejected'] else 0)
@@ -0,0 +1,65 @@
+"""Integer date and timestamp storage
+
+Dates are stored as proleptic Gregorian day ordinals (date.toordinal, so
+0001-01-01 is day 1) and timestamps as microseconds since 1970-01-01 of
+the naive local time the app records. Both sort like the ISO strings they
+replace, date arithmetic is integer arithmetic, and they are turned back
+into exactly the ISO text the API has always returned (isoformat, with
+microseconds only when non-zero).
+
+A value is converted only if it round-trips to the same text, so any
+legacy value that isn't canonical ISO is kept as TEXT. The from_*
+functions pass such values through unchanged.
+"""
+from datetime import date, datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_day(value):
+    """'YYYY-MM-DD', date or datetime -> day ordinal; anything else unchanged"""
+    if isinstance(value, date):
+        return value.toordinal()
+    if isinstance(value, str):
+        try:
+            parsed = date.fromisoformat(value)
+        except ValueError:
+            return value
+        if parsed.isoformat() == value:
+            return parsed.toordinal()
+    return value
+
+
+def from_day(value):
+    """Day ordinal -> 'YYYY-MM-DD'; None and legacy text unchanged"""
+    if isinstance(value, int):
+        return date.fromordinal(value).isoformat()
+    return value
+
+
+def to_stamp(value):
+    """Naive datetime or its isoformat() -> microseconds since the epoch; else unchanged"""
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+        if parsed.tzinfo is not None or parsed.isoformat() != value:
+            return value
+        value = parsed
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return (value - EPOCH) // MICROSECOND
+    return value
+
+
+def from_stamp(value):
+    """Microseconds since the epoch -> datetime.isoformat(); None and legacy text unchanged"""
+    if isinstance(value, int):
+        return (EPOCH + value * MICROSECOND).isoformat()
+    return value
+
+
+def today():
+    """Today's day ordinal"""
+    return date.today().toordinal()
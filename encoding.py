@@ -0,0 +1,77 @@
+"""Response body encoding for the hot routes
+
+dumps() is the JSON encoder for /chat, /chat/batch, /user, /symptoms and
+/history. It uses orjson when that is installed, which also writes
+non-ASCII text (the emoji in bot replies) as UTF-8 instead of \\u
+escapes. Otherwise it uses one stdlib encoder built at import time, which
+keeps the escapes: the C encoder is slower at building non-ASCII text.
+Neither sorts keys or goes through Flask's JSON provider.
+
+Static reply texts (templates without parameters) are encoded once when
+they are registered. chat_body() splices those bytes into the /chat
+envelope, so a greeting or PMS reply only costs encoding the few small
+fields around it.
+
+compress() and negotiate() implement gzip/deflate content negotiation
+for bodies over COMPRESS_MIN_SIZE (see the after_request hook in
+API_Chatbot).
+"""
+import gzip
+import json
+import zlib
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CODINGS = ('gzip', 'deflate')
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv')
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+_static = {}
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return _encoder.encode(obj).encode('ascii')
+
+
+def preencode(text):
+    """Encode a static text once so chat_body can splice it in"""
+    _static[text] = dumps(text)
+
+
+def chat_body(result):
+    """{"status": "success", "data": result} for a process_message result"""
+    text = _static.get(result['response'])
+    if text is None:
+        return dumps({"status": "success", "data": result})
+    rest = {key: value for key, value in result.items() if key != 'response'}
+    return b''.join((b'{"status":"success","data":{"response":', text,
+                     b',' if rest else b'', dumps(rest)[1:], b'}'))
+
+
+def negotiate(accept_encodings):
+    """Best of gzip/deflate acceptable to the client (werkzeug Accept), or None"""
+    return accept_encodings.best_match(CODINGS)
+
+
+def compressible(mimetype):
+    return mimetype in COMPRESSIBLE_TYPES
+
+
+def compress(body, coding, level=6):
+    if coding == 'gzip':
+        # mtime=0 keeps the output the same for the same body
+        return gzip.compress(body, level, mtime=0)
+    return zlib.compress(body, level)
+
+
+def json_response(obj, status=200):
+    """Response with dumps(obj) as its body"""
+    return Response(dumps(obj), status=status, mimetype='application/json')
@@ -0,0 +1,195 @@
+"""Symptom entity extraction for the period tracker chatbot
+
+Symptom names and their synonyms, severity words, relative date phrases,
+negations and clause separators are compiled at startup into one trie over
+words. ``SymptomExtractor.extract`` tokenizes a message and walks it once,
+taking the longest phrase that starts at each word, then assembles the
+matches into (symptom, severity, date) entities.
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+import re
+
+# Canonical symptom -> phrases that mean it. The canonical names are the
+# ones stored in the symptoms table.
+SYMPTOM_SYNONYMS = {
+    'cramps': ['cramps', 'cramp', 'cramping', 'period pain', 'stomach ache',
+               'stomachache', 'abdominal pain', 'tummy ache'],
+    'headache': ['headache', 'headaches', 'head ache', 'migraine', 'migraines',
+                 'head hurts', 'head is pounding'],
+    'bloating': ['bloating', 'bloated', 'puffy', 'swollen belly'],
+    'back pain': ['back pain', 'backache', 'back ache', 'lower back pain', 'back hurts'],
+    'breast tenderness': ['breast tenderness', 'tender breasts', 'sore breasts',
+                          'breast pain', 'breasts hurt', 'boobs hurt', 'sore boobs'],
+    'mood swings': ['mood swings', 'mood swing', 'moody', 'irritable', 'emotional',
+                    'cranky', 'weepy'],
+    'fatigue': ['fatigue', 'fatigued', 'tired', 'exhausted', 'no energy', 'sleepy',
+                'drained', 'worn out'],
+    'nausea': ['nausea', 'nauseous', 'nauseated', 'queasy', 'sick to my stomach',
+               'feel sick', 'feeling sick'],
+    'acne': ['acne', 'pimples', 'pimple', 'breakout', 'breakouts', 'spots', 'zits'],
+    'food cravings': ['food cravings', 'cravings', 'craving', 'hungry all the time'],
+}
+
+SEVERITY_WORDS = {
+    'mild': ['mild', 'mildly', 'slight', 'slightly', 'a bit', 'a little', 'light',
+             'not too bad', 'manageable'],
+    'moderate': ['moderate', 'moderately', 'quite', 'pretty bad', 'fairly'],
+    'severe': ['severe', 'severely', 'terrible', 'terribly', 'awful', 'horrible',
+               'unbearable', 'excruciating', 'extreme', 'intense', 'really bad',
+               'very bad', 'so bad', 'killing me', 'worst'],
+}
+DEFAULT_SEVERITY = 'moderate'
+
+NEGATIONS = ['no', 'not', 'without', "don't have", 'dont have', 'no more', 'never']
+
+NUMBER_WORDS = {'a': 1, 'one': 1, 'two': 2, 'a couple of': 2, 'couple of': 2,
+                'three': 3, 'a few': 3, 'few': 3, 'four': 4, 'five': 5, 'six': 6,
+                'seven': 7}
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Fixed phrases -> days before today
+DAY_OFFSETS = {
+    'today': 0, 'this morning': 0, 'this afternoon': 0, 'tonight': 0, 'now': 0,
+    'yesterday': 1, 'last night': 1, 'since yesterday': 1,
+    'day before yesterday': 2, 'the day before yesterday': 2,
+    'last week': 7, 'since last week': 7,
+}
+
+SEPARATORS = ['.', ',', ';', '!', '?', '\n', 'but']
+
+Symptom = namedtuple('Symptom', 'symptom severity date')
+
+TOKEN_RE = re.compile(r"[a-z0-9']+|[.,;!?\n]")
+
+# Trie key standing for any 1-2 digit number
+DIGITS = '<digits>'
+
+
+class SymptomExtractor:
+    """Single-pass extractor of symptoms with severity and relative dates
+
+    Severity words apply to the symptom they precede, or else to the one
+    they follow, within the same clause. A date phrase applies to its
+    clause, falling back to the first date in the message, then today.
+    """
+
+    def __init__(self, synonyms=None, severities=None):
+        self._synonyms = {name: list(phrases)
+                          for name, phrases in (synonyms or SYMPTOM_SYNONYMS).items()}
+        self._severities = severities or SEVERITY_WORDS
+        self._pattern = None
+        self._compile()
+
+    def register(self, symptom, synonyms):
+        """Add a symptom (or more synonyms for one) and recompile"""
+        if isinstance(synonyms, str):
+            synonyms = [synonyms]
+        self._synonyms.setdefault(symptom, [symptom]).extend(synonyms)
+        self._compile()
+
+    @property
+    def symptoms(self):
+        return list(self._synonyms)
+
+    def _compile(self):
+        """Build the phrase trie: nested dicts keyed by word, None -> (kind, value)"""
+        trie = {}
+
+        def add(phrase, kind, value):
+            node = trie
+            for word in phrase.split():
+                node = node.setdefault(word, {})
+            node.setdefault(None, (kind, value))
+
+        for name, phrases in self._synonyms.items():
+            for phrase in phrases:
+                add(phrase, 'symptom', name)
+        for level, words in self._severities.items():
+            for word in words:
+                add(word, 'severity', level)
+        for phrase, days in DAY_OFFSETS.items():
+            add(phrase, 'days', days)
+        for index, day in enumerate(WEEKDAYS):
+            for prefix in ('', 'since ', 'on ', 'last '):
+                add(prefix + day, 'weekday', index)
+        for number, count in list(NUMBER_WORDS.items()) + [(DIGITS, None)]:
+            for unit in ('day', 'days'):
+                # "for 3 days" started two days before today
+                add(f'{number} {unit} ago', 'ago', count)
+                for prefix in ('for', 'for the past', 'for the last'):
+                    add(f'{prefix} {number} {unit}', 'for', count)
+        for word in NEGATIONS:
+            add(word, 'neg', None)
+        for token in SEPARATORS:
+            trie.setdefault(token, {})[None] = ('sep', None)
+        self._trie = trie
+
+    def _scan(self, tokens):
+        """Yield (kind, value, number) for the longest phrase at each position"""
+        trie = self._trie
+        i, n = 0, len(tokens)
+        while i < n:
+            node, j, best, number = trie, i, None, None
+            while j < n:
+                token = tokens[j]
+                child = node.get(token)
+                if child is None and token.isdigit() and len(token) <= 2:
+                    child = node.get(DIGITS)
+                    number = int(token)
+                if child is None:
+                    break
+                node = child
+                j += 1
+                if None in node:
+                    best = j, node[None]
+            if best is None:
+                i += 1
+            else:
+                i = best[0]
+                yield best[1][0], best[1][1], number
+
+    def extract(self, message, today=None):
+        """Return [Symptom] found in message, in order of first mention"""
+        today = today or date.today()
+        clauses = [[]]
+        for kind, value, number in self._scan(TOKEN_RE.findall(message.lower())):
+            if kind == 'sep':
+                clauses.append([])
+            elif kind in ('symptom', 'severity', 'neg'):
+                clauses[-1].append((kind, value))
+            else:
+                if kind == 'weekday':
+                    days = (today.weekday() - value) % 7 or 7
+                elif kind == 'days':
+                    days = value
+                else:
+                    count = number if value is None else value
+                    days = count if kind == 'ago' else max(count - 1, 0)
+                days = min(days, 366)
+                clauses[-1].append(('date', (today - timedelta(days=days)).isoformat()))
+
+        message_date = next((value for clause in clauses for kind, value in clause
+                             if kind == 'date'), today.isoformat())
+        found = {}
+        for clause in clauses:
+            clause_date = next((value for kind, value in clause if kind == 'date'), message_date)
+            severity, negated, last = None, False, None
+            for index, (kind, value) in enumerate(clause):
+                if kind == 'severity':
+                    following = [k for k, _ in clause[index + 1:] if k != 'date'][:1]
+                    if following in (['symptom'], ['neg']) or last is None:
+                        severity = value
+                    elif last[1] is None:
+                        # "cramps are terrible": applies to the symptom before
+                        last[1] = value
+                elif kind == 'neg':
+                    negated = True
+                elif kind == 'symptom':
+                    if not negated and value not in found:
+                        found[value] = [value, severity, clause_date]
+                    last = found.get(value) if not negated else None
+                    severity, negated = None, False
+        return [Symptom(name, severity or DEFAULT_SEVERITY, day)
+                for name, severity, day in found.values()]
@@ -0,0 +1,26 @@
+# Gunicorn picks this file up automatically from the working directory
+import os
+
+import startup
+
+# Import the app once in the master and fork workers from it (see startup.py).
+# Use PRELOAD_APP rather than --preload so the per-worker startup is deferred.
+preload_app = os.environ.get('PRELOAD_APP', 'True').lower() == 'true'
+if preload_app:
+    startup.defer_to_workers()
+
+
+def pre_fork(server, worker):
+    startup.before_fork()
+
+
+def post_fork(server, worker):
+    startup.after_fork()
+
+
+def worker_exit(server, worker):
+    """Flush queued chat history before the worker goes away"""
+    import API_Chatbot
+
+    if API_Chatbot.history_writer is not None:
+        API_Chatbot.history_writer.stop()
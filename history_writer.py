@@ -0,0 +1,170 @@
+"""Write-behind queue for chat_history inserts
+
+When enabled, /chat hands its chat_history row to a bounded in-process
+queue instead of inserting it on the request thread. A background thread
+drains the queue and writes rows with executemany, one transaction per
+batch, whenever the batch is full or the flush interval has passed.
+"""
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from versions import bump_versions
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = '''
+    INSERT INTO chat_history
+    (user_id, user_message, bot_response, timestamp, template_id, template_params)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """Background batching writer for chat_history rows"""
+
+    def __init__(self, db, max_queue=10000, batch_size=500, flush_interval=0.2,
+                 put_timeout=1.0):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'failed': 0,
+            'backpressure_waits': 0,
+            'sync_fallbacks': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the writer thread and flush on interpreter exit"""
+        with self._lock:
+            if self.running:
+                return self
+            self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def submit(self, row):
+        """Queue a chat_history row (see INSERT_SQL for the column order)
+
+        Blocks for up to put_timeout when the queue is full; if the writer
+        still can't keep up (or isn't running) the row is written inline.
+        """
+        if self.running:
+            try:
+                self._queue.put_nowait(row)
+                self._count('enqueued')
+                return
+            except queue.Full:
+                self._count('backpressure_waits')
+            try:
+                self._queue.put(row, timeout=self.put_timeout)
+                self._count('enqueued')
+                return
+            except queue.Full:
+                pass
+        self._count('sync_fallbacks')
+        self._flush([row])
+
+    def stop(self, timeout=10.0):
+        """Flush everything queued and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def stats(self):
+        """Counters for queue depth, throughput and flush latency"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_flush_ms'] = (stats['total_flush_ms'] / stats['batches']
+                                 if stats['batches'] else 0.0)
+        return stats
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+        # Drain anything submitted before the stop marker was consumed
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        by_shard = {}
+        for row in batch:
+            by_shard.setdefault(self.db.for_user(row[0]), []).append(row)
+        written = 0
+        for shard, rows in by_shard.items():
+            try:
+                with shard.transaction() as conn:
+                    conn.executemany(INSERT_SQL, rows)
+                    bump_versions(conn, {row[0] for row in rows})
+                written += len(rows)
+            except sqlite3.Error:
+                logger.exception("Failed to write %d chat_history rows", len(rows))
+                self._count('failed', len(rows))
+        if not written:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['written'] += written
+            self._stats['batches'] += 1
+            self._stats['last_flush_ms'] = elapsed_ms
+            self._stats['total_flush_ms'] += elapsed_ms
+            self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], elapsed_ms)
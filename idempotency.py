@@ -0,0 +1,192 @@
+"""Idempotency-Key handling for retried writes
+
+Mobile clients retry POST /chat and POST /symptoms/<user_id> when a
+response is lost, and each retry used to run the write again. A request
+that carries an Idempotency-Key header is executed at most once per
+(route, user_id, key): the status and body of the first execution are
+stored and replayed for every retry until the key expires.
+
+Results live in an in-process LRU and, unless IDEMPOTENCY_PERSIST=false,
+in the idempotency_keys table of the user's shard. The table row is
+written in the same transaction as the request's own writes, so a result
+is recorded exactly when its writes commit, and since the shard's write
+lock is held from the key lookup to the commit, duplicates arriving at
+other worker processes replay instead of running again. Within a process,
+concurrent duplicates wait for the one in-flight execution and share its
+result.
+
+Keys are stored as 16-byte digests and requests as 8-byte fingerprints
+of the body. Reusing a key with a different body is an error. Results
+with a 5xx status are not stored, so the client's next retry runs again.
+"""
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+import hashlib
+import threading
+import time
+
+from dates import to_stamp
+
+Result = namedtuple('Result', 'fingerprint status body')
+
+# Expired rows deleted per purge, and stored results between purges
+PURGE_BATCH = 1000
+PURGE_EVERY = 1000
+
+SELECT_SQL = '''
+    SELECT fingerprint, status, body FROM idempotency_keys
+    WHERE key_hash = ? AND expires_at > ?
+'''
+INSERT_SQL = '''
+    INSERT OR REPLACE INTO idempotency_keys
+    (key_hash, user_id, fingerprint, status, body, expires_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+PURGE_SQL = '''
+    DELETE FROM idempotency_keys WHERE rowid IN (
+        SELECT rowid FROM idempotency_keys WHERE expires_at <= ? LIMIT ?)
+'''
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with a different body"""
+
+
+class _Abort(Exception):
+    """Rolls back a transaction whose request failed, carrying its result"""
+
+
+class _Flight:
+    """One in-flight execution that concurrent duplicates wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+def key_hash(route, user_id, key):
+    return hashlib.blake2b(f'{route}\0{user_id}\0{key}'.encode('utf-8'),
+                           digest_size=16).digest()
+
+
+def fingerprint(body):
+    return hashlib.blake2b(body, digest_size=8).digest()
+
+
+class IdempotencyStore:
+    """Thread-safe LRU + TTL of request results, with in-flight coalescing"""
+
+    def __init__(self, max_size=10000, ttl=86400.0, persist=True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stored = 0
+        self._stats = {'executed': 0, 'replayed': 0, 'stored_replays': 0, 'coalesced': 0,
+                       'conflicts': 0, 'evictions': 0, 'expired': 0}
+
+    def execute(self, key, request_fingerprint, run, shard=None, user_id=None):
+        """Return (Result, replayed), calling run() only if key has no result yet
+
+        run returns (status, body). With persist on, pass the user's shard:
+        run() then executes inside its write transaction.
+        """
+        while True:
+            with self._lock:
+                result = self._lookup(key)
+                if result is None:
+                    flight = self._in_flight.get(key)
+                    if flight is None:
+                        flight = self._in_flight[key] = _Flight()
+                        break
+                    self._stats['coalesced'] += 1
+                else:
+                    self._stats['replayed'] += 1
+            if result is None:
+                flight.done.wait()
+                result = flight.result
+                if result is None:
+                    # The execution raised; let this request try again
+                    continue
+            return self._check(result, request_fingerprint), True
+
+        try:
+            if self.persist and shard is not None:
+                result, replayed = self._run_stored(key, request_fingerprint, run, shard, user_id)
+            else:
+                result, replayed = Result(request_fingerprint, *run()), False
+            with self._lock:
+                if replayed:
+                    self._stats['stored_replays'] += 1
+                else:
+                    self._stats['executed'] += 1
+                if result.status < 500:
+                    self._store(key, result)
+            flight.result = result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+        return self._check(result, request_fingerprint), replayed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['in_flight'] = len(self._in_flight)
+        stats['max_size'] = self.max_size
+        return stats
+
+    def _run_stored(self, key, request_fingerprint, run, shard, user_id):
+        now = datetime.now()
+        try:
+            with shard.transaction() as conn:
+                # BEGIN IMMEDIATE: no other process can record this key until we commit
+                row = conn.execute(SELECT_SQL, (key, to_stamp(now))).fetchone()
+                if row is not None:
+                    return Result(*row), True
+                result = Result(request_fingerprint, *run())
+                if result.status >= 500:
+                    raise _Abort(result)
+                conn.execute(INSERT_SQL, (key, user_id, result.fingerprint, result.status,
+                                          result.body, to_stamp(now + timedelta(seconds=self.ttl))))
+                self._stored += 1
+                if self._stored % PURGE_EVERY == 0:
+                    conn.execute(PURGE_SQL, (to_stamp(now), PURGE_BATCH))
+                return result, False
+        except _Abort as e:
+            return e.args[0], False
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        result, expires = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            self._stats['expired'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _store(self, key, result):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (result, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _check(self, result, request_fingerprint):
+        if result.fingerprint != request_fingerprint:
+            with self._lock:
+                self._stats['conflicts'] += 1
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+        return result
@@ -0,0 +1,114 @@
+"""Intent classification for the period tracker chatbot"""
+import re
+
+# Intent patterns, in priority order: the first intent with a matching
+# pattern wins, exactly like the original nested re.search loop.
+INTENT_PATTERNS = {
+    'greeting': [
+        r'hello', r'hi', r'hey', r'good morning', r'good afternoon'
+    ],
+    'period_start': [
+        r'period (started|began)', r'start(ed|ing) (my )?period',
+        r'got my period', r'my period (started|began)',
+        r'menstruation (started|began)', r'period date today',
+        r'log period (today|now)'
+    ],
+    'period_end': [
+        r'period (ended|finished|stopped)', r'end(ed|ing) (my )?period'
+    ],
+    'next_period': [
+        r'when (is|will be) my next period', r'next period date',
+        r'predict my period', r'when (should|will) i get my period',
+        r'period prediction'
+    ],
+    'symptoms': [
+        r'(cramps|headache|bloating|pain|tired|fatigue|nausea)',
+        r'i have (.*) pain', r'feeling (.*)',
+        r'symptom(s)?', r'i feel (.*)',
+        r'logging symptoms', r'log symptom'
+    ],
+    'cycle_info': [
+        r'my cycle length', r'average cycle', r'cycle days',
+        r'how long is my cycle'
+    ],
+    'pms': [
+        r'what is pms', r'premenstrual syndrome',
+        r'pms symptoms', r'before period symptoms'
+    ],
+    'pain_relief': [
+        r'how to (relieve|reduce|stop) (pain|cramps)',
+        r'pain relief', r'cramp relief',
+        r'what helps with (cramps|pain)'
+    ],
+    'ovulation': [
+        r'when do i ovulate', r'ovulation (date|time)',
+        r'fertile window', r'ovulation calculator'
+    ],
+    'set_reminder': [
+        r'set reminder', r'remind me', r'notification',
+        r'alert me before period'
+    ]
+}
+
+# Numbered backreferences and conditionals: group numbers shift once a
+# pattern is embedded in the combined matcher
+_GROUP_REFERENCE = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]|\(\?\(')
+
+
+class IntentClassifier:
+    """Registry of intents compiled into a single precompiled matcher
+
+    Every intent becomes one branch of an anchored alternation. Each branch
+    is a lookahead over the whole message followed by an empty named group,
+    so a single ``match`` call tries the intents in registration order and
+    stops at the first one that matches anywhere in the message. Patterns
+    can't use named groups or refer back to a group, since embedding them
+    changes group names and numbers.
+    """
+
+    def __init__(self, intent_patterns=None, default_intent='unknown'):
+        self.default_intent = default_intent
+        self._intents = []
+        self._patterns = {}
+        self._matcher = None
+        for intent, patterns in (intent_patterns or {}).items():
+            self.register(intent, patterns)
+
+    def register(self, intent, patterns):
+        """Add an intent (or extra patterns for an existing one) and recompile"""
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        for pattern in patterns:
+            if re.compile(pattern).groupindex or _GROUP_REFERENCE.search(pattern):  # Fail early
+                raise ValueError(f"Pattern {pattern!r} uses a named group or group reference")
+        intents = self._intents + ([] if intent in self._patterns else [intent])
+        registered = dict(self._patterns)
+        registered[intent] = registered.get(intent, []) + list(patterns)
+        # Compile before touching the registry, so a failure leaves it as it was
+        matcher = self._compile(intents, registered)
+        self._intents, self._patterns, self._matcher = intents, registered, matcher
+
+    @property
+    def intents(self):
+        """Registered intents in priority order"""
+        return list(self._intents)
+
+    @staticmethod
+    def _compile(intents, patterns):
+        """Build the combined matcher for intents in priority order"""
+        branches = []
+        for index, intent in enumerate(intents):
+            alternation = '|'.join('(?:%s)' % p for p in patterns[intent])
+            branches.append(r'(?=[\s\S]*?(?:%s))(?P<i%d>)' % (alternation, index))
+        if not branches:
+            return None
+        return re.compile('|'.join(branches))
+
+    def classify(self, message):
+        """Return the highest priority intent matching the message"""
+        if self._matcher is None:
+            return self.default_intent
+        match = self._matcher.match(message.lower())
+        if match is None:
+            return self.default_intent
+        return self._intents[int(match.lastgroup[1:])]
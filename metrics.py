@@ -0,0 +1,136 @@
+"""In-process metrics in Prometheus text format
+
+Latency histograms and counters are kept in plain dicts behind one lock;
+recording a sample is a dict lookup, a bisect and a few additions, so the
+instrumentation is cheap enough to leave on. Set METRICS_ENABLED=false to
+turn every call into a no-op.
+"""
+from bisect import bisect_left
+import os
+import threading
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = 'period_tracker_'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Metrics:
+    """Registry of counters, histograms and gauge collectors"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._help = {}
+        self._label_names = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        self._help[name] = ('counter', help_text)
+        self._label_names[name] = labels
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name, help_text, labels=()):
+        self._help[name] = ('histogram', help_text)
+        self._label_names[name] = labels
+        self._histograms.setdefault(name, {})
+
+    def collector(self, fn):
+        """Register fn() -> [(name, help, {label: value} or None, value)] gauges"""
+        self._collectors.append(fn)
+        return fn
+
+    def inc(self, name, labels=(), amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            series = self._counters[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, seconds):
+        if not self.enabled:
+            return
+        index = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            series = self._histograms[name]
+            state = series.get(labels)
+            if state is None:
+                state = series[labels] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += seconds
+            state[2] += 1
+
+    def reset(self):
+        with self._lock:
+            for series in self._counters.values():
+                series.clear()
+            for series in self._histograms.values():
+                series.clear()
+
+    def render(self):
+        """Prometheus text exposition of everything recorded so far"""
+        lines = []
+        with self._lock:
+            counters = {n: dict(s) for n, s in self._counters.items()}
+            histograms = {n: {k: (list(v[0]), v[1], v[2]) for k, v in s.items()}
+                          for n, s in self._histograms.items()}
+        for name, series in sorted(counters.items()):
+            label_names = self._label_names[name]
+            lines.append(f"# HELP {PREFIX}{name} {self._help[name][1]}")
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{PREFIX}{name}{_labels(label_names, labels)} {value}")
+        for name, series in sorted(histograms.items()):
+            label_names = self._label_names[name]
+            lines.append(f"# HELP {PREFIX}{name} {self._help[name][1]}")
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for labels, (buckets, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, hits in zip(BUCKETS + ('+Inf',), buckets):
+                    cumulative += hits
+                    le = f'le="{bound}"'
+                    lines.append(f"{PREFIX}{name}_bucket{_labels(label_names, labels, le)} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_labels(label_names, labels)} {total}")
+                lines.append(f"{PREFIX}{name}_count{_labels(label_names, labels)} {count}")
+        seen = set()
+        for collect in self._collectors:
+            for name, help_text, labels, value in collect():
+                if name not in seen:
+                    lines.append(f"# HELP {PREFIX}{name} {help_text}")
+                    lines.append(f"# TYPE {PREFIX}{name} gauge")
+                    seen.add(name)
+                labels = labels or {}
+                lines.append(f"{PREFIX}{name}{_labels(labels.keys(), labels.values())} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics(enabled=os.environ.get('METRICS_ENABLED', 'True').lower() == 'true')
+
+metrics.histogram('http_request_duration_seconds', "HTTP request latency by route",
+                  ('method', 'route', 'status'))
+metrics.histogram('chat_intent_duration_seconds', "process_message latency by detected intent",
+                  ('intent',))
+metrics.histogram('db_statement_duration_seconds', "SQL statement execution time",
+                  ('statement',))
+metrics.counter('db_connections_opened_total', "SQLite connections opened")
+metrics.counter('db_connections_closed_total', "SQLite connections closed")
+metrics.counter('db_commits_total', "Transactions committed")
+metrics.counter('db_rollbacks_total', "Transactions rolled back")
+metrics.counter('admission_rejections_total', "Requests rejected by admission control",
+                ('route', 'reason'))
+metrics.counter('compressed_responses_total', "Response bodies compressed, by coding",
+                ('coding',))
+metrics.counter('compression_saved_bytes_total', "Bytes saved by response compression")
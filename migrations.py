@@ -0,0 +1,305 @@
+"""Versioned schema migrations
+
+The schema version lives in ``PRAGMA user_version``. Migrations are applied
+in order at startup, each in its own write transaction that also bumps the
+version, so a half-applied migration is never recorded as done and several
+workers starting at once apply each migration exactly once. A shard that
+is already current only has its version read, so restarts skip the DDL.
+
+Run ``python migrations.py`` to migrate the configured database and check
+that every route query is served by an index (exits non-zero otherwise).
+"""
+import sys
+
+from analytics import (CYCLE_START_SQL, POPULATION_SQL, USER_ROLLUPS_SQL,
+                       backfill as backfill_rollups)
+from idempotency import PURGE_SQL as IDEMPOTENCY_PURGE_SQL, SELECT_SQL as IDEMPOTENCY_SELECT_SQL
+from pagination import HISTORY_COLUMNS, SYMPTOM_COLUMNS, _keyset_sql
+from predictions import HISTORY_SQL as PERIOD_HISTORY_SQL
+from redate import finish as redate_tables
+from reminders import CLAIM_SQL
+from responses import dedupe_responses
+from user_cache import USER_SQL
+from versions import SELECT_SQL as VERSION_SQL
+
+MIGRATIONS = []
+
+# Queries issued by the routes, with sample parameters for EXPLAIN QUERY PLAN.
+# Built from the SQL the modules run, so a changed query is checked as it is.
+ROUTE_QUERIES = {
+    'users_by_id': (USER_SQL, ('u',)),
+    'symptoms_page': (
+        _keyset_sql('symptoms', SYMPTOM_COLUMNS, 'date', None, 11), ('u', 11)),
+    'symptoms_page_after': (
+        _keyset_sql('symptoms', SYMPTOM_COLUMNS, 'date', 1, 11), ('u', 1, 'u', 11)),
+    'chat_history_page': (
+        _keyset_sql('chat_history', HISTORY_COLUMNS, 'timestamp', None, 51), ('u', 51)),
+    'chat_history_page_after': (
+        _keyset_sql('chat_history', HISTORY_COLUMNS, 'timestamp', 1, 51), ('u', 1, 'u', 51)),
+    'period_events_by_user': (PERIOD_HISTORY_SQL, ('u', 12)),
+    'due_reminders': (CLAIM_SQL, (738886, 1000)),
+    'symptom_rollups_by_user': (USER_ROLLUPS_SQL, ('u',)),
+    'symptom_rollups_population': (
+        POPULATION_SQL.format(where="WHERE symptom = ?"), ('cramps',)),
+    'symptom_cycle_start': (
+        CYCLE_START_SQL.format(user='?', date='?'), ('u', 738886)),
+    'user_versions_by_user': (VERSION_SQL, ('u',)),
+    'idempotency_key': (IDEMPOTENCY_SELECT_SQL, (b'k', 0)),
+    'idempotency_expired': (IDEMPOTENCY_PURGE_SQL, (0, 1000)),
+}
+
+
+def migration(version, description):
+    """Register a migration function taking an open connection"""
+    def decorator(fn):
+        if any(m[0] == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def migrate(db):
+    """Apply all pending migrations to every shard; returns the versions applied"""
+    applied = set()
+    latest = latest_version()
+    for shard in db.shards:
+        with shard.read() as conn:
+            if schema_version(conn) >= latest:
+                # Already current: one read, no write lock or DDL
+                continue
+        for version, description, fn in MIGRATIONS:
+            with shard.transaction() as conn:
+                # Re-check inside the write lock in case another worker got here first
+                if schema_version(conn) >= version:
+                    continue
+                fn(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+            applied.add(version)
+    return sorted(applied)
+
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a query"""
+    return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def check_query_plans(conn, queries=None):
+    """Return {name: plan} for route queries that scan a table or sort in a temp b-tree"""
+    failures = {}
+    for name, (sql, params) in (queries or ROUTE_QUERIES).items():
+        plan = explain(conn, sql, params)
+        if any(step.startswith('SCAN') or 'TEMP B-TREE' in step for step in plan):
+            failures[name] = plan
+    return failures
+
+
+@migration(1, "Base tables")
+def create_base_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            last_period_date TEXT,
+            cycle_length INTEGER DEFAULT 28,
+            period_duration INTEGER DEFAULT 5,
+            created_at TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            user_message TEXT,
+            bot_response TEXT,
+            timestamp TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS symptoms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            symptom TEXT,
+            severity TEXT,
+            date TEXT,
+            notes TEXT
+        )
+    ''')
+
+
+@migration(2, "Index chat_history on (user_id, timestamp)")
+def index_chat_history(conn):
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_chat_history_user_timestamp
+        ON chat_history (user_id, timestamp)
+    ''')
+
+
+@migration(3, "Index symptoms on (user_id, date)")
+def index_symptoms(conn):
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_symptoms_user_date
+        ON symptoms (user_id, date)
+    ''')
+
+
+@migration(4, "Period start history")
+def create_period_events(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS period_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            created_at TEXT,
+            UNIQUE (user_id, start_date)
+        )
+    ''')
+    # Seed history with the one start date we kept so far
+    conn.execute('''
+        INSERT OR IGNORE INTO period_events (user_id, start_date, created_at)
+        SELECT user_id, last_period_date, created_at
+        FROM users
+        WHERE last_period_date IS NOT NULL
+    ''')
+
+
+@migration(5, "Materialized next-event dates and reminders")
+def create_reminders(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    for column in ('next_period_date', 'ovulation_date'):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE users ADD COLUMN {column} TEXT")
+    # Initial fill from the stored cycle length; refreshed on the next log
+    conn.execute('''
+        UPDATE users
+        SET next_period_date = date(last_period_date,
+                                    '+' || COALESCE(cycle_length, 28) || ' days'),
+            ovulation_date = date(last_period_date,
+                                  '+' || (COALESCE(cycle_length, 28) - 14) || ' days')
+        WHERE last_period_date IS NOT NULL
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_next_period_date
+        ON users (next_period_date)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_ovulation_date
+        ON users (ovulation_date)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            days_before INTEGER DEFAULT 0,
+            interval_days INTEGER,
+            due_date TEXT,
+            enabled INTEGER DEFAULT 1,
+            created_at TEXT,
+            UNIQUE (user_id, kind)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminders_due_date
+        ON reminders (due_date) WHERE enabled = 1
+    ''')
+
+
+@migration(6, "Template ids for canned bot responses")
+def add_response_templates(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_history)")]
+    for column in ('template_id', 'template_params'):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE chat_history ADD COLUMN {column} TEXT")
+    dedupe_responses(conn)
+
+
+@migration(7, "Bulk import checkpoints")
+def create_import_checkpoints(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            updated_at TEXT
+        )
+    ''')
+
+
+@migration(8, "Symptom-by-cycle-day rollups")
+def create_symptom_rollups(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS symptom_rollups (
+            user_id TEXT NOT NULL,
+            symptom TEXT NOT NULL,
+            cycle_day INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            severe INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, symptom, cycle_day)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_symptom_rollups_symptom_day
+        ON symptom_rollups (symptom, cycle_day)
+    ''')
+    backfill_rollups(conn)
+
+
+@migration(9, "Per-user data versions for ETags")
+def create_user_versions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_versions (
+            user_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(10, "Dates as day ordinals, timestamps as epoch microseconds")
+def store_integer_dates(conn):
+    # Finishes (or does all of) the shadow-table copy described in redate.py
+    redate_tables(conn)
+
+
+@migration(11, "Stored results of requests with an Idempotency-Key")
+def create_idempotency_keys(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key_hash BLOB PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            fingerprint BLOB NOT NULL,
+            status INTEGER NOT NULL,
+            body BLOB NOT NULL,
+            expires_at INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires
+        ON idempotency_keys (expires_at)
+    ''')
+
+
+if __name__ == '__main__':
+    from storage import db
+
+    if len(sys.argv) > 1:
+        db.configure(sys.argv[1])
+    applied = migrate(db)
+    failures = {}
+    for shard in db.shards:
+        conn = shard.connection()
+        print(f"{shard.path}: schema version {schema_version(conn)} "
+              f"(applied {applied or 'none'})")
+        for name, plan in check_query_plans(conn).items():
+            failures[name] = plan
+            print(f"FAIL {shard.path} {name}: {' / '.join(plan)}")
+    if failures:
+        sys.exit(1)
+    print(f"All {len(ROUTE_QUERIES)} route queries use an index")
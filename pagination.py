@@ -0,0 +1,86 @@
+"""Keyset pagination and NDJSON streaming for per-user listings
+
+Pages are ordered newest first by (sort_column, id). The cursor is the id
+of the last row returned; the next page continues strictly after that
+row's (sort_column, id) pair, so each page is one index range read however
+deep into the history it is.
+"""
+import json
+
+from flask import Response
+
+# Listing columns of /history and /symptoms
+HISTORY_COLUMNS = ('user_message', 'bot_response', 'timestamp', 'template_id', 'template_params')
+SYMPTOM_COLUMNS = ('user_id', 'symptom', 'severity', 'date', 'notes')
+
+
+class PageError(ValueError):
+    """Invalid pagination arguments"""
+
+
+def parse_page_args(args, default_limit=50, max_limit=200, prefix=''):
+    """Read '<prefix>before' and '<prefix>limit' query args; returns (before, limit)"""
+    raw_before = args.get(prefix + 'before')
+    try:
+        before = int(raw_before) if raw_before else None
+        limit = int(args.get(prefix + 'limit', default_limit))
+    except ValueError:
+        raise PageError(f"{prefix}before and {prefix}limit must be integers")
+    if limit < 1:
+        raise PageError(f"{prefix}limit must be positive")
+    return before, min(limit, max_limit)
+
+
+def _keyset_sql(table, columns, sort_column, before, limit):
+    sql = f"SELECT id, {', '.join(columns)} FROM {table} WHERE user_id = ?"
+    if before is not None:
+        sql += (f" AND ({sort_column}, id) <"
+                f" (SELECT {sort_column}, id FROM {table} WHERE id = ? AND user_id = ?)")
+    sql += f" ORDER BY {sort_column} DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+    return sql
+
+
+def _keyset_params(user_id, before, limit):
+    params = [user_id]
+    if before is not None:
+        params += [before, user_id]
+    if limit is not None:
+        params.append(limit)
+    return params
+
+
+def fetch_page(conn, table, columns, sort_column, user_id, before=None, limit=50):
+    """Return (rows, next_cursor); rows are (id, *columns) tuples"""
+    rows = conn.execute(
+        _keyset_sql(table, columns, sort_column, before, limit + 1),
+        _keyset_params(user_id, before, limit + 1)
+    ).fetchall()
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def iter_rows(db, table, columns, sort_column, user_id, before=None, limit=None):
+    """Yield rows one at a time from a read snapshot, without buffering them"""
+    with db.for_user(user_id).read() as conn:
+        cursor = conn.execute(
+            _keyset_sql(table, columns, sort_column, before, limit),
+            _keyset_params(user_id, before, limit)
+        )
+        for row in cursor:
+            yield row
+
+
+def ndjson_response(records):
+    """Stream an iterable of dicts as newline-delimited JSON"""
+    def generate():
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+def wants_stream(request):
+    """True if the client asked for an NDJSON stream"""
+    return (request.args.get('stream', '').lower() in ('1', 'true', 'ndjson')
+            or request.accept_mimetypes.best == 'application/x-ndjson')
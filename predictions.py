@@ -0,0 +1,160 @@
+"""Cycle prediction from logged period start dates
+
+Cycle length is estimated from the gaps between a user's past period starts
+as a recency-weighted mean, with a prediction interval from the weighted
+standard deviation. Gaps outside a plausible range are treated as missed
+logs and ignored. Users without enough history fall back to their stored
+cycle_length (or 28 days).
+
+predict_all() computes predictions for every user in one vectorized NumPy
+pass. Dates are stored as day ordinals (see dates.py), so no date parsing
+happens at all.
+
+Usage: python predictions.py [--due-in DAYS] [--db PATH]
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+import argparse
+import math
+
+import numpy as np
+
+DEFAULT_CYCLE_LENGTH = 28
+MIN_GAP, MAX_GAP = 15, 60    # Plausible cycle lengths in days
+MIN_CYCLES = 2               # Observed cycles needed before trusting the estimate
+RECENCY_DECAY = 0.8          # Weight multiplier per cycle going back in time
+MAX_HISTORY = 12             # Past starts used for a single user's estimate
+Z_80 = 1.2816                # 80% prediction interval
+
+CycleEstimate = namedtuple('CycleEstimate', 'cycle_length std low high cycles')
+
+
+def _fallback(cycle_length):
+    length = cycle_length or DEFAULT_CYCLE_LENGTH
+    return CycleEstimate(length, 0.0, length, length, 0)
+
+
+def estimate_cycle(start_dates, fallback_length=None):
+    """Estimate cycle length from a list of period start day ordinals"""
+    days = sorted(set(start_dates))
+    # (cycles back from the latest start, gap) for every plausible gap
+    aged = [(len(days) - 2 - i, b - a) for i, (a, b) in enumerate(zip(days, days[1:]))
+            if MIN_GAP <= b - a <= MAX_GAP]
+    if len(aged) < MIN_CYCLES:
+        return _fallback(fallback_length)
+    weights = [RECENCY_DECAY ** age for age, _ in aged]
+    gaps = [gap for _, gap in aged]
+    total = sum(weights)
+    mean = sum(w * g for w, g in zip(weights, gaps)) / total
+    std = (sum(w * (g - mean) ** 2 for w, g in zip(weights, gaps)) / total) ** 0.5
+    return CycleEstimate(int(round(mean)), std,
+                         math.floor(mean - Z_80 * std), math.ceil(mean + Z_80 * std),
+                         len(gaps))
+
+
+HISTORY_SQL = '''
+    SELECT start_date FROM period_events
+    WHERE user_id = ?
+    ORDER BY start_date DESC
+    LIMIT ?
+'''
+
+
+def user_estimate(conn, user_id, fallback_length=None):
+    """Estimate a single user's cycle from their most recent logged starts"""
+    rows = conn.execute(HISTORY_SQL, (user_id, MAX_HISTORY)).fetchall()
+    return estimate_cycle([r[0] for r in rows], fallback_length)
+
+
+def predict_all(conn):
+    """Vectorized predictions for every user with a logged period
+
+    Returns a dict of NumPy arrays aligned by position: user_id, last_start,
+    cycle_length, std, cycles, next_period, next_low, next_high and
+    ovulation (dates as proleptic Gregorian ordinals, see date.fromordinal).
+    """
+    rows = conn.execute('''
+        SELECT e.user_id, e.start_date, COALESCE(u.cycle_length, ?)
+        FROM period_events e
+        LEFT JOIN users u ON u.user_id = e.user_id
+        ORDER BY e.user_id, e.start_date
+    ''', (DEFAULT_CYCLE_LENGTH,)).fetchall()
+    if not rows:
+        empty = np.array([], dtype=np.int64)
+        return {key: empty for key in ('user_id', 'last_start', 'cycle_length', 'std',
+                                       'cycles', 'next_period', 'next_low',
+                                       'next_high', 'ovulation')}
+
+    user_ids, days, stored = zip(*rows)
+    user_ids = np.array(user_ids, dtype=object)
+    days = np.array(days, dtype=np.int64)
+    stored = np.array(stored, dtype=np.float64)
+
+    # Rows are sorted by user, so each user is a contiguous run
+    first = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+    counts = np.diff(np.r_[first, len(days)])
+    n_users = len(first)
+    user_index = np.repeat(np.arange(n_users), counts)
+    last = first + counts - 1
+
+    # Gap i is between row i and row i + 1 of the same user
+    gaps = np.diff(days)
+    # Cycles back from the user's latest start, for recency weighting
+    age = last[user_index[1:]] - np.arange(1, len(days))
+    valid = ((user_index[1:] == user_index[:-1])
+             & (gaps >= MIN_GAP) & (gaps <= MAX_GAP)
+             & (age < MAX_HISTORY - 1))
+    gap_user = user_index[1:][valid]
+    gap_len = gaps[valid].astype(np.float64)
+    weight = RECENCY_DECAY ** age[valid]
+
+    cycles = np.bincount(gap_user, minlength=n_users)
+    w_sum = np.bincount(gap_user, weights=weight, minlength=n_users)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(gap_user, weights=weight * gap_len, minlength=n_users) / w_sum
+        var = np.bincount(gap_user, weights=weight * (gap_len - mean[gap_user]) ** 2,
+                          minlength=n_users) / w_sum
+    enough = cycles >= MIN_CYCLES
+    fallback = stored[first]
+    mean = np.where(enough, mean, fallback)
+    std = np.where(enough, np.sqrt(np.where(enough, var, 0.0)), 0.0)
+    cycles = np.where(enough, cycles, 0)
+
+    cycle_length = np.rint(mean).astype(np.int64)
+    last_start = days[last]
+    next_period = last_start + cycle_length
+    return {
+        'user_id': user_ids[first],
+        'last_start': last_start,
+        'cycle_length': cycle_length,
+        'std': std,
+        'cycles': cycles,
+        'next_period': next_period,
+        'next_low': last_start + np.floor(mean - Z_80 * std).astype(np.int64),
+        'next_high': last_start + np.ceil(mean + Z_80 * std).astype(np.int64),
+        'ovulation': next_period - 14,
+    }
+
+
+def due_between(conn, start, end):
+    """User ids whose predicted next period falls within [start, end] (dates)"""
+    predictions = predict_all(conn)
+    mask = ((predictions['next_period'] >= start.toordinal())
+            & (predictions['next_period'] <= end.toordinal()))
+    return list(predictions['user_id'][mask])
+
+
+if __name__ == '__main__':
+    from storage import db
+
+    parser = argparse.ArgumentParser(description="Users whose next period is due soon")
+    parser.add_argument('--due-in', type=int, default=2, help="Days from today")
+    parser.add_argument('--db', help="Database path (default: PERIOD_TRACKER_DB)")
+    args = parser.parse_args()
+    if args.db:
+        db.configure(args.db)
+    target = date.today() + timedelta(days=args.due_in)
+    for shard in db.shards:
+        with shard.read() as conn:
+            for user_id in due_between(conn, target, target):
+                print(user_id)
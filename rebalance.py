@@ -0,0 +1,104 @@
+"""Split (or re-split) the database into user shards
+
+Copies every user's rows from the source layout into a new set of shard
+files, placing each user by storage.shard_for. The source is brought up to the
+current schema but otherwise only read; stop writers first, then point
+the app at the new layout with PERIOD_TRACKER_SHARDS.
+
+    python rebalance.py period_tracker.db --shards 4
+    python rebalance.py period_tracker.db --from-shards 4 --shards 8
+
+Row ids are kept when the source is a single file, so /history and
+/symptoms cursors stay valid. When merging several shards ids are
+reassigned. Import checkpoints are not copied.
+"""
+import argparse
+import os
+import sys
+
+from migrations import migrate
+from storage import ShardedDatabase, shard_for
+
+# Tables holding per-user rows, and whether they have an id column to keep
+TABLES = (
+    ('users', False),
+    ('period_events', True),
+    ('symptoms', True),
+    ('symptom_rollups', False),
+    ('chat_history', True),
+    ('reminders', True),
+    ('user_versions', False),
+    ('idempotency_keys', False),
+)
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def rebalance(source, target):
+    """Copy all rows from source into target (both ShardedDatabase); returns row counts"""
+    migrate(source)
+    migrate(target)
+    keep_ids = len(source.shards) == 1
+    counts = {table: 0 for table, _ in TABLES}
+    for index, shard in enumerate(target.shards):
+        conn = shard.connection()
+        conn.create_function('shard_for', 2, shard_for, deterministic=True)
+        for source_shard in source.shards:
+            conn.execute("ATTACH DATABASE ? AS src", (source_shard.path,))
+            try:
+                with shard.transaction():
+                    for table, has_id in TABLES:
+                        columns = [c for c in _columns(conn, 'main', table)
+                                   if c in _columns(conn, 'src', table)
+                                   and (keep_ids or not (has_id and c == 'id'))]
+                        column_list = ', '.join(columns)
+                        cursor = conn.execute(
+                            f"INSERT INTO main.{table} ({column_list}) "
+                            f"SELECT {column_list} FROM src.{table} "
+                            f"WHERE shard_for(user_id, ?) = ?",
+                            (len(target.shards), index)
+                        )
+                        counts[table] += cursor.rowcount
+            finally:
+                conn.execute("DETACH DATABASE src")
+    return counts
+
+
+def row_counts(database):
+    counts = {}
+    for table, _ in TABLES:
+        counts[table] = sum(
+            shard.connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for shard in database.shards
+        )
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Copy a database into a new shard layout")
+    parser.add_argument('path', help="Base database path (PERIOD_TRACKER_DB)")
+    parser.add_argument('--from-shards', type=int, default=1, help="Current shard count")
+    parser.add_argument('--shards', type=int, required=True, help="New shard count")
+    parser.add_argument('--target', help="Base path for the new shards (default: path)")
+    args = parser.parse_args()
+
+    source = ShardedDatabase(args.path, args.from_shards)
+    # The shard files are created here, next to a base file that has data
+    target = ShardedDatabase(args.target or args.path, args.shards, check_layout=False)
+    source_paths = {os.path.abspath(s.path) for s in source.shards}
+    for shard in target.shards:
+        if os.path.abspath(shard.path) in source_paths:
+            sys.exit(f"{shard.path} is part of the source layout; pick another --target")
+        if os.path.exists(shard.path):
+            sys.exit(f"{shard.path} already exists")
+
+    copied = rebalance(source, target)
+    expected = row_counts(source)
+    for table, _ in TABLES:
+        print(f"{table}: {copied[table]} of {expected[table]} rows copied")
+    if copied != expected:
+        sys.exit("Row counts differ; do not switch over")
+    print(f"Done. Start the app with PERIOD_TRACKER_DB={target.path} "
+          f"PERIOD_TRACKER_SHARDS={args.shards}")
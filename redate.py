@@ -0,0 +1,243 @@
+"""Online rewrite of ISO date columns into integer days and timestamps
+
+Migration 10 moves every date column to the integer formats in dates.py.
+SQLite can't change a column's type in place, so each table is rebuilt as
+a shadow copy (``<table>_redate``) with the new column types and indexes.
+For a large database, run this script against the live database first,
+while the current version of the app keeps serving:
+
+    python redate.py period_tracker.db [--shards N] [--chunk 5000] [--pause 0.05]
+
+It installs triggers that mirror every insert, update and delete into the
+shadow tables, converting as they go, then copies the existing rows in
+short chunked transactions so writers only wait for one chunk at a time.
+Re-running it resumes where it stopped. When the new app version starts,
+migration 10 copies whatever is left and swaps the shadow tables in, all
+in one short transaction. Without a pre-copy, migration 10 does the whole
+copy itself at startup.
+
+The conversions are plain SQL, so the triggers also work in connections
+of the old app version. Values that don't round-trip exactly stay TEXT
+(see dates.py).
+"""
+import argparse
+import sys
+import time
+
+# Day ordinal (0001-01-01 is day 1) of a canonical 'YYYY-MM-DD'
+DAY_SQL = '''CASE WHEN typeof({c}) = 'text' AND date({c}) = {c} AND {c} >= '0001-01-01'
+    THEN CAST(julianday({c}) - 1721424.5 AS INTEGER) ELSE {c} END'''
+
+# Microseconds since the epoch of an isoformat() timestamp (no offset)
+STAMP_SQL = '''CASE WHEN typeof({c}) = 'text'
+        AND strftime('%Y-%m-%dT%H:%M:%S', substr({c}, 1, 19)) = substr({c}, 1, 19)
+        AND (length({c}) = 19 OR (length({c}) = 26 AND substr({c}, 20, 1) = '.'
+             AND substr({c}, 21) GLOB '[0-9][0-9][0-9][0-9][0-9][0-9]'
+             AND substr({c}, 21) <> '000000'))
+    THEN CAST(strftime('%s', substr({c}, 1, 19)) AS INTEGER) * 1000000
+         + CAST(substr({c}, 21) AS INTEGER)
+    ELSE {c} END'''
+
+# Target schema of each rebuilt table: columns with their conversion, then indexes
+TABLES = {
+    'users': {
+        'create': '''
+            user_id TEXT PRIMARY KEY,
+            last_period_date INTEGER,
+            cycle_length INTEGER DEFAULT 28,
+            period_duration INTEGER DEFAULT 5,
+            created_at INTEGER,
+            next_period_date INTEGER,
+            ovulation_date INTEGER
+        ''',
+        'convert': {'last_period_date': DAY_SQL, 'created_at': DAY_SQL,
+                    'next_period_date': DAY_SQL, 'ovulation_date': DAY_SQL},
+        'indexes': [
+            "CREATE INDEX idx_users_next_period_day ON {t} (next_period_date)",
+            "CREATE INDEX idx_users_ovulation_day ON {t} (ovulation_date)",
+        ],
+    },
+    'period_events': {
+        'create': '''
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            start_date INTEGER NOT NULL,
+            created_at INTEGER,
+            UNIQUE (user_id, start_date)
+        ''',
+        'convert': {'start_date': DAY_SQL, 'created_at': STAMP_SQL},
+        'indexes': [],
+    },
+    'symptoms': {
+        'create': '''
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            symptom TEXT,
+            severity TEXT,
+            date INTEGER,
+            notes TEXT
+        ''',
+        'convert': {'date': DAY_SQL},
+        'indexes': ["CREATE INDEX idx_symptoms_user_day ON {t} (user_id, date)"],
+    },
+    'chat_history': {
+        'create': '''
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            user_message TEXT,
+            bot_response TEXT,
+            timestamp INTEGER,
+            template_id TEXT,
+            template_params TEXT
+        ''',
+        'convert': {'timestamp': STAMP_SQL},
+        'indexes': ["CREATE INDEX idx_chat_history_user_time ON {t} (user_id, timestamp)"],
+    },
+    'reminders': {
+        'create': '''
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            days_before INTEGER DEFAULT 0,
+            interval_days INTEGER,
+            due_date INTEGER,
+            enabled INTEGER DEFAULT 1,
+            created_at INTEGER,
+            UNIQUE (user_id, kind)
+        ''',
+        'convert': {'due_date': DAY_SQL, 'created_at': STAMP_SQL},
+        'indexes': ["CREATE INDEX idx_reminders_due_day ON {t} (due_date) WHERE enabled = 1"],
+    },
+}
+
+
+def _shadow(table):
+    return f'{table}_redate'
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] != 'id']
+
+
+def _values(conn, table, prefix=''):
+    """Column list and converted value expressions, rowid first"""
+    columns = _columns(conn, table)
+    convert = TABLES[table]['convert']
+    values = [convert.get(c, '{c}').format(c=prefix + c) for c in columns]
+    return ', '.join(['rowid'] + columns), ', '.join([prefix + 'rowid'] + values)
+
+
+def prepared(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'redate_progress'"
+    ).fetchone() is not None
+
+
+def prepare(conn):
+    """Create the shadow tables and mirroring triggers (call inside a write transaction)"""
+    if prepared(conn):
+        return
+    conn.execute('''
+        CREATE TABLE redate_progress (
+            table_name TEXT PRIMARY KEY,
+            copied INTEGER NOT NULL,
+            until INTEGER NOT NULL
+        )
+    ''')
+    for table, spec in TABLES.items():
+        shadow = _shadow(table)
+        conn.execute(f"CREATE TABLE {shadow} ({spec['create']})")
+        for sql in spec['indexes']:
+            conn.execute(sql.format(t=shadow))
+        columns, values = _values(conn, table, 'NEW.')
+        conn.execute(f'''
+            CREATE TRIGGER redate_{table}_insert AFTER INSERT ON {table} BEGIN
+                INSERT OR REPLACE INTO {shadow} ({columns}) VALUES ({values});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER redate_{table}_update AFTER UPDATE ON {table} BEGIN
+                DELETE FROM {shadow} WHERE rowid = OLD.rowid;
+                INSERT OR REPLACE INTO {shadow} ({columns}) VALUES ({values});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER redate_{table}_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM {shadow} WHERE rowid = OLD.rowid;
+            END
+        ''')
+        # Rows after this one are mirrored by the insert trigger
+        until = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+        conn.execute("INSERT INTO redate_progress VALUES (?, 0, ?)", (table, until))
+
+
+def copy_chunk(conn, table, size=None):
+    """Copy the next chunk of pre-existing rows; returns (rows left to scan, rows copied)"""
+    copied, until = conn.execute(
+        "SELECT copied, until FROM redate_progress WHERE table_name = ?", (table,)
+    ).fetchone()
+    if copied >= until:
+        return 0, 0
+    columns, values = _values(conn, table)
+    limit = f"LIMIT {int(size)}" if size else ''
+    last = conn.execute(f'''
+        SELECT MAX(rowid) FROM (SELECT rowid FROM {table}
+                                WHERE rowid > ? AND rowid <= ? ORDER BY rowid {limit})
+    ''', (copied, until)).fetchone()[0]
+    last = until if last is None or not size else last
+    cursor = conn.execute(f'''
+        INSERT OR REPLACE INTO {_shadow(table)} ({columns})
+        SELECT {values} FROM {table} WHERE rowid > ? AND rowid <= ?
+    ''', (copied, last))
+    conn.execute("UPDATE redate_progress SET copied = ? WHERE table_name = ?", (last, table))
+    return until - last, cursor.rowcount
+
+
+def finish(conn):
+    """Copy what's left and swap the shadow tables in (call inside a write transaction)"""
+    prepare(conn)
+    for table in TABLES:
+        copy_chunk(conn, table)
+        shadow = _shadow(table)
+        for event in ('insert', 'update', 'delete'):
+            conn.execute(f"DROP TRIGGER redate_{table}_{event}")
+        # Keep AUTOINCREMENT from reusing ids of rows deleted before the copy
+        sequences = dict(conn.execute(
+            "SELECT name, seq FROM sqlite_sequence WHERE name IN (?, ?)", (table, shadow)))
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+        if table in sequences:
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                         (table, max(sequences.values())))
+    conn.execute("DROP TABLE redate_progress")
+
+
+if __name__ == '__main__':
+    from migrations import schema_version
+    from storage import ShardedDatabase
+
+    parser = argparse.ArgumentParser(description="Pre-copy date columns for migration 10")
+    parser.add_argument('path', help="Base database path (PERIOD_TRACKER_DB)")
+    parser.add_argument('--shards', type=int, default=1, help="Shard count")
+    parser.add_argument('--chunk', type=int, default=5000, help="Rows per transaction")
+    parser.add_argument('--pause', type=float, default=0.05,
+                        help="Seconds to sleep between chunks, to leave room for writers")
+    args = parser.parse_args()
+
+    for shard in ShardedDatabase(args.path, args.shards).shards:
+        with shard.read() as conn:
+            version = schema_version(conn)
+        if version != 9:
+            sys.exit(f"{shard.path}: schema version {version}; this pre-copy is for version 9")
+        with shard.transaction() as conn:
+            prepare(conn)
+        for table in TABLES:
+            total, left = 0, 1
+            while left:
+                with shard.transaction() as conn:
+                    left, copied = copy_chunk(conn, table, args.chunk)
+                total += copied
+                time.sleep(args.pause)
+            print(f"{shard.path}: {table}: {total} rows copied")
+    print("Done. Stop the old app and start the new one; migration 10 swaps the tables in.")
@@ -0,0 +1,201 @@
+"""Reminder scheduling backed by precomputed next-event dates
+
+Each user's predicted next_period_date and ovulation_date are materialized
+on the users row and refreshed whenever a period is logged or the cycle
+length changes. Every reminder stores its own due_date, derived from those
+dates (or advanced by its interval for recurring reminders), so the
+scheduler finds everything due with one range query over a partial index
+on reminders(due_date). Its cost depends on how many reminders are due,
+not on how many users there are.
+
+Run ``python reminders.py`` from cron (or set REMINDER_SCHEDULER=true to
+run the loop inside the app) to deliver due reminders.
+"""
+from collections import namedtuple
+from datetime import datetime
+import argparse
+import logging
+import threading
+
+import dates
+from predictions import user_estimate
+
+logger = logging.getLogger(__name__)
+
+# kind -> users column the reminder is anchored to (None: fixed interval)
+REMINDER_KINDS = {
+    'period_start': 'next_period_date',
+    'ovulation': 'ovulation_date',
+    'medication': None,
+    'symptoms': None,
+}
+
+# Handed to sinks with ISO dates; stored dates are day ordinals (see dates.py)
+Reminder = namedtuple('Reminder', 'id user_id kind due_date event_date')
+
+
+def refresh_schedule(conn, user_id):
+    """Recompute a user's materialized event dates and anchored reminders"""
+    row = conn.execute(
+        "SELECT last_period_date, cycle_length FROM users WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    if not row or not row[0]:
+        return None
+    cycle_length = user_estimate(conn, user_id, row[1]).cycle_length
+    next_period = row[0] + cycle_length
+    ovulation = next_period - 14
+    conn.execute('''
+        UPDATE users SET next_period_date = ?, ovulation_date = ?
+        WHERE user_id = ?
+    ''', (next_period, ovulation, user_id))
+    conn.execute('''
+        UPDATE reminders
+        SET due_date = CASE kind WHEN 'period_start' THEN ? ELSE ? END - days_before
+        WHERE user_id = ? AND kind IN ('period_start', 'ovulation')
+    ''', (next_period, ovulation, user_id))
+    return next_period, ovulation
+
+
+def add_reminder(conn, user_id, kind, days_before=0, interval_days=1, today=None):
+    """Create (or replace) a user's reminder of the given kind; returns its ISO due date"""
+    if kind not in REMINDER_KINDS:
+        raise ValueError(f"Unknown reminder kind '{kind}'")
+    anchor = REMINDER_KINDS[kind]
+    today = today or dates.today()
+    if anchor:
+        event = conn.execute(
+            f"SELECT {anchor} FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        due_date = event[0] - days_before if event and event[0] else None
+        interval_days = None
+    else:
+        due_date = today
+    conn.execute('''
+        INSERT OR REPLACE INTO reminders
+        (user_id, kind, days_before, interval_days, due_date, enabled, created_at)
+        VALUES (?, ?, ?, ?, ?, 1, ?)
+    ''', (user_id, kind, days_before, interval_days, due_date, dates.to_stamp(datetime.now())))
+    return dates.from_day(due_date)
+
+
+def list_reminders(conn, user_id):
+    rows = conn.execute('''
+        SELECT kind, days_before, interval_days, due_date, enabled
+        FROM reminders WHERE user_id = ? ORDER BY kind
+    ''', (user_id,)).fetchall()
+    return [
+        {"kind": r[0], "days_before": r[1], "interval_days": r[2],
+         "due_date": dates.from_day(r[3]), "enabled": bool(r[4])}
+        for r in rows
+    ]
+
+
+class LogSink:
+    """Delivery sink that only logs; replace with push/email delivery"""
+
+    def send(self, reminder):
+        logger.info("Reminder %s for %s due %s", reminder.kind, reminder.user_id,
+                    reminder.due_date)
+
+
+class MemorySink:
+    """Delivery sink that keeps reminders in a list (local runs and tests)"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reminder):
+        self.sent.append(reminder)
+
+
+CLAIM_SQL = '''
+    SELECT r.id, r.user_id, r.kind, r.due_date, r.interval_days,
+           u.next_period_date, u.ovulation_date, u.cycle_length
+    FROM reminders r
+    LEFT JOIN users u ON u.user_id = r.user_id
+    WHERE r.enabled = 1 AND r.due_date <= ?
+    ORDER BY r.due_date
+    LIMIT ?
+'''
+
+
+class ReminderScheduler:
+    """Pulls due reminders with an indexed range query and hands them to a sink"""
+
+    def __init__(self, db, sink=None, batch_size=1000, interval=60.0):
+        self.db = db
+        self.sink = sink or LogSink()
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def claim_due(self, today=None, shard=None):
+        """Claim up to batch_size due reminders on a shard and advance their due dates"""
+        today = today or dates.today()
+        with (shard or self.db.shards[0]).transaction() as conn:
+            rows = conn.execute(CLAIM_SQL, (today, self.batch_size)).fetchall()
+            claimed, updates = [], []
+            for rid, user_id, kind, due_date, interval, next_period, ovulation, cycle in rows:
+                event_date = next_period if kind == 'period_start' else (
+                    ovulation if kind == 'ovulation' else None)
+                claimed.append(Reminder(rid, user_id, kind, dates.from_day(due_date),
+                                        dates.from_day(event_date)))
+                # Recurring reminders move on by their interval, anchored ones
+                # by a cycle until the next logged period refreshes them
+                step = interval or cycle or 28
+                next_due = due_date + step
+                while next_due <= today:
+                    next_due += step
+                updates.append((next_due, rid))
+            conn.executemany("UPDATE reminders SET due_date = ? WHERE id = ?", updates)
+        return claimed
+
+    def run_once(self, today=None):
+        """Deliver everything due today; returns the number of reminders sent"""
+        sent = 0
+        for shard in self.db.shards:
+            while True:
+                batch = self.claim_due(today, shard)
+                for reminder in batch:
+                    try:
+                        self.sink.send(reminder)
+                        sent += 1
+                    except Exception:
+                        logger.exception("Failed to deliver reminder %s", reminder.id)
+                if len(batch) < self.batch_size:
+                    break
+        return sent
+
+    def start(self):
+        """Run the scheduler loop in a background thread"""
+        self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Reminder scheduler run failed")
+            self._stop.wait(self.interval)
+
+
+if __name__ == '__main__':
+    from storage import db
+
+    parser = argparse.ArgumentParser(description="Deliver due reminders")
+    parser.add_argument('--db', help="Database path (default: PERIOD_TRACKER_DB)")
+    parser.add_argument('--today', help="Override today's date (YYYY-MM-DD)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.db:
+        db.configure(args.db)
+    print(f"Sent {ReminderScheduler(db).run_once(dates.to_day(args.today))} reminders")
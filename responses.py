@@ -0,0 +1,147 @@
+"""Versioned response templates
+
+Canned bot replies live here instead of inline in process_message.
+chat_history stores a template id plus a small JSON parameters blob for
+these replies, not the rendered text. /history re-renders them on read.
+
+Template ids are '<name>@<version>'. Never edit a registered template's
+text: register a new version instead, so stored rows keep rendering the
+way they were sent.
+"""
+import json
+
+from encoding import preencode
+
+TEMPLATES = {}
+LATEST = {}
+
+
+def register_template(name, version, text):
+    """Add a template version; the highest version is used for new replies"""
+    template_id = f"{name}@{version}"
+    if template_id in TEMPLATES:
+        raise ValueError(f"Template {template_id} already registered")
+    TEMPLATES[template_id] = text
+    if '{' not in text:
+        # Parameterless: its JSON is spliced into /chat bodies as is
+        preencode(text)
+    if name not in LATEST or version > int(LATEST[name].split('@')[1]):
+        LATEST[name] = template_id
+    return template_id
+
+
+def render(template_id, params=None):
+    """Render a template id with optional parameters (dict or JSON string)"""
+    if isinstance(params, str):
+        params = json.loads(params)
+    text = TEMPLATES[template_id]
+    return text.format_map(params) if params else text
+
+
+def reply(name, **params):
+    """Return (text, template_id, params_json) for the latest version of a template"""
+    template_id = LATEST[name]
+    params_json = json.dumps(params, separators=(',', ':')) if params else None
+    return render(template_id, params), template_id, params_json
+
+
+def dedupe_responses(conn):
+    """Replace stored copies of parameterless template text with template ids
+
+    Returns the number of chat_history rows rewritten.
+    """
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS template_text (
+            text TEXT PRIMARY KEY,
+            template_id TEXT
+        )
+    ''')
+    conn.execute("DELETE FROM temp.template_text")
+    conn.executemany(
+        "INSERT OR IGNORE INTO temp.template_text (text, template_id) VALUES (?, ?)",
+        [(text, template_id) for template_id, text in TEMPLATES.items() if '{' not in text]
+    )
+    # One pass over chat_history; SET expressions see the row's old values
+    cursor = conn.execute('''
+        UPDATE chat_history
+        SET template_id = (SELECT t.template_id FROM temp.template_text t
+                           WHERE t.text = chat_history.bot_response),
+            template_params = NULL,
+            bot_response = NULL
+        WHERE template_id IS NULL
+          AND bot_response IN (SELECT text FROM temp.template_text)
+    ''')
+    conn.execute("DROP TABLE temp.template_text")
+    return cursor.rowcount
+
+
+register_template('greeting', 1, "👋 Hello! I'm your Period Tracking Assistant. I can help you:\n• Log period start/end dates\n• Predict your next period\n• Track symptoms\n• Calculate ovulation\n• Answer questions about menstrual health\n\nHow can I help you today?")
+
+register_template('unknown', 1, "I'm here to help with period tracking and menstrual health! I can:\n\n• Log your period start/end dates\n• Predict your next period\n• Track symptoms and suggest relief\n• Calculate ovulation dates\n• Answer questions about PMS, pain relief, etc.\n\nTry saying:\n'My period started today'\n'When is my next period?'\n'I have cramps'\n'What helps with period pain?'")
+
+register_template('pms', 1, """**Premenstrual Syndrome (PMS)** refers to physical and emotional symptoms that occur 1-2 weeks before your period.
+
+**Common symptoms include:**
+• Mood swings, irritability, or depression
+• Bloating and weight gain
+• Breast tenderness
+• Fatigue
+• Food cravings
+• Headaches
+• Acne
+
+**Management tips:**
+1. **Exercise regularly** - even light activity helps
+2. **Balanced diet** - reduce salt, sugar, and caffeine
+3. **Stress management** - yoga, meditation, deep breathing
+4. **Adequate sleep** - 7-9 hours per night
+5. **Over-the-counter** pain relievers if needed
+
+Symptoms usually improve within a few days of starting your period.""")
+
+register_template('pain_relief', 1, """**Period Pain Relief Methods:**
+
+**Immediate Relief:**
+1. **Heat therapy** - Hot water bottle or heating pad on abdomen
+2. **OTC medication** - Ibuprofen, Naproxen (take at first sign)
+3. **Gentle massage** - Circular motions on lower abdomen
+
+**Lifestyle Changes:**
+• **Regular exercise** - Increases endorphins
+• **Warm baths** - Relaxes muscles
+• **Dietary changes**:
+  - Omega-3 fatty acids (fish, flaxseed)
+  - Reduce caffeine and alcohol
+  - Magnesium-rich foods (nuts, leafy greens)
+• **Hydration** - Drink plenty of water
+
+**Alternative Therapies:**
+• Acupuncture/acupressure
+• Herbal teas (ginger, chamomile)
+• Yoga stretches (child's pose, cat-cow)
+
+**When to see a doctor:**
+• Pain prevents normal activities
+• Symptoms worsen over time
+• Heavy bleeding with clots
+• Pain with fever""")
+
+register_template('set_reminder', 1, "I can remind you about:\n\n1. **Period start** - 2 days before expected date\n2. **Ovulation** - When you're most fertile\n3. **Pill/Medication** - Daily reminders\n4. **Symptom check-ins** - How you're feeling\n\nWhat would you like me to remind you about?")
+
+register_template('symptoms_prompt', 1, "I can help you log symptoms like cramps, headache, bloating, mood swings, etc. What symptoms are you experiencing?")
+
+register_template('reminder_added', 1, "⏰ Done! I'll remind you about {reminder}, next on {due_date}.")
+
+register_template('follow_up_declined', 1, "No problem! Let me know if there's anything else I can help with.")
+
+register_template('no_period_history', 1, "I don't have your period history yet. Please tell me when your period started (e.g., 'My period started today').")
+
+register_template('next_period_unknown', 1, "I couldn't calculate your next period. Please log your period start date first.")
+
+register_template('ovulation_no_date', 1, "I need your last period date to calculate ovulation. Say 'My period started [date]'.")
+
+register_template('ovulation_no_history', 1, "I need your period history to calculate ovulation. Please log your last period first.")
+
+register_template('cycle_info', 1, "Your current cycle length is set to **{cycle_length} days**.\n\n**Normal cycle ranges:** 21-35 days\n**Average cycle:** 28 days\n\nTo update your cycle length, say: 'My cycle is X days'")
+
+register_template('cycle_info_default', 1, "I don't have your cycle information yet. The default is 28 days.\n\nYou can update it by saying: 'My cycle is 30 days' or similar.")
@@ -0,0 +1,96 @@
+"""In-process conversation state for follow-up replies
+
+process_message offers follow-ups ("Would you like to log any symptoms?",
+action buttons like "Cramps"), but intent detection looks at one message
+at a time. SessionStore keeps the little state needed to read a short
+reply in context: the last intent, the pending question and the offered
+actions. Lookups never touch the database.
+
+Each session is one small tuple of shared values (intent and question
+names are constants, action lists are module-level tuples), so a session
+costs a few hundred bytes including its dict slot. The store is bounded
+by SESSION_STORE_SIZE with least recently written sessions evicted first,
+and a session expires SESSION_TTL seconds after the last turn.
+
+The store is per process: with several gunicorn workers a follow-up that
+lands on another worker is just classified on its own, as before.
+"""
+from collections import OrderedDict, namedtuple
+import threading
+import time
+
+Session = namedtuple('Session', 'intent pending actions expires')
+
+
+class SessionStore:
+    """Thread-safe LRU + TTL store of the last turn per user_id"""
+
+    def __init__(self, max_size=100000, ttl=600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'writes': 0}
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def get(self, user_id):
+        """Return the user's live Session, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            session = self._entries.get(user_id)
+            if session is not None:
+                if session.expires > time.monotonic():
+                    self._stats['hits'] += 1
+                    return session
+                del self._entries[user_id]
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, user_id, intent, pending=None, actions=()):
+        """Record a turn; pass shared constants so sessions stay small"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._stats['writes'] += 1
+            self._entries[user_id] = Session(intent, pending, actions, now + self.ttl)
+            # Entries stay in write order, which is also expiry order
+            self._entries.move_to_end(user_id)
+            self._expire(now)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        stats['max_size'] = self.max_size
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _expire(self, now, limit=100):
+        """Drop up to limit expired sessions from the old end"""
+        for _ in range(limit):
+            if not self._entries:
+                return
+            user_id, session = next(iter(self._entries.items()))
+            if session.expires > now:
+                return
+            del self._entries[user_id]
+            self._stats['expired'] += 1
@@ -0,0 +1,52 @@
+"""Process startup under gunicorn, with or without --preload
+
+Importing API_Chatbot builds everything that never changes after startup:
+compiled intent and symptom matchers, response templates and their
+pre-encoded bodies, the checked schema. With preload_app (see
+gunicorn.conf.py) that happens once in the master, and forked workers
+share those pages copy-on-write instead of each rebuilding them.
+
+What can't cross a fork is registered with per_process: background
+threads don't survive it, so when preloading they are started in each
+worker by the post_fork hook instead of at import. Database connections
+open lazily and pools reset themselves in a forked child (storage.py);
+before_fork also closes the master's, so there is nothing to inherit.
+"""
+import gc
+
+from storage import db
+
+_deferred = False
+_callbacks = []
+
+
+def defer_to_workers():
+    """Hold per_process callbacks until after_fork (the app is being preloaded)"""
+    global _deferred
+    _deferred = True
+
+
+def per_process(fn):
+    """Run fn now, or in each worker after fork when the app is preloaded"""
+    _callbacks.append(fn)
+    if not _deferred:
+        fn()
+    return fn
+
+
+def before_fork():
+    """gunicorn pre_fork: hand workers no open connections and a frozen heap"""
+    db.close_all()
+    # Objects from startup move to a permanent generation, so collections in
+    # the workers don't write to (and copy) the pages they share
+    gc.freeze()
+
+
+def after_fork():
+    """gunicorn post_fork: run the deferred per-process startup in the new worker"""
+    global _deferred
+    if not _deferred:
+        return
+    _deferred = False
+    for fn in _callbacks:
+        fn()
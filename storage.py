@@ -0,0 +1,329 @@
+"""SQLite storage layer shared by all routes
+
+Each thread keeps one long-lived connection to the database, opened with
+WAL journaling and tuned pragmas, so request handlers never pay for
+connection setup and readers never block on the writer. The connection is
+closed when its thread ends, so servers that start a thread per request
+(app.run) don't accumulate file descriptors and memory maps.
+
+With PERIOD_TRACKER_SHARDS=N users are partitioned across N database
+files by a stable hash of user_id. Each shard has its own write lock, so
+several gunicorn workers can write at once. Per-user work goes through
+``db.for_user(user_id)``; anything spanning users iterates ``db.shards``.
+Raising the count over an unsplit database is refused until rebalance.py
+has copied it into the shard files.
+
+Pools are fork-aware: a forked child (e.g. a gunicorn worker of a
+preloaded app) never uses a connection opened by its parent. It opens
+its own on first use, and the inherited ones are parked unclosed, since
+closing a SQLite handle in the child can disturb the parent's locks.
+"""
+from contextlib import contextmanager
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+
+from metrics import metrics
+
+DEFAULT_DB_PATH = 'period_tracker.db'
+
+# Applied to every new connection, in order
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('cache_size', -16000),      # 16 MB page cache per connection
+    ('mmap_size', 268435456),    # 256 MB memory-mapped I/O
+    ('temp_store', 'MEMORY'),
+)
+
+
+_statement_labels = {}
+
+# Every Database, to reset after fork, and connections inherited from a parent process
+_databases = weakref.WeakSet()
+_inherited = []
+
+
+def _after_fork():
+    for database in list(_databases):
+        database._forget_connections()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _statement_label(sql):
+    """Normalized statement text used as the metrics label"""
+    label = _statement_labels.get(sql)
+    if label is None:
+        label = ' '.join(sql.split())
+        label = re.sub(r'\?(?:\s*,\s*\?)+', '?...', label)[:120]
+        if len(_statement_labels) < 1000:
+            _statement_labels[sql] = label
+    return label
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records execution time per statement"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe('db_statement_duration_seconds', (_statement_label(sql),),
+                            time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe('db_statement_duration_seconds', (_statement_label(sql),),
+                            time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose statements go through TimedCursor"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class _Slot:
+    """A thread's connection; collected with the thread's locals when it ends"""
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class Database:
+    """Thread-local pool of tuned SQLite connections"""
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('PERIOD_TRACKER_DB', DEFAULT_DB_PATH)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        _databases.add(self)
+
+    def configure(self, path):
+        """Point the pool at a different database file"""
+        self.close_all()
+        self.path = path
+
+    def _connect(self):
+        """Open a new connection with the tuned pragmas applied"""
+        # Autocommit mode: transactions are started explicitly below
+        factory = TimedConnection if metrics.enabled else sqlite3.Connection
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                               factory=factory)
+        metrics.inc('db_connections_opened_total')
+        for name, value in PRAGMAS:
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            slot = self._local.slot = _Slot(self._connect())
+            weakref.finalize(slot, self._release, slot.conn)
+        return slot.conn
+
+    def _release(self, conn):
+        """Close the connection of a thread that has ended"""
+        with self._lock:
+            if conn not in self._connections:
+                # Already closed by close_all, or inherited across a fork
+                return
+            self._connections.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        metrics.inc('db_connections_closed_total')
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction: BEGIN IMMEDIATE, commit on success, roll back on error
+
+        Nested use joins the outer transaction instead of starting a new one.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.on_commit = []
+        try:
+            yield conn
+        except BaseException:
+            self._local.on_commit = None
+            conn.rollback()
+            metrics.inc('db_rollbacks_total')
+            raise
+        else:
+            conn.commit()
+            metrics.inc('db_commits_total')
+            callbacks, self._local.on_commit = self._local.on_commit, None
+            for callback in callbacks:
+                callback()
+
+    def after_commit(self, callback):
+        """Run callback once the current transaction commits (dropped on rollback)
+
+        Outside a transaction the callback runs immediately.
+        """
+        pending = getattr(self._local, 'on_commit', None)
+        if pending is None:
+            callback()
+        else:
+            pending.append(callback)
+
+    @contextmanager
+    def savepoint(self, name='sp'):
+        """Nested unit of work inside a transaction, rolled back on its own on error"""
+        conn = self.connection()
+        pending = getattr(self._local, 'on_commit', None)
+        mark = len(pending) if pending is not None else 0
+        conn.execute(f"SAVEPOINT {name}")
+        try:
+            yield conn
+        except BaseException:
+            if pending is not None:
+                del pending[mark:]
+            conn.execute(f"ROLLBACK TO {name}")
+            conn.execute(f"RELEASE {name}")
+            raise
+        else:
+            conn.execute(f"RELEASE {name}")
+
+    @contextmanager
+    def read(self):
+        """Read-only snapshot; in WAL mode this never waits on the writer"""
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+    def close_all(self):
+        """Close every pooled connection (e.g. at worker shutdown)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            metrics.inc('db_connections_closed_total')
+        self._local = threading.local()
+
+    def _forget_connections(self):
+        """In a forked child: drop the parent's connections without closing them"""
+        _inherited.extend(self._connections)
+        self._connections = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def shards(self):
+        """A single file is its own only shard"""
+        return [self]
+
+    def for_user(self, user_id):
+        return self
+
+
+class ShardLayoutError(Exception):
+    """The configured shard count doesn't match the data on disk"""
+
+
+def _has_rows(path):
+    """Whether an existing SQLite file holds any rows"""
+    if not os.path.exists(path):
+        return False
+    conn = sqlite3.connect(path)
+    try:
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        return any(conn.execute(f'SELECT 1 FROM "{table}" LIMIT 1').fetchone()
+                   for table in tables)
+    finally:
+        conn.close()
+
+
+def shard_for(user_id, count):
+    """Shard index of a user; crc32 so every process agrees on it"""
+    return zlib.crc32(str(user_id).encode('utf-8')) % count
+
+
+def shard_paths(path, count):
+    """File names of a count-way split of path (path itself when count is 1)"""
+    if count <= 1:
+        return [path]
+    root, ext = os.path.splitext(path)
+    return [f"{root}.{i}-of-{count}{ext or '.db'}" for i in range(count)]
+
+
+class ShardedDatabase:
+    """Users partitioned across several Database files by hash of user_id"""
+
+    def __init__(self, path=None, count=None, check_layout=True):
+        self.path = path or os.environ.get('PERIOD_TRACKER_DB', DEFAULT_DB_PATH)
+        self.count = count or int(os.environ.get('PERIOD_TRACKER_SHARDS', 1))
+        if check_layout:
+            self.check_layout()
+        self.shards = [Database(p) for p in shard_paths(self.path, self.count)]
+
+    def configure(self, path, count=None):
+        """Point the router at a different base path and/or shard count"""
+        self.close_all()
+        self.path = path
+        self.count = count or self.count
+        self.check_layout()
+        self.shards = [Database(p) for p in shard_paths(self.path, self.count)]
+
+    def check_layout(self):
+        """Refuse a split layout whose files don't exist while the unsplit file has data"""
+        if self.count == 1:
+            return
+        if any(os.path.exists(p) for p in shard_paths(self.path, self.count)):
+            return
+        if _has_rows(self.path):
+            raise ShardLayoutError(
+                f"{self.path} has data but no {self.count}-way shard files exist; run "
+                f"'python rebalance.py {self.path} --shards {self.count}' first")
+
+    def for_user(self, user_id):
+        """The Database holding a user's rows"""
+        if self.count == 1:
+            return self.shards[0]
+        return self.shards[shard_for(user_id, self.count)]
+
+    def close_all(self):
+        for shard in self.shards:
+            shard.close_all()
+
+
+db = ShardedDatabase()
@@ -0,0 +1,101 @@
+"""In-process cache of users rows
+
+A bounded LRU with a TTL, keyed by user_id. Writers update it write-through
+(after their transaction commits); readers fill it on a miss. Missing users
+are cached as None so repeat lookups for new users skip the database too.
+
+The cache is per process: with several gunicorn workers, writes in one
+worker are not seen by the others until the TTL expires, so set
+USER_CACHE_SIZE=0 to turn it off for multi-process deployments.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+# The row cached per user
+USER_SQL = "SELECT * FROM users WHERE user_id = ?"
+
+
+class UserCache:
+    """Thread-safe LRU + TTL cache of user profile rows"""
+
+    def __init__(self, max_size=10000, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0,
+                       'writes': 0, 'invalidations': 0}
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def get(self, user_id):
+        """Return (hit, row); row may be None for a cached missing user"""
+        if not self.enabled:
+            return False, None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                row, expires = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(user_id)
+                    self._stats['hits'] += 1
+                    return True, row
+                del self._entries[user_id]
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+            return False, None
+
+    def fill_token(self):
+        """Token to take before reading a row from the database for fill()"""
+        return self._writes
+
+    def fill(self, user_id, row, token):
+        """Cache a row read from the database, unless a write happened since token
+
+        This keeps a slow reader from overwriting a fresher write-through value.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if token == self._writes:
+                self._store(user_id, row)
+
+    def set(self, user_id, row):
+        """Write-through: store the committed row for user_id"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._writes += 1
+            self._stats['writes'] += 1
+            self._store(user_id, row)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._writes += 1
+            if self._entries.pop(user_id, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._writes += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        stats['max_size'] = self.max_size
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _store(self, user_id, row):
+        self._entries[user_id] = (row, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
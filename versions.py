@@ -0,0 +1,87 @@
+"""Per-user data versions for conditional GETs
+
+user_versions holds one counter per user. It is bumped in the same
+transaction as every write to that user's periods, symptoms, cycle
+settings or chat history. GET routes derive their ETag from it, so a
+matching If-None-Match is answered from that one primary-key lookup
+without reading the main tables. Because the counter lives in the user's
+shard it is shared by every worker process.
+
+BodyCache keeps serialized response bodies per (user, URL) together with
+the version they were built from, so a repeat poll of unchanged data skips
+the queries and the JSON encoding as well. An entry is only served while
+its version is still the current one, so it never needs invalidating.
+"""
+from collections import OrderedDict
+import threading
+
+BUMP_SQL = '''
+    INSERT INTO user_versions (user_id, version) VALUES (?, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+'''
+SELECT_SQL = "SELECT version FROM user_versions WHERE user_id = ?"
+
+
+def bump_versions(conn, user_ids):
+    """Mark the data of user_ids as changed (call inside the writing transaction)"""
+    conn.executemany(BUMP_SQL, [(user_id,) for user_id in user_ids])
+
+
+def data_version(conn, user_id):
+    """Current data version of a user; 0 if it was never bumped"""
+    row = conn.execute(SELECT_SQL, (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+class BodyCache:
+    """Thread-safe LRU of serialized bodies keyed by (user_id, url), tagged with a version"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0}
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def get(self, key, version):
+        """Return the cached body for key if it was built at version, else None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['stale' if entry is not None else 'misses'] += 1
+            return None
+
+    def put(self, key, version, body):
+        if not self.enabled:
+            return
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None and previous[0] > version:
+                # A slower request built an older version; keep the newer body
+                return
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        stats['max_size'] = self.max_size
+        lookups = stats['hits'] + stats['misses'] + stats['stale']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats